@@ -1,116 +1,237 @@
 import streamlit as st
-import pandas as pd
 import numpy as np
-import plotly.express as px
 import os
+import hashlib
+import functools
 from ui_style import apply_custom_style
+import pricing_engine
+import charts
+import tables
+import scenarios
+import optimizer
+import export
+import excel_reader
+import history_store
+import result_cache
+import profiling
 
-# Configuração da Página
-st.set_page_config(
-    page_title="PharmaMarketPrice",
-    page_icon="💊",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+def parse_uploads(val_digest, uni_digest, val_bytes, uni_bytes):
+    """Etapa 1 (cara): lê e limpa os dois Excel e devolve o dataset por 'Cód'.
 
-# Aplicar Estilo Visual
-apply_custom_style()
+    O resultado fica na result_cache, indexada pela hash SHA-256 do conteúdo
+    e pela versão do motor: mexer no slider de N nunca volta a ler os
+    ficheiros, e o mesmo par carregado noutra sessão (ou depois de reiniciar
+    o servidor, via Parquet em disco) também não. O dataset é só de leitura,
+    por isso é partilhado sem cópias.
 
-@st.cache_data
-def load_and_process_data(file_val, file_uni, n_pharmacies):
+    Todos os pares 'Farmácia <mês>' / 'Região <mês>' são lidos: o dataset
+    guarda arrays (produtos x períodos) para valores e quantidades.
+    """
+    key = result_cache.content_key(val_digest, uni_digest)
+    cached = result_cache.get(key)
+    if cached is not None:
+        dataset, cols_info = cached
+        return dataset, None, cols_info
+
+    # --- LÓGICA DE COLUNAS (pares Farmácia/Região por período) ---
+    # Apenas estas colunas são lidas; as restantes nunca são materializadas
     try:
-        df_val = pd.read_excel(file_val)
-        df_uni = pd.read_excel(file_uni)
+        with st.spinner("A ler ficheiros Excel..."):
+            # Os dois ficheiros são independentes: parse em paralelo (um processo cada)
+            with profiling.stage('read_excel'):
+                read_val, read_uni = excel_reader.read_many([
+                    (val_bytes, pricing_engine.period_columns, [0, 1]),
+                    (uni_bytes, functools.partial(pricing_engine.period_columns, with_product=False), [0]),
+                ])
+    except IndexError:
+        return None, "Estrutura do ficheiro inválida. Verifique os índices das colunas.", None
     except Exception as e:
         return None, f"Erro ao ler ficheiros: {e}", None
 
-    # --- LÓGICA DE COLUNAS (Índices Fixos: 3 e 8) ---
     try:
-        col_cod = df_val.columns[0]
-        col_prod = df_val.columns[1]
-        col_farm_val = df_val.columns[3]
-        col_reg_val = df_val.columns[8]
-        
-        col_farm_uni = df_uni.columns[3]
-        col_reg_uni = df_uni.columns[8]
-    except IndexError:
-        return None, "Estrutura do ficheiro inválida. Verifique os índices das colunas.", None
+        dataset = pricing_engine.build_dataset(read_val, read_uni, key=key)
+    except ValueError as e:
+        return None, str(e), None
 
-    cols_info = {"Farmácia": col_farm_val, "Região": col_reg_val}
+    cols_info = {
+        "Períodos": dataset['periods'],
+        "Junção": dataset['join'],
+        "Leitura": {k: {s: r[s] for s in ('engine', 'bytes', 'rows', 'seconds')}
+                    for k, r in (("Valor", read_val), ("Unidades", read_uni))},
+    }
+    result_cache.put(key, dataset, cols_info)
+    return dataset, None, cols_info
 
-    # Limpeza e Merge
-    df_val_clean = df_val[[col_cod, col_prod, col_farm_val, col_reg_val]].copy()
-    df_val_clean.columns = ['Cód', 'Produto', 'Farm_Val', 'Reg_Val']
-    
-    df_uni_clean = df_uni[[col_cod, col_farm_uni, col_reg_uni]].copy()
-    df_uni_clean.columns = ['Cód', 'Farm_Qtd', 'Reg_Qtd']
 
-    df_merged = pd.merge(df_val_clean, df_uni_clean, on='Cód')
-    
-    # Remover Totais e Converter Numéricos
-    df_merged = df_merged[~df_merged['Cód'].astype(str).str.contains('Totais', case=False, na=False)]
-    
-    cols_num = ['Farm_Val', 'Reg_Val', 'Farm_Qtd', 'Reg_Qtd']
-    for col in cols_num:
-        df_merged[col] = pd.to_numeric(df_merged[col], errors='coerce').fillna(0)
+@st.cache_resource(max_entries=8, show_spinner=False)
+def build_cube(dataset_key, period, _df_base):
+    """Etapa 2: cubo (produtos x N) de um período para todo o intervalo do slider.
 
-    # --- CÁLCULOS DE ENGENHARIA REVERSA ---
-    
-    # 1. Totais da Região (Extrapolação)
-    total_val_region = df_merged['Reg_Val'] * n_pharmacies
-    total_qty_region = df_merged['Reg_Qtd'] * n_pharmacies
-    
-    # 2. Isolar "Outras Farmácias"
-    others_val = total_val_region - df_merged['Farm_Val']
-    others_qty = total_qty_region - df_merged['Farm_Qtd']
-    
-    # Média de unidades vendidas POR FARMÁCIA CONCORRENTE
-    n_others = max(1, n_pharmacies - 1)
-    df_merged['Avg_Unit_Others'] = (others_qty / n_others).round(0).clip(lower=0)
-
-    # 3. Quota de Mercado (Market Share)
-    df_merged['Market_Share_Qty'] = np.where(
-        total_qty_region > 0.001,
-        (df_merged['Farm_Qtd'] / total_qty_region) * 100,
-        0
-    )
+    Calculado uma vez por dataset e período; cache_resource evita copiar os
+    arrays a cada rerun (o cubo é só de leitura).
+    """
+    with profiling.stage('reverse_cube'):
+        return pricing_engine.build_n_cube(_df_base)
 
-    # 4. PVPs
-    df_merged['My_PVP'] = np.where(df_merged['Farm_Qtd'] > 0, df_merged['Farm_Val'] / df_merged['Farm_Qtd'], 0)
-    
-    others_qty_safe = others_qty.apply(lambda x: x if x > 0.1 else 0)
-    df_merged['Others_PVP'] = np.where(others_qty_safe > 0, others_val / others_qty_safe, 0)
-    
-    # 5. Diferencial
-    df_merged['Diff_Percent'] = np.where(
-        (df_merged['Others_PVP'] > 0) & (df_merged['My_PVP'] > 0),
-        ((df_merged['My_PVP'] - df_merged['Others_PVP']) / df_merged['Others_PVP']) * 100,
-        0
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def build_panel(dataset_key, n_pharmacies, _dataset):
+    """Métricas (produtos x períodos) para um N, partilhadas pelas tendências."""
+    with profiling.stage('reverse_panel'):
+        return pricing_engine.build_period_panel(_dataset, n_pharmacies)
+
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def build_optimizer(dataset_key, period, n_pharmacies, _dataset, _panel):
+    """Preço ótimo com elasticidade (todos os produtos) para (período, N)."""
+    with profiling.stage('optimizer'):
+        return optimizer.optimize(_panel, _dataset['Farm_Qtd'], _dataset['periods'].index(period))
+
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def memo_figures(kind, dataset_key, period, n_pharmacies, selection, _build):
+    """Figura(s) de uma tab, construídas uma vez por (tipo, dataset, período, N, filtro).
+
+    `kind` distingue a figura (o modo de desenho decorre do filtro); `_build`
+    fica fora da chave e só é chamada na primeira vez. As figuras não são alteradas
+    depois de construídas, por isso são partilhadas entre reruns e sessões.
+    """
+    with profiling.stage(f'chart_{kind}_build'):
+        return _build()
+
+
+def tab_open(tab):
+    """Se a tab está visível: com st.tabs(on_change='rerun') só a tab aberta é construída.
+
+    Versões do Streamlit sem estado das tabs constroem todas, como antes.
+    """
+    return getattr(tab, 'open', None) is not False
+
+
+@st.cache_resource(max_entries=8, show_spinner="A preparar exportação...")
+def build_export(dataset_key, period, n_pharmacies, selection, fmt, _df):
+    """Ficheiro exportado, gerado uma vez por (dataset, período, N, seleção, formato) e partilhado entre sessões."""
+    with profiling.stage(f'export_{fmt}'):
+        return export.to_bytes(tables.export_frame(_df), fmt)
+
+
+@st.cache_resource
+def history_connection():
+    """Ligação partilhada ao histórico local (SQLite)."""
+    return history_store.connect(history_store.DEFAULT_DB)
+
+
+def load_history_dataset(pharmacy):
+    """Dataset de uma farmácia lido do histórico, sem tocar em ficheiros Excel."""
+    conn = history_connection()
+    version = conn.execute('SELECT MAX(ingested_at) FROM periods WHERE pharmacy = ?', (pharmacy,)).fetchone()[0]
+    return _history_dataset(pharmacy, version)
+
+
+@st.cache_resource(max_entries=8, show_spinner="A carregar histórico...")
+def _history_dataset(pharmacy, version):
+    # 'version' (última ingestão) invalida a cache quando o histórico muda
+    return history_store.load_dataset(history_connection(), pharmacy)
+
+
+def load_dataset(file_val, file_uni):
+    """Etapa 1 com a chave de cache calculada a partir do conteúdo dos uploads."""
+    val_bytes = file_val.getvalue()
+    uni_bytes = file_uni.getvalue()
+    return parse_uploads(
+        hashlib.sha256(val_bytes).hexdigest(),
+        hashlib.sha256(uni_bytes).hexdigest(),
+        val_bytes, uni_bytes
     )
 
-    # 6. Matriz de Poder (Position)
-    conditions = [
-        (df_merged['Market_Share_Qty'] >= 40), 
-        (df_merged['Market_Share_Qty'] >= 15) & (df_merged['Market_Share_Qty'] < 40),
-        (df_merged['Market_Share_Qty'] < 15)
-    ]
-    choices = ['Dominante 👑', 'Competitivo ⚔️', 'Seguidor 🏃']
-    df_merged['Position'] = np.select(conditions, choices, default='Seguidor 🏃')
-
-    # Preço Sugerido (Estratégia: Alinhar com o Mercado)
-    df_merged['Suggested_Price'] = df_merged['Others_PVP']
-
-    # 7. Oportunidade Financeira (Dinheiro na Mesa)
-    # Quanto perco por estar abaixo do preço de mercado
-    df_merged['Opportunity_Eur'] = np.where(
-        df_merged['My_PVP'] < df_merged['Others_PVP'],
-        (df_merged['Others_PVP'] - df_merged['My_PVP']) * df_merged['Farm_Qtd'],
-        0
+
+def load_and_process_data(dataset, period, n_pharmacies):
+    """Frame dos produtos com vendas para (período, N): mudar N apenas seleciona outra coluna do cubo."""
+    df_base = pricing_engine.period_frame(dataset, period)
+    cube = build_cube(dataset['key'], period, df_base)
+    # Filtro Base: apenas produtos com vendas (o frame só é construído para essas linhas)
+    sold = np.flatnonzero(df_base['Farm_Qtd'].to_numpy() > 0)
+    with profiling.stage('reverse_frame'):
+        return pricing_engine.frame_for_n(df_base, cube, n_pharmacies, rows=sold), cube
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def build_product_index(dataset_key, period, _df_sold):
+    """Opções do filtro e índice Produto -> linhas, uma vez por dataset e período."""
+    return pricing_engine.product_index(_df_sold)
+
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def build_kpi_partials(dataset_key, period, n_pharmacies, _df_sold):
+    """Somas parciais dos KPIs por produto e totais sem filtro, para (período, N)."""
+    partials = pricing_engine.kpi_partials(_df_sold)
+    return partials, partials.sum(axis=0)
+
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def build_scenario_index(dataset_key, period, n_pharmacies, selection, _df):
+    """Tetos ordenados por Posição para avaliar a grelha de cenários da seleção."""
+    return scenarios.prepare(
+        _df['My_PVP'].to_numpy(), _df['Others_PVP'].to_numpy(),
+        _df['Farm_Qtd'].to_numpy(), _df['Position'].cat.codes.to_numpy()
     )
 
-    return df_merged, None, cols_info
+
+def selection_totals(state_key, partials, grand_totals, product_rows, selected_prods):
+    """Totais dos KPIs da seleção, atualizados só com os produtos adicionados/removidos.
+
+    O estado anterior fica em st.session_state; muda de dataset/período/N
+    implica recomeçar dos totais parciais (que estão em cache).
+    """
+    if not selected_prods:
+        return grand_totals
+    selected = set(selected_prods)
+    prev = st.session_state.get('kpi_selection')
+    if prev is not None and prev['key'] == state_key:
+        added = [product_rows[p] for p in selected - prev['selected']]
+        removed = [product_rows[p] for p in prev['selected'] - selected]
+        totals = pricing_engine.update_kpi_totals(
+            prev['totals'], partials,
+            np.concatenate(added) if added else (), np.concatenate(removed) if removed else ()
+        )
+    else:
+        totals = partials[np.concatenate([product_rows[p] for p in selected])].sum(axis=0)
+    st.session_state['kpi_selection'] = {'key': state_key, 'selected': selected, 'totals': totals}
+    return totals
+
 
 def main():
+    # Configuração da Página (aqui e não ao importar: o módulo fica importável sem efeitos)
+    st.set_page_config(
+        page_title="PharmaMarketPrice",
+        page_icon="💊",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+
+    # Aplicar Estilo Visual
+    apply_custom_style()
+
+    # Cada rerun é um run instrumentado (linhas JSON em PHARMA_PROFILE_LOG, se definido);
+    # com o painel de debug ligado mede-se também o pico de memória por etapa
+    profiling.configure_log()
+    debug = st.session_state.get('debug_panel', False)
+    run = profiling.start_run('dashboard', trace_memory=debug)
+    try:
+        dashboard()
+    finally:
+        profiling.end_run(run)
+
+    with st.sidebar:
+        st.divider()
+        if st.toggle("🐞 Painel de debug", key='debug_panel'):
+            st.caption(f"Último run: {run['seconds'] * 1000:.0f} ms"
+                       + (f" · RSS {run['rss_bytes'] / 1e6:.0f} MB" if run['rss_bytes'] else ""))
+            st.dataframe(profiling.stages_table(run), hide_index=True, use_container_width=True)
+
+
+def dashboard():
+    """Conteúdo da página: sidebar, KPIs e tabs."""
     # --- Logo na Sidebar ---
     if os.path.exists("Logo.png"):
         st.sidebar.image("Logo.png", width='stretch')
@@ -147,67 +268,118 @@ def main():
     # --- SIDEBAR ---
     with st.sidebar:
         st.header("⚙️ Configuração")
-        n_pharmacies = st.slider("Nº Farmácias na Região", 2, 20, 6)
+        n_pharmacies = st.slider("Nº Farmácias na Região", pricing_engine.N_MIN, pricing_engine.N_MAX, 6)
         
         st.divider()
         st.subheader("📂 Carregar Dados")
-        file_val = st.file_uploader("Ficheiro Valor (€)", type=['xlsx'])
-        file_uni = st.file_uploader("Ficheiro Unidades (Qtd)", type=['xlsx'])
+        source = st.radio("Fonte", ["Ficheiros Excel", "Histórico local"], horizontal=True, label_visibility="collapsed")
+        file_val = file_uni = history_pharmacy = None
+        if source == "Ficheiros Excel":
+            file_val = st.file_uploader("Ficheiro Valor (€)", type=['xlsx'])
+            file_uni = st.file_uploader("Ficheiro Unidades (Qtd)", type=['xlsx'])
+        else:
+            stored = history_store.pharmacies(history_connection())
+            if stored:
+                history_pharmacy = st.selectbox("Farmácia", stored)
+            else:
+                st.info("Histórico vazio: carregue ficheiros Excel e guarde-os no histórico.")
 
         st.divider()
-        st.subheader("💡 Simulador de Aumento")
-        st.markdown("Se aumentar X€ nos produtos visualizados, quanto ganho?")
-        sim_increase = st.number_input("Aumento Unitário (€)", value=0.15, step=0.05, format="%.2f")
+        st.subheader("💡 Simulador de Cenários")
+        st.markdown("Se aumentar os preços dos produtos visualizados, quanto ganho?")
+        sim_pct = st.radio("Tipo de aumento", ["€ por unidade", "% do PVP"], horizontal=True) == "% do PVP"
+        if sim_pct:
+            sim_increase = st.number_input("Aumento (%)", value=5.0, step=1.0, format="%.1f", key="sim_value_pct")
+        else:
+            sim_increase = st.number_input("Aumento Unitário (€)", value=0.15, step=0.05, format="%.2f", key="sim_value_abs")
+        sim_rule = st.selectbox("Produtos a aumentar", list(scenarios.POSITION_RULES))
+        sim_cap = st.checkbox("Não passar o PVP de mercado", value=False)
+
+    if (file_val and file_uni) or history_pharmacy:
+        import pandas as pd
 
-    if file_val and file_uni:
-        df, error, cols_info = load_and_process_data(file_val, file_uni, n_pharmacies)
+        if history_pharmacy:
+            dataset = load_history_dataset(history_pharmacy)
+        else:
+            dataset, error, cols_info = load_dataset(file_val, file_uni)
         
-        if error:
-            st.error(error)
-            return
+            if error:
+                st.error(error)
+                return
+
+            with st.sidebar:
+                for nome, r in cols_info["Leitura"].items():
+                    st.caption(f"📄 {nome}: {r['bytes'] / 1e6:.1f} MB · {r['rows']:,} linhas · {r['seconds']:.2f}s ({r['engine']})")
+                join_note = pricing_engine.join_summary(cols_info["Junção"])
+                if join_note:
+                    st.warning(f"🔗 {join_note}. Duplicados: só a 1ª linha conta; só num ficheiro: ignorados.")
+                    with st.expander("Ver códigos"):
+                        for title, key in (("Duplicados", 'duplicates'), ("Só num ficheiro", 'orphans')):
+                            for name, codes in cols_info["Junção"][key].items():
+                                if codes:
+                                    st.caption(f"{title} em {name}: {', '.join(codes)}")
+                cache = result_cache.stats()
+                st.caption(
+                    f"🗄️ Cache: {cache['memory_hits']} em memória · {cache['disk_hits']} em disco · "
+                    f"{cache['misses']} falhas · {cache['evictions'] + cache['disk_evictions']} despejos · "
+                    f"{cache['entries']} datasets ({cache['memory_bytes'] / 1e6:.0f}/{result_cache.MAX_MEMORY_BYTES / 1e6:.0f} MB)"
+                )
+                with st.expander("💾 Guardar no histórico"):
+                    pharmacy_name = st.text_input("Nome da farmácia", value=history_store.DEFAULT_PHARMACY)
+                    if st.button("Guardar meses novos"):
+                        new_periods = history_store.append_dataset(
+                            history_connection(), dataset, pharmacy_name, source=file_val.name
+                        )
+                        st.success(f"Guardados: {', '.join(new_periods)}" if new_periods else "Nada de novo a guardar.")
+
+        with st.sidebar:
+            periods = dataset['periods']
+            period = st.selectbox("📅 Período", periods, index=periods.index(dataset['default_period']))
+
+        df, cube = load_and_process_data(dataset, period, n_pharmacies)
+        panel = build_panel(dataset['key'], n_pharmacies, dataset)
+
+        # Preço Sugerido: ótimo de receita com a elasticidade estimada nos vários meses
+        optimum = build_optimizer(dataset['key'], period, n_pharmacies, dataset, panel)
+        df['Suggested_Price'] = optimum['Suggested_Price'][df.index].astype(np.float32)
+        df['Optimal_Gain_Eur'] = optimum['Optimal_Gain_Eur'][df.index].astype(np.float32)
         
-        # Filtro Base: Remover produtos sem vendas
-        df = df[df['Farm_Qtd'] > 0].copy()
+        prod_options, product_rows = build_product_index(dataset['key'], period, df)
+        partials, grand_totals = build_kpi_partials(dataset['key'], period, n_pharmacies, df)
 
         st.divider()
         
         # --- ÁREA DE FILTROS ---
         st.markdown("##### 🔎 Filtrar Produtos")
-        prod_options = df.sort_values(by='Farm_Qtd', ascending=False)['Produto'].unique()
         selected_prods = st.multiselect(
             "Escolha produtos para simular ou deixe vazio para ver todos:",
             options=prod_options,
             default=[]
         )
         
-        # Aplicação do Filtro
+        # Aplicação do Filtro (posições pré-calculadas em vez de isin sobre o frame)
         if selected_prods:
-            df_filtered = df[df['Produto'].isin(selected_prods)].copy()
+            rows_sel = np.sort(np.concatenate([product_rows[p] for p in selected_prods]))
+            df_filtered = df.iloc[rows_sel]
             filter_label = "Seleção"
         else:
-            df_filtered = df.copy()
+            df_filtered = df
             filter_label = "Total"
+        selection = tuple(selected_prods)
 
         # --- CÁLCULO DE KPIS (SEMPRE SOBRE O FILTRO ATUAL) ---
-        if not df_filtered.empty:
-            avg_my_pvp = df_filtered[df_filtered['My_PVP'] > 0]['My_PVP'].mean()
-            avg_mkt_pvp = df_filtered[df_filtered['Others_PVP'] > 0]['Others_PVP'].mean()
-            
-            # KPI 1: Dinheiro na Mesa (Gap para o Mercado)
-            total_opp = df_filtered['Opportunity_Eur'].sum()
-            
-            # KPI 2: Simulação Manual (Impacto Direto na Seleção)
-            # Soma das vendas dos produtos filtrados * aumento unitário
-            total_sales_selection = df_filtered['Farm_Qtd'].sum()
-            sim_gain = total_sales_selection * sim_increase
-            
-            delta_pvp = avg_my_pvp - avg_mkt_pvp
-        else:
-            avg_my_pvp, avg_mkt_pvp, total_opp, sim_gain, delta_pvp = 0, 0, 0, 0, 0
-            
-        # Tratar NaNs
-        avg_my_pvp = 0 if np.isnan(avg_my_pvp) else avg_my_pvp
-        avg_mkt_pvp = 0 if np.isnan(avg_mkt_pvp) else avg_mkt_pvp
+        with profiling.stage('kpis'):
+            totals = selection_totals((dataset['key'], period, n_pharmacies), partials, grand_totals,
+                                      product_rows, selected_prods)
+            avg_my_pvp, avg_mkt_pvp, total_opp, _, delta_pvp = pricing_engine.kpis_from_totals(totals, sim_increase)
+
+        with profiling.stage('scenario'):
+            sim_args = (sim_increase, sim_pct, scenarios.POSITION_RULES[sim_rule], sim_cap)
+            sim_new_pvp, sim_unit, sim_product_gain = scenarios.breakdown(
+                df_filtered['My_PVP'].to_numpy(), df_filtered['Others_PVP'].to_numpy(),
+                df_filtered['Farm_Qtd'].to_numpy(), df_filtered['Position'].cat.codes.to_numpy(), *sim_args
+            )
+            sim_gain = sim_product_gain.sum()
 
         # --- EXIBIÇÃO DE KPIS EM CARDS ---
         st.markdown(f"""
@@ -230,7 +402,7 @@ def main():
                     <span style="font-size: 1.5rem; font-weight: bold; color: #00e5ff;">{total_opp:.2f}€</span>
                 </div>
                 <div style="text-align: center;">
-                    <span style="font-size: 0.9rem; color: #aaa;">Simulação (+{sim_increase:.2f}€)</span><br>
+                    <span style="font-size: 0.9rem; color: #aaa;">Simulação (+{sim_increase:.2f}{'%' if sim_pct else '€'})</span><br>
                     <span style="font-size: 1.5rem; font-weight: bold; color: #d900ff;">+{sim_gain:.2f}€</span>
                 </div>
             </div>
@@ -240,108 +412,212 @@ def main():
         st.divider()
 
         # --- VISUALIZAÇÕES ---
-        tab1, tab2, tab3 = st.tabs(["💰 Preço vs Oportunidade", "👑 Matriz de Poder", "📋 Dados Detalhados"])
+        # Só a tab aberta corre: mudar de tab faz um rerun em vez de construir as seis em cada interação
+        tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
+            "💰 Preço vs Oportunidade", "👑 Matriz de Poder", "📋 Dados Detalhados",
+            "📈 Evolução", "📐 Sensibilidade a N", "🧪 Cenários"
+        ], key="main_tab", on_change="rerun")
+
+        render_mode = charts.render_mode(len(df_filtered))
+        render_note = (
+            f"{len(df_filtered):,} produtos: densidade agregada em grelha (cinzento) "
+            f"e os {charts.TOP_OUTLIERS} com maior oportunidade como pontos."
+        )
 
         with tab1:
-            if not df_filtered.empty:
-                st.markdown("#### Onde estou barato (Azul) ou caro (Vermelho)?")
-                fig = px.scatter(
-                    df_filtered, x="Others_PVP", y="My_PVP", size="Farm_Qtd", color="Diff_Percent",
-                    color_continuous_scale="RdBu_r", range_color=[-30, 30],
-                    labels={
-                        "Others_PVP": "Preço Mercado (€)", 
-                        "My_PVP": "Meu Preço (€)", 
-                        "Diff_Percent": "Diferença (%)", 
-                        "Farm_Qtd": "Vendas (Qtd)",
-                        "Opportunity_Eur": "Oportunidade (€)"
-                    },
-                    hover_name="Produto", hover_data={'Opportunity_Eur':':.2f', 'Diff_Percent':':.1f%'}
-                )
-                # Linha de Igualdade
-                max_val = max(df_filtered['My_PVP'].max(), df_filtered['Others_PVP'].max())
-                fig.add_shape(type="line", x0=0, y0=0, x1=max_val, y1=max_val, line=dict(color="Gray", dash="dash"))
-                
-                # Ajuste para tema escuro
-                fig.update_layout(
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    font=dict(color="#f0f2f6"),
-                    xaxis=dict(showgrid=True, gridcolor='rgba(255,255,255,0.1)'),
-                    yaxis=dict(showgrid=True, gridcolor='rgba(255,255,255,0.1)'),
-                )
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.warning("Sem dados para exibir.")
+            if tab_open(tab1):
+                if not df_filtered.empty:
+                    st.markdown("#### Onde estou barato (Azul) ou caro (Vermelho)?")
+                    if render_mode == 'bins':
+                        st.caption(render_note)
+                    fig = memo_figures('price', dataset['key'], period, n_pharmacies, selection,
+                                       functools.partial(charts.price_scatter, df_filtered, render_mode))
+                    # Inclui a serialização da figura para JSON
+                    with profiling.stage('chart_price_send'):
+                        st.plotly_chart(fig, use_container_width=True)
+                else:
+                    st.warning("Sem dados para exibir.")
 
         with tab2:
-            if not df_filtered.empty:
-                st.markdown("#### Cruzamento: Minha Força vs Meu Preço")
-                st.caption("Quadrante Ideal: **Verde (Dominante)** mas abaixo da linha zero (Barato) -> **SUBIR PREÇO**")
-                
-                fig_mat = px.scatter(
-                    df_filtered, x="Market_Share_Qty", y="Diff_Percent", size="Farm_Qtd", color="Position",
-                    color_discrete_map={'Dominante 👑': '#00CC96', 'Competitivo ⚔️': '#636EFA', 'Seguidor 🏃': '#EF553B'},
-                    labels={
-                        "Market_Share_Qty": "Minha Quota (%)", 
-                        "Diff_Percent": "Diferença Preço (%)",
-                        "My_PVP": "Meu Preço (€)",
-                        "Others_PVP": "Preço Mercado (€)",
-                        "Farm_Qtd": "Vendas (Qtd)",
-                        "Position": "Posição"
-                    },
-                    hover_name="Produto", hover_data={'My_PVP':':.2f', 'Others_PVP':':.2f'}
-                )
-                fig_mat.add_hline(y=0, line_dash="solid", line_color="gray")
-                fig_mat.add_vline(x=100/n_pharmacies, line_dash="dot", line_color="gray", annotation_text="Quota Média")
-                
-                # Ajuste para tema escuro
-                fig_mat.update_layout(
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    font=dict(color="#f0f2f6"),
-                    xaxis=dict(showgrid=True, gridcolor='rgba(255,255,255,0.1)'),
-                    yaxis=dict(showgrid=True, gridcolor='rgba(255,255,255,0.1)'),
-                )
-                st.plotly_chart(fig_mat, use_container_width=True)
-            else:
-                st.warning("Sem dados para exibir.")
+            if tab_open(tab2):
+                if not df_filtered.empty:
+                    st.markdown("#### Cruzamento: Minha Força vs Meu Preço")
+                    st.caption("Quadrante Ideal: **Verde (Dominante)** mas abaixo da linha zero (Barato) -> **SUBIR PREÇO**")
+                    if render_mode == 'bins':
+                        st.caption(render_note)
+
+                    fig_mat = memo_figures('matrix', dataset['key'], period, n_pharmacies, selection,
+                                           functools.partial(charts.power_matrix, df_filtered, n_pharmacies, render_mode))
+                    with profiling.stage('chart_matrix_send'):
+                        st.plotly_chart(fig_mat, use_container_width=True)
+                else:
+                    st.warning("Sem dados para exibir.")
 
         with tab3:
-            if not df_filtered.empty:
-                st.markdown("#### Tabela Detalhada")
-                
-                col_map = {
-                    'Produto': 'Produto',
-                    'Farm_Qtd': 'Vendas (Qtd)',
-                    'Avg_Unit_Others': 'Venda Média/Rival',
-                    'Market_Share_Qty': 'Quota (%)',
-                    'My_PVP': 'Meu PVP',
-                    'Others_PVP': 'PVP Mercado',
-                    'Diff_Percent': 'Dif Preço (%)',
-                    'Position': 'Posição',
-                    'Suggested_Price': 'Preço Sugerido',
-                    'Opportunity_Eur': 'Oportunidade (€)'
-                }
-                
-                # Filtrar colunas existentes e renomear
-                cols_final = [c for c in col_map.keys() if c in df_filtered.columns]
-                df_show = df_filtered[cols_final].rename(columns=col_map).sort_values(by='Vendas (Qtd)', ascending=False)
-
-                st.dataframe(
-                    df_show.style.format({
-                        'Vendas (Qtd)': '{:.0f}',
-                        'Venda Média/Rival': '{:.0f}',
-                        'Quota (%)': '{:.1f}%',
-                        'Meu PVP': '{:.2f}€',
-                        'PVP Mercado': '{:.2f}€',
-                        'Dif Preço (%)': '{:.1f}%',
-                        'Preço Sugerido': '{:.2f}€',
-                        'Oportunidade (€)': '{:.2f}€'
-                    }).background_gradient(subset=['Dif Preço (%)'], cmap='RdBu_r', vmin=-30, vmax=30),
-                    use_container_width=True
-                )
-            else:
-                st.warning("Sem dados para exibir.")
+            if tab_open(tab3):
+                if not df_filtered.empty:
+                    st.markdown("#### Tabela Detalhada")
+                    fit_counts = np.bincount(optimum['Fit'][df_filtered.index], minlength=3)
+                    st.caption(
+                        f"Preço Sugerido: preço que maximiza a receita com a procura estimada em {len(dataset['periods'])} "
+                        f"meses (limitado a ±{optimizer.MAX_CHANGE:.0%} do preço atual). Curva própria: {fit_counts[2]:,} · "
+                        f"da categoria (Posição): {fit_counts[1]:,} · sem curva, alinhado com o mercado: {fit_counts[0]:,}."
+                    )
+
+                    # Pesquisa, ordenação e paginação no servidor: só a página visível é enviada
+                    sort_options = {title: col for col, title in tables.DETAIL_COLUMNS.items()
+                                    if col in df_filtered.columns and col != 'Diff_Bucket'}
+                    c_search, c_sort, c_order, c_size = st.columns([3, 2, 1, 1])
+                    query = c_search.text_input("🔎 Pesquisar produto ou Cód", key="detail_query")
+                    sort_title = c_sort.selectbox("Ordenar por", list(sort_options), index=1, key="detail_sort")
+                    ascending = c_order.selectbox("Ordem", ["Desc", "Asc"], key="detail_order") == "Asc"
+                    page_size = c_size.selectbox("Linhas", tables.PAGE_SIZES, index=1, key="detail_page_size")
+
+                    with profiling.stage('table_query'):
+                        found = tables.search_rows(df_filtered, query)
+                    n_pages = tables.page_count(len(found), page_size)
+                    page = st.number_input(f"Página (de {n_pages})", min_value=1, max_value=n_pages, value=1, key="detail_page")
+
+                    with profiling.stage('table_page'):
+                        page_df = tables.detail_page(found, sort_options[sort_title], ascending, int(page), page_size)
+                    first = (int(page) - 1) * page_size
+                    if found.empty:
+                        st.info("Nenhum produto corresponde à pesquisa.")
+                    else:
+                        st.caption(f"Linhas {first + 1:,}–{first + len(page_df):,} de {len(found):,} produtos")
+                        with profiling.stage('table_render'):
+                            st.dataframe(tables.style_page(page_df), use_container_width=True, hide_index=True)
+
+                    # Exportação de todas as linhas do filtro atual (não só da página)
+                    c_fmt, c_prepare, c_download = st.columns([2, 1, 1])
+                    fmt = c_fmt.selectbox("📤 Exportar como", list(export.FORMATS), key="export_format",
+                                          format_func=str.upper)
+                    export_key = (dataset['key'], period, n_pharmacies, selection, fmt)
+                    if c_prepare.button("Preparar ficheiro", key="export_prepare"):
+                        st.session_state['export_ready'] = export_key
+                    if st.session_state.get('export_ready') == export_key:
+                        data = build_export(*export_key, df_filtered)
+                        ext, mime = export.FORMATS[fmt]
+                        c_download.download_button(
+                            f"⬇️ Descarregar ({len(data) / 1e6:.2f} MB)", data,
+                            file_name=f"Analise_PVP_{period.replace('/', '-')}_N{n_pharmacies}{ext}", mime=mime,
+                            key="export_download"
+                        )
+                else:
+                    st.warning("Sem dados para exibir.")
+
+        with tab4:
+            if tab_open(tab4):
+                if len(dataset['periods']) < 2:
+                    st.info("Os ficheiros têm apenas um período: carregue exportações com vários meses para ver tendências.")
+                elif not df_filtered.empty:
+                    st.markdown("#### Evolução Mensal: Meu Preço vs Mercado")
+
+                    # O painel (produtos x períodos) já está calculado para este N; as linhas são os
+                    # produtos vendidos no período escolhido, por isso o período entra na chave
+                    rows = df_filtered.index.to_numpy()
+
+                    def trend_figures():
+                        figs = charts.trend_figures(pricing_engine.period_trends(dataset, panel, rows).reset_index())
+                        # Com poucos produtos selecionados, mostrar a diferença de preço de cada um
+                        if selected_prods and len(selected_prods) <= 10:
+                            df_diff = pd.DataFrame(panel['Diff_Percent'][rows], columns=dataset['periods'])
+                            df_diff['Produto'] = df_filtered['Produto'].to_numpy()
+                            figs += (charts.diff_lines(df_diff),)
+                        return figs
+
+                    figs = memo_figures('trends', dataset['key'], period, n_pharmacies, selection, trend_figures)
+                    fig_trend, fig_opp = figs[:2]
+
+                    col_a, col_b = st.columns(2)
+                    col_a.plotly_chart(fig_trend, use_container_width=True)
+                    col_b.plotly_chart(fig_opp, use_container_width=True)
+                    if len(figs) > 2:
+                        st.plotly_chart(figs[2], use_container_width=True)
+                else:
+                    st.warning("Sem dados para exibir.")
+
+        with tab5:
+            if tab_open(tab5):
+                if not df_filtered.empty:
+                    st.markdown("#### Quanto dependem os resultados do valor de N?")
+                    st.caption("N é uma estimativa: veja como a Oportunidade e a Posição variam em todo o intervalo do slider.")
+
+                    # As linhas do frame mantêm o índice posicional do cubo
+                    rows = df_filtered.index.to_numpy()
+                    summary, position_changes = pricing_engine.n_sensitivity(cube, rows)
+
+                    opp_min = summary['Opportunity_Eur'].min()
+                    opp_max = summary['Opportunity_Eur'].max()
+                    st.markdown(
+                        f"Oportunidade entre **{opp_min:.2f}€** e **{opp_max:.2f}€** "
+                        f"· **{int(position_changes.sum())}** produtos mudam de Posição"
+                    )
+
+                    fig_sens, fig_pos = memo_figures('sensitivity', dataset['key'], period, n_pharmacies, selection,
+                                                     functools.partial(charts.sensitivity_figures, summary, n_pharmacies))
+
+                    col_a, col_b = st.columns(2)
+                    col_a.plotly_chart(fig_sens, use_container_width=True)
+                    col_b.plotly_chart(fig_pos, use_container_width=True)
+
+                    if position_changes.any():
+                        st.markdown("##### Produtos cuja Posição depende de N")
+                        changed = rows[position_changes]
+                        labels = pricing_engine.POSITION_LABELS
+                        opp_cube = cube['Opportunity_Eur'][changed]
+                        df_changed = pd.DataFrame({
+                            'Produto': df_filtered.loc[changed, 'Produto'].to_numpy(),
+                            'Vendas (Qtd)': df_filtered.loc[changed, 'Farm_Qtd'].to_numpy(),
+                            f'Posição (N={pricing_engine.N_MIN})': labels[cube['Position'][changed, 0]],
+                            f'Posição (N={n_pharmacies})': labels[cube['Position'][changed, pricing_engine.n_column(cube, n_pharmacies)]],
+                            f'Posição (N={pricing_engine.N_MAX})': labels[cube['Position'][changed, -1]],
+                            'Oportunidade Mín (€)': opp_cube.min(axis=1),
+                            'Oportunidade Máx (€)': opp_cube.max(axis=1),
+                        }).sort_values(by='Vendas (Qtd)', ascending=False)
+                        st.dataframe(df_changed, use_container_width=True, hide_index=True)
+                else:
+                    st.warning("Sem dados para exibir.")
+
+        with tab6:
+            if tab_open(tab6):
+                if not df_filtered.empty:
+                    unit = '%' if sim_pct else '€'
+                    st.markdown("#### Superfície de Ganho: aumento x produtos a aumentar")
+                    max_value = st.number_input(
+                        f"Aumento máximo ({unit})", min_value=0.01, value=20.0 if sim_pct else 1.0,
+                        step=1.0 if sim_pct else 0.1, key=f"grid_max_{'pct' if sim_pct else 'abs'}"
+                    )
+                    values = np.linspace(0, max_value, 41)
+                    rules = list(scenarios.POSITION_RULES)
+                    with profiling.stage('scenario_grid'):
+                        prepared = build_scenario_index(dataset['key'], period, n_pharmacies, selection, df_filtered)
+                        grid = scenarios.scenario_grid(values, 'pct' if sim_pct else 'abs', rules, cap=sim_cap)
+                        result = scenarios.simulate(prepared, grid)
+                    st.caption(f"{len(grid['value'])} cenários x {len(df_filtered):,} produtos"
+                               + (" · aumentos limitados ao PVP de mercado" if sim_cap else ""))
+                    st.plotly_chart(charts.scenario_surface(result['surface'], values, rules, unit), use_container_width=True)
+
+                    st.markdown(f"##### Cenário do simulador: +{sim_increase:g}{unit} · {sim_rule}")
+                    codes = df_filtered['Position'].cat.codes.to_numpy()
+                    gain_by_position = np.bincount(codes, weights=sim_product_gain, minlength=3)
+                    for col, label, value in zip(st.columns(3), pricing_engine.POSITION_LABELS, gain_by_position):
+                        col.metric(label, f"+{value:.2f}€")
+
+                    top = np.argsort(-sim_product_gain, kind='stable')[:100]
+                    st.dataframe(pd.DataFrame({
+                        'Produto': df_filtered['Produto'].to_numpy()[top],
+                        'Posição': df_filtered['Position'].to_numpy()[top],
+                        'Vendas (Qtd)': df_filtered['Farm_Qtd'].to_numpy()[top],
+                        'Meu PVP': df_filtered['My_PVP'].to_numpy()[top],
+                        'PVP Mercado': df_filtered['Others_PVP'].to_numpy()[top],
+                        'Novo PVP': sim_new_pvp[top],
+                        'Aumento (€)': sim_unit[top],
+                        'Ganho (€)': sim_product_gain[top],
+                    }).round(2), use_container_width=True, hide_index=True)
+                    st.caption("Os 100 produtos com maior ganho no cenário escolhido na barra lateral.")
+                else:
+                    st.warning("Sem dados para exibir.")
 
     else:
         # Estado Inicial (Sem ficheiros)
@@ -0,0 +1,287 @@
+"""Análise de PVP de mercado em lote, para várias farmácias/regiões em paralelo.
+
+Fontes de trabalhos:
+  * --dir PASTA      uma subpasta por farmácia com ValorVendido.xlsx e UnidadesVendidas.xlsx
+                     (N comum, definido por --n);
+  * --manifest CSV   colunas: farmacia, valor, unidades, n e (opcional) periodo;
+                     caminhos relativos ao próprio manifesto.
+
+Resultado: um único ficheiro (.parquet, .csv ou .xlsx) com a coluna 'Farmácia', e um
+relatório de tempos/falhas por trabalho. Uma falha não interrompe os restantes.
+
+Modo grupo (--grupo): as farmácias são lojas do mesmo grupo e o manifesto
+ganha a coluna 'regiao' (com --dir, todas na mesma região). Em cada região
+as vendas de todas as lojas são subtraídas de uma vez (group_engine), com N
+comum por região. Sai o ficheiro por loja e, em --output-grupo, um por
+região x Cód. Regiões com uma loja falhada ficam de fora (sem as vendas dessa
+loja, seriam contadas como concorrência).
+
+Uso:
+    python batch_pvp.py --manifest farmacias.csv --output resultados.parquet --workers 8
+    python batch_pvp.py --manifest lojas.csv --grupo --output lojas.parquet
+"""
+import argparse
+import csv
+import functools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import excel_reader
+import export
+import group_engine
+import pricing_engine
+
+VAL_FILE = 'ValorVendido.xlsx'
+UNI_FILE = 'UnidadesVendidas.xlsx'
+
+
+def jobs_from_dir(root, n_pharmacies):
+    """Um trabalho por subpasta que contenha o par de ficheiros."""
+    jobs = []
+    for name in sorted(os.listdir(root)):
+        folder = os.path.join(root, name)
+        val, uni = os.path.join(folder, VAL_FILE), os.path.join(folder, UNI_FILE)
+        if os.path.isdir(folder) and os.path.exists(val) and os.path.exists(uni):
+            jobs.append({'farmacia': name, 'valor': val, 'unidades': uni, 'n': n_pharmacies, 'periodo': None,
+                         'regiao': os.path.basename(os.path.abspath(root))})
+    return jobs
+
+
+def jobs_from_manifest(path, default_n, group=False):
+    """Um trabalho por linha; com `group` a coluna 'regiao' é obrigatória em todas."""
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            # Uma loja sem região cairia numa região por defeito e seria subtraída das lojas erradas
+            if group and not (row.get('regiao') or '').strip():
+                raise ValueError(f"{path}, linha {reader.line_num}: falta 'regiao' (obrigatória com --grupo)")
+            jobs.append({
+                'farmacia': row['farmacia'],
+                'valor': os.path.join(base, row['valor']),
+                'unidades': os.path.join(base, row['unidades']),
+                'n': int(row.get('n') or default_n),
+                'periodo': row.get('periodo') or None,
+                'regiao': row.get('regiao') or 'Região',
+            })
+    return jobs
+
+
+def read_dataset(job):
+    # Dentro de um worker a leitura é sequencial (o paralelismo é entre trabalhos)
+    read_val = excel_reader.read_columns(job['valor'], pricing_engine.period_columns, [0, 1])
+    read_uni = excel_reader.read_columns(
+        job['unidades'], functools.partial(pricing_engine.period_columns, with_product=False), [0]
+    )
+    return pricing_engine.build_dataset(read_val, read_uni, key=job['farmacia'])
+
+
+def run_job(job):
+    """Executa um trabalho num worker; nunca lança, devolve (relatório, frame ou None)."""
+    t0 = time.perf_counter()
+    report = {'farmacia': job['farmacia'], 'n': job['n'], 'status': 'ok', 'linhas': 0, 'erro': ''}
+    try:
+        dataset = read_dataset(job)
+        period = job['periodo'] or dataset['default_period']
+        if period not in dataset['periods']:
+            raise ValueError(f"Período '{period}' inexistente ({', '.join(dataset['periods'])})")
+
+        df = pricing_engine.metrics_frame(pricing_engine.period_frame(dataset, period), job['n'])
+        df.insert(0, 'Farmácia', job['farmacia'])
+        df.insert(1, 'Período', period)
+        df.insert(2, 'N', job['n'])
+        report['periodo'] = period
+        report['linhas'] = len(df)
+        report['duplicados'] = sum(dataset['join']['n_duplicates'].values())
+        report['orfaos'] = sum(dataset['join']['n_orphans'].values())
+    except Exception as e:
+        df = None
+        report['status'] = 'falhou'
+        report['erro'] = f"{type(e).__name__}: {e}"
+    report['segundos'] = round(time.perf_counter() - t0, 3)
+    return report, df
+
+
+def read_job(job):
+    """Só a leitura (modo grupo); nunca lança, devolve (relatório, dataset ou None)."""
+    t0 = time.perf_counter()
+    report = {'farmacia': job['farmacia'], 'n': job['n'], 'status': 'ok', 'linhas': 0, 'erro': ''}
+    try:
+        dataset = read_dataset(job)
+        report['linhas'] = len(dataset['ids'])
+        report['duplicados'] = sum(dataset['join']['n_duplicates'].values())
+        report['orfaos'] = sum(dataset['join']['n_orphans'].values())
+    except Exception as e:
+        dataset = None
+        report['status'] = 'falhou'
+        report['erro'] = f"{type(e).__name__}: {e}"
+    report['segundos'] = round(time.perf_counter() - t0, 3)
+    return report, dataset
+
+
+def run_jobs(jobs, job_fn, workers=None):
+    """Corre `job_fn` por trabalho num ProcessPoolExecutor; devolve [(relatório, resultado ou None)] pela ordem dos trabalhos."""
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    results = [None] * len(jobs)
+
+    def record(i, report, out):
+        status = '✔' if report['status'] == 'ok' else '✘'
+        codes = f"Cód: {report['duplicados']} dup., {report['orfaos']} órfãos" if report.get('duplicados') or report.get('orfaos') else ''
+        print(f"  {status} {report['farmacia']:<30} {report['segundos']:>7.2f}s  {report['linhas']:>8} linhas  {codes}{report['erro']}")
+        results[i] = (report, out)
+
+    if workers <= 1:
+        for i, job in enumerate(jobs):
+            record(i, *job_fn(job))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(job_fn, job): (i, job) for i, job in enumerate(jobs)}
+            for i, result in _collect(futures):
+                record(i, *result)
+    return results
+
+
+def run_batch(jobs, workers=None):
+    """Corre os trabalhos num ProcessPoolExecutor; devolve (frame consolidado, relatórios)."""
+    results = run_jobs(jobs, run_job, workers)
+    frames = [df for _, df in results if df is not None]
+    result = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return result, [report for report, _ in results]
+
+
+def run_group(jobs, workers=None):
+    """Modo grupo: lê as lojas em paralelo e analisa todas as regiões num só passo.
+
+    Devolve (frame por loja, frame por região x Cód, relatórios, relatório do grupo).
+    """
+    names = [job['farmacia'] for job in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError("Nomes de farmácia repetidos no modo grupo.")
+    n_by_region = {}
+    for job in jobs:
+        if n_by_region.setdefault(job['regiao'], job['n']) != job['n']:
+            raise ValueError(f"N diferente entre lojas da região '{job['regiao']}'.")
+
+    periods = {job['periodo'] for job in jobs if job['periodo']}
+    if len(periods) > 1:
+        raise ValueError(f"Períodos diferentes no modo grupo: {', '.join(sorted(periods))}")
+
+    results = run_jobs(jobs, read_job, workers)
+    reports = [report for report, _ in results]
+    failed_regions = {job['regiao'] for job, (_, dataset) in zip(jobs, results) if dataset is None}
+    read = [(job, dataset) for job, (_, dataset) in zip(jobs, results) if job['regiao'] not in failed_regions]
+    if failed_regions:
+        print(f"  Regiões sem todas as lojas (excluídas): {', '.join(sorted(failed_regions))}")
+    if not read:
+        return pd.DataFrame(), pd.DataFrame(), reports, None
+
+    stacked = group_engine.stack_stores([d for _, d in read], [job['regiao'] for job, _ in read])
+    panel = group_engine.build_group_panel(stacked, n_by_region)
+    period = periods.pop() if periods else stacked['default_period']
+    if period not in stacked['periods']:
+        raise ValueError(f"Período '{period}' inexistente em todas as lojas ({', '.join(stacked['periods'])})")
+
+    stores, groups = group_engine.group_frames(stacked, panel, period, [job['farmacia'] for job, _ in read])
+    for df in (stores, groups):
+        df.insert(2, 'Período', period)
+    return stores, groups, reports, panel['report']
+
+
+def _collect(futures):
+    for future in as_completed(futures):
+        i, job = futures[future]
+        try:
+            yield i, future.result()
+        except Exception as e:
+            # Falha do próprio worker (ex: processo morto por falta de memória)
+            yield i, ({'farmacia': job['farmacia'], 'n': job['n'], 'status': 'falhou', 'linhas': 0,
+                       'erro': f"{type(e).__name__}: {e}", 'segundos': 0.0}, None)
+
+
+def write_output(df, path):
+    export.write(df, path)
+
+
+def report_frame(reports):
+    """Relatório por trabalho; nos falhados as contagens da junção ficam vazias (Int64, não float)."""
+    df = pd.DataFrame(reports)
+    for col in ('duplicados', 'orfaos'):
+        if col in df:
+            df[col] = df[col].astype('Int64')
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Análise de PVP de mercado em lote")
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument('--dir', help="Pasta com uma subpasta por farmácia")
+    src.add_argument('--manifest', help="CSV com farmacia, valor, unidades, n[, periodo]")
+    parser.add_argument('--n', type=int, default=6, help="N por defeito (Nº farmácias na região)")
+    parser.add_argument('--output', default='Analise_PVP_Lote.parquet', help=".parquet, .csv ou .xlsx")
+    parser.add_argument('--report', default=None, help="CSV opcional com tempos e falhas por trabalho")
+    parser.add_argument('--grupo', action='store_true',
+                        help="Lojas do mesmo grupo: subtrai todas as lojas de cada região (coluna 'regiao')")
+    parser.add_argument('--output-grupo', default=None,
+                        help="Resultado por região x Cód no modo grupo (por defeito <output>_grupo)")
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.grupo and not args.output_grupo:
+        stem, ext = os.path.splitext(args.output)
+        args.output_grupo = f"{stem}_grupo{ext}"
+    try:
+        export.format_from_path(args.output)
+        if args.grupo:
+            export.format_from_path(args.output_grupo)
+    except ValueError as e:
+        parser.error(str(e))
+
+    try:
+        jobs = jobs_from_dir(args.dir, args.n) if args.dir else jobs_from_manifest(args.manifest, args.n, args.grupo)
+    except ValueError as e:
+        print(f"Erro no manifesto: {e}")
+        return 1
+    if not jobs:
+        print("Nenhum trabalho encontrado.")
+        return 1
+
+    print(f"--- Análise em lote: {len(jobs)} trabalhos, {args.workers or os.cpu_count()} workers ---")
+    t0 = time.perf_counter()
+    if args.grupo:
+        try:
+            result, groups, reports, group_report = run_group(jobs, args.workers)
+        except ValueError as e:
+            print(f"Erro no modo grupo: {e}")
+            return 1
+        if group_report is not None:
+            print(f"Grupo: {group_report['stores']} lojas em {group_report['regions']} regiões, "
+                  f"{group_report['groups']} produtos por região")
+            if group_report['region_mismatch']:
+                print("  Aviso: valores regionais diferentes entre lojas da mesma região em "
+                      + ', '.join(f"{r} ({n} Cód)" for r, n in group_report['mismatch_by_region'].items())
+                      + " - confirme a coluna 'regiao'.")
+        if not groups.empty:
+            write_output(groups, args.output_grupo)
+            print(f"Resultado por região ({len(groups)} linhas) guardado em: {args.output_grupo}")
+    else:
+        result, reports = run_batch(jobs, args.workers)
+    failed = [r for r in reports if r['status'] != 'ok']
+
+    if not result.empty:
+        write_output(result, args.output)
+        print(f"\nResultado consolidado ({len(result)} linhas) guardado em: {args.output}")
+    if args.report:
+        report_frame(reports).to_csv(args.report, index=False)
+        print(f"Relatório por trabalho guardado em: {args.report}")
+
+    print(f"{len(reports) - len(failed)} ok, {len(failed)} falhados em {time.perf_counter() - t0:.2f}s")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
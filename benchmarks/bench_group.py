@@ -0,0 +1,117 @@
+"""Benchmark: modo grupo (group_engine) com centenas de lojas em dezenas de regiões.
+
+Gera, por região, as vendas verdadeiras de cada uma das N farmácias
+(as primeiras k são do grupo) e o dataset que cada loja própria receberia
+(as suas vendas + a média regional por farmácia). Compara com o PVP real da
+concorrência (vendas das N-k farmácias de fora do grupo):
+  grupo    group_engine: todas as lojas da região subtraídas num só passo;
+  por loja reverse_engineer em cada loja (ciclo Python), que conta as
+           outras lojas do grupo como concorrência.
+Reporta o tempo, as linhas/s e o erro do PVP de mercado face ao verdadeiro.
+
+Uso: python benchmarks/bench_group.py [--regions 30] [--stores 10] [--n 25] [--skus 10000] [--periods 4]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+import group_engine
+import pricing_engine
+from synth_workbooks import period_labels
+
+
+def synthetic_group(n_regions, stores, n_pharmacies, n_skus, n_periods, listed_share=0.9, seed=0):
+    """(datasets, regiões, N por região, PVP verdadeiro da concorrência por loja no último período)."""
+    rng = np.random.default_rng(seed)
+    cod = np.arange(1_000_000, 1_000_000 + n_skus)
+    produto = np.array([f'PRODUTO {c}' for c in cod], dtype=object)
+    periods = period_labels(n_periods)[::-1]
+    base_price = rng.lognormal(2.3, 0.9, size=(1, n_skus, 1))
+
+    datasets, regions, truth = [], [], []
+    for r in range(n_regions):
+        # Vendas de cada farmácia da região: (farmácias x produtos x períodos)
+        qty = rng.gamma(1.5, 8, size=(n_pharmacies, n_skus, n_periods)).round()
+        price = base_price * rng.normal(1.0, 0.08, size=(n_pharmacies, n_skus, 1))
+        # Cada loja própria só lista parte do catálogo (não listado = sem vendas)
+        listed = rng.random((stores, n_skus)) < listed_share
+        qty[:stores] *= listed[:, :, None]
+        val = qty * price
+        reg_val, reg_qtd = val.mean(axis=0), qty.mean(axis=0)
+        others_pvp = val[stores:, :, -1].sum(axis=0) / qty[stores:, :, -1].sum(axis=0)
+
+        for s in range(stores):
+            rows = np.flatnonzero(listed[s])
+            datasets.append({
+                'ids': pricing_engine.compact_ids(cod[rows].astype(object), produto[rows]),
+                'periods': periods, 'default_period': periods[-1],
+                'Farm_Val': val[s, rows], 'Reg_Val': reg_val[rows], 'Farm_Qtd': qty[s, rows], 'Reg_Qtd': reg_qtd[rows],
+            })
+            regions.append(f'Região {r + 1}')
+            truth.append(others_pvp[rows])
+    n_by_region = {f'Região {r + 1}': n_pharmacies for r in range(n_regions)}
+    return datasets, regions, n_by_region, np.concatenate(truth)
+
+
+def run_group(datasets, regions, n_by_region):
+    stacked = group_engine.stack_stores(datasets, regions)
+    panel = group_engine.build_group_panel(stacked, n_by_region)
+    names = [f'Loja {i}' for i in range(len(datasets))]
+    return group_engine.group_frames(stacked, panel, stacked['periods'][-1], names)
+
+
+def run_per_store(datasets, n_pharmacies):
+    """Caminho por loja: uma chamada ao motor por loja, cada uma só com as suas vendas."""
+    out = []
+    for ds in datasets:
+        metrics = pricing_engine.reverse_engineer(ds['Farm_Val'][:, -1], ds['Reg_Val'][:, -1], ds['Farm_Qtd'][:, -1],
+                                                  ds['Reg_Qtd'][:, -1], n_pharmacies)
+        out.append(metrics['Others_PVP'])
+    return np.concatenate(out)
+
+
+def pvp_error(estimate, truth):
+    """Erro relativo médio e máximo (%) do PVP de mercado nos produtos com concorrência."""
+    ok = np.isfinite(truth) & (truth > 0)
+    rel = np.abs(estimate[ok] - truth[ok]) / truth[ok] * 100
+    return rel.mean(), rel.max()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--regions', type=int, default=30)
+    parser.add_argument('--stores', type=int, default=10, help="Lojas do grupo por região")
+    parser.add_argument('--n', type=int, default=25, help="Farmácias por região (incluindo as do grupo)")
+    parser.add_argument('--skus', type=int, default=10000)
+    parser.add_argument('--periods', type=int, default=4)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    datasets, regions, n_by_region, truth = synthetic_group(args.regions, args.stores, args.n, args.skus, args.periods)
+    rows = len(truth)
+    print(f"{len(datasets)} lojas em {args.regions} regiões, {rows:,} linhas loja x Cód, {args.periods} períodos "
+          f"(gerado em {time.perf_counter() - t0:.1f}s)")
+
+    t0 = time.perf_counter()
+    stores, groups = run_group(datasets, regions, n_by_region)
+    seconds = time.perf_counter() - t0
+    mean_err, max_err = pvp_error(stores['Others_PVP'].to_numpy(), truth)
+    print(f"{'grupo':<9} {seconds:>7.2f}s {rows / seconds / 1e6:>6.2f} M linhas/s  "
+          f"erro PVP mercado: médio {mean_err:.4f}%  máx {max_err:.4f}%  ({len(groups):,} região x Cód)")
+
+    t0 = time.perf_counter()
+    naive = run_per_store(datasets, args.n)
+    seconds = time.perf_counter() - t0
+    mean_err, max_err = pvp_error(naive, truth)
+    print(f"{'por loja':<9} {seconds:>7.2f}s {rows / seconds / 1e6:>6.2f} M linhas/s  "
+          f"erro PVP mercado: médio {mean_err:.4f}%  máx {max_err:.4f}%")
+
+
+if __name__ == '__main__':
+    main()
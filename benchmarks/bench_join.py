@@ -0,0 +1,102 @@
+"""Benchmark: junção Valor/Unidades por Cód (pricing_engine.build_dataset).
+
+Gera leituras sintéticas (o formato de `excel_reader.read_columns`) com
+códigos inteiros e de texto, uma linha de Totais e uma fração de códigos
+duplicados e órfãos, e compara a junção indexada com o caminho anterior
+(`pd.merge` + filtro de Totais por `str.contains` + arrays por período).
+Tempo e pico de memória por linha constantes mostram que a junção é linear;
+o merge multiplica as linhas dos códigos duplicados.
+
+Uso: python benchmarks/bench_join.py [--sizes 10000 100000 1000000] [--periods 12]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+import pricing_engine
+
+
+def synthetic_reads(n_skus, n_periods, dup_rate=0.001, orphan_rate=0.01, seed=0):
+    """Par (read_val, read_uni) com o formato do excel_reader lido com period_columns."""
+    rng = np.random.default_rng(seed)
+    months = [f"{pricing_engine.MONTHS_PT[t % 12].capitalize()}/{2020 + t // 12}" for t in range(n_periods)]
+    header_val = ['Cód', 'Produto'] + [f'{side} {m}' for m in months for side in ('Farmácia', 'Região')]
+    header_uni = ['Cód'] + header_val[2:]
+
+    codes = np.arange(1_000_000, 1_000_000 + n_skus).astype(object)
+    text = rng.random(n_skus) < 0.05
+    codes[text] = [f'A{c}' for c in codes[text]]
+
+    def side(rows, with_product):
+        rows = np.concatenate([rows, rows[rng.random(len(rows)) < dup_rate]])
+        cod = np.append(codes[rows], 'Totais')
+        arrays = [cod]
+        if with_product:
+            arrays.append(np.array([f'PRODUTO {c}' for c in cod], dtype=object))
+        arrays += [rng.gamma(2, 10, size=len(cod)) for _ in range(2 * n_periods)]
+        return arrays
+
+    # Órfãos: metade só no ficheiro Valor, metade só no Unidades (por outra ordem)
+    orphan = rng.random(n_skus) < orphan_rate
+    only_val = rng.random(n_skus) < 0.5
+    val_rows = np.flatnonzero(~orphan | only_val)
+    uni_rows = rng.permutation(np.flatnonzero(~orphan | ~only_val))
+    read_val = {'source_header': header_val, 'arrays': side(val_rows, True)}
+    read_uni = {'source_header': header_uni, 'arrays': side(uni_rows, False)}
+    return read_val, read_uni
+
+
+def merge_baseline(read_val, read_uni, n_periods):
+    """Caminho anterior: merge de dois frames largos, Totais removidos depois e arrays por período."""
+    val_cols = {'Cód': read_val['arrays'][0], 'Produto': read_val['arrays'][1]}
+    uni_cols = {'Cód': read_uni['arrays'][0]}
+    for t in range(n_periods):
+        val_cols[f'Farm_Val|{t}'], val_cols[f'Reg_Val|{t}'] = read_val['arrays'][2 + 2 * t:4 + 2 * t]
+        uni_cols[f'Farm_Qtd|{t}'], uni_cols[f'Reg_Qtd|{t}'] = read_uni['arrays'][1 + 2 * t:3 + 2 * t]
+    merged = pd.merge(pd.DataFrame(val_cols), pd.DataFrame(uni_cols), on='Cód')
+    merged = merged[~merged['Cód'].astype(str).str.contains('Totais', case=False, na=False)].reset_index(drop=True)
+    dataset = {'ids': pd.DataFrame({'Cód': merged['Cód'].to_numpy(), 'Produto': pd.Categorical(merged['Produto'])})}
+    for col in ('Farm_Val', 'Reg_Val', 'Farm_Qtd', 'Reg_Qtd'):
+        block = merged[[f'{col}|{t}' for t in range(n_periods)]].apply(pd.to_numeric, errors='coerce')
+        dataset[col] = block.fillna(0).to_numpy(dtype=float)
+    return dataset
+
+
+def measure(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--periods', type=int, default=12)
+    args = parser.parse_args()
+
+    print(f"{'linhas':>9} {'caminho':>8} {'produtos':>9} {'tempo':>8} {'ns/linha':>9} {'pico':>8} {'B/linha':>8}  relatório")
+    for n_skus in args.sizes:
+        read_val, read_uni = synthetic_reads(n_skus, args.periods)
+        rows = len(read_val['arrays'][0]) + len(read_uni['arrays'][0])
+        dataset, seconds, peak = measure(lambda: pricing_engine.build_dataset(read_val, read_uni, key='bench'))
+        print(f"{rows:>9} {'join':>8} {len(dataset['ids']):>9} {seconds:>7.3f}s {seconds / rows * 1e9:>9.0f} "
+              f"{peak / 1e6:>6.0f}MB {peak / rows:>8.0f}  {pricing_engine.join_summary(dataset['join'])}")
+        merged, seconds, peak = measure(lambda: merge_baseline(read_val, read_uni, args.periods))
+        print(f"{rows:>9} {'merge':>8} {len(merged['ids']):>9} {seconds:>7.3f}s {seconds / rows * 1e9:>9.0f} "
+              f"{peak / 1e6:>6.0f}MB {peak / rows:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Benchmark: leitura sequencial vs paralela (ProcessPoolExecutor) de pares Valor/Unidades.
+
+Uso: python benchmarks/bench_parallel_read.py [--rows 20000] [--pairs 4] [--workers N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import excel_reader
+from synth_workbooks import write_pair
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--pairs', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = []
+        for p in range(args.pairs):
+            val_path, uni_path = write_pair(os.path.join(tmp, str(p)), args.rows, seed=p)
+            jobs.append((val_path, [0, 1, 3, 8], [0, 1]))
+            jobs.append((uni_path, [0, 3, 8], [0]))
+
+        t0 = time.perf_counter()
+        excel_reader.read_many(jobs, max_workers=1)
+        t_seq = time.perf_counter() - t0
+
+        # Primeira chamada inclui o arranque dos processos (spawn)
+        t0 = time.perf_counter()
+        excel_reader.read_many(jobs, max_workers=args.workers)
+        t_cold = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        excel_reader.read_many(jobs, max_workers=args.workers)
+        t_warm = time.perf_counter() - t0
+
+    print(f"{len(jobs)} ficheiros x {args.rows} linhas, {args.workers} workers ({os.cpu_count()} CPUs)")
+    print(f"  sequencial        : {t_seq:7.2f}s")
+    print(f"  paralelo (frio)   : {t_cold:7.2f}s  ({t_seq / t_cold:.2f}x)")
+    print(f"  paralelo (quente) : {t_warm:7.2f}s  ({t_seq / t_warm:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
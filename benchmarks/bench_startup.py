@@ -0,0 +1,101 @@
+"""Benchmark: arranque a frio e latência por rerun do dashboard.
+
+  import     tempo de `import app` num processo novo (o que cada arranque do
+             servidor paga antes do primeiro desenho) e se o Plotly já ficou
+             carregado;
+  1º run     primeiro desenho com um par de workbooks sintéticos (inclui a
+             leitura dos ficheiros; cache em disco numa pasta temporária);
+  rerun N    média de reruns a mudar o slider de N;
+  rerun tab  média de reruns a mudar de tab (cada tab uma vez).
+
+Os reruns correm com o streamlit.testing (AppTest), sem browser: medem o
+script do lado do servidor, incluindo a serialização das figuras.
+
+Uso: python benchmarks/bench_startup.py [--skus 10000] [--reruns 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synth_workbooks import ensure_pair
+
+IMPORT_SNIPPET = (
+    "import sys, time; t0 = time.perf_counter(); import app; "
+    "print(time.perf_counter() - t0, 'plotly' in sys.modules)"
+)
+
+
+def import_time(repeat):
+    best, plotly_loaded = float('inf'), None
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], cwd=ROOT, capture_output=True, text=True,
+                             check=True).stdout.split()
+        best = min(best, float(out[0]))
+        plotly_loaded = out[1] == 'True'
+    return best, plotly_loaded
+
+
+def timed_run(at):
+    t0 = time.perf_counter()
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    return time.perf_counter() - t0
+
+
+def rerun_times(val_path, uni_path, reruns):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=600)
+    at.run()
+    for uploader, path in zip(at.file_uploader, (val_path, uni_path)):
+        with open(path, 'rb') as f:
+            uploader.set_value((os.path.basename(path), f.read(), 'application/octet-stream'))
+    first = timed_run(at)
+
+    n_times = []
+    for i in range(reruns):
+        at.sidebar.slider[0].set_value(3 + i % 10)
+        n_times.append(timed_run(at))
+
+    tab_times = []
+    labels = [t.label for t in at.tabs]
+    if 'main_tab' in at.session_state:
+        for label in labels[1:] + labels[:1]:
+            at.session_state['main_tab'] = label
+            tab_times.append(timed_run(at))
+    return first, n_times, tab_times, len(labels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--skus', type=int, default=10000)
+    parser.add_argument('--reruns', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data-dir', default=os.path.join(ROOT, 'bench_data'))
+    args = parser.parse_args()
+
+    seconds, plotly_loaded = import_time(args.repeat)
+    print(f"import app          {seconds * 1000:8.0f} ms   plotly carregado: {'sim' if plotly_loaded else 'não'}")
+
+    val_path, uni_path = ensure_pair(os.path.join(args.data_dir, str(args.skus)), args.skus)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ['PHARMA_CACHE_DIR'] = cache_dir
+        first, n_times, tab_times, n_tabs = rerun_times(val_path, uni_path, args.reruns)
+    print(f"1º run ({args.skus} SKUs) {first * 1000:8.0f} ms")
+    print(f"rerun N (média)     {statistics.mean(n_times) * 1000:8.0f} ms   ({len(n_times)} reruns, {n_tabs} tabs)")
+    if tab_times:
+        print(f"rerun tab (média)   {statistics.mean(tab_times) * 1000:8.0f} ms   "
+              + ' '.join(f"{t * 1000:.0f}" for t in tab_times))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Teste de carga do serviço HTTP (pricing_service.py) em localhost.
+
+Arranca o serviço num subprocesso (ou usa --url de um já a correr) e
+envia pedidos concorrentes em três fases:
+  frio     pares de workbooks distintos (seeds diferentes): leituras no pool,
+           com a fila limitada a recusar (503) o que não cabe; o cliente
+           repete depois do Retry-After;
+  quente   os mesmos pares outra vez, com N variável: só métricas a partir da
+           result_cache;
+  parquet  o dataset já processado (result_cache.write_dataset) no corpo.
+Por fase: pedidos/s, latência p50/p95/máx e contagem por código HTTP.
+
+Uso: python benchmarks/load_test_service.py [--skus 5000] [--pares 8] [--pedidos 64] [--concorrencia 16]
+"""
+import argparse
+import io
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synth_workbooks import ensure_pair
+
+
+def multipart(fields):
+    boundary = uuid.uuid4().hex
+    body = b''.join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{name}.xlsx"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b'\r\n'
+        for name, data in fields.items()
+    ) + f'--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def post(url, body, content_type, retries=0):
+    """(código, segundos, corpo, nº de 503); com `retries` repete os 503 após o Retry-After."""
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': content_type}, method='POST')
+    t0 = time.perf_counter()
+    rejected = 0
+    while True:
+        try:
+            with urllib.request.urlopen(request, timeout=600) as response:
+                return response.status, time.perf_counter() - t0, response.read(), rejected
+        except urllib.error.HTTPError as e:
+            if e.code != 503 or rejected >= retries:
+                return e.code, time.perf_counter() - t0, e.read(), rejected
+            rejected += 1
+            time.sleep(float(e.headers.get('Retry-After', 1)))
+
+
+def run_phase(label, requests, concurrency, retries=0):
+    """Envia (url, corpo, content_type) em paralelo; imprime e devolve o resumo."""
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda r: post(*r, retries=retries), requests))
+    wall = time.perf_counter() - t0
+
+    codes = Counter(status for status, _, _, _ in results)
+    ok = sorted(seconds for status, seconds, _, _ in results if status == 200)
+    rejected = sum(r[3] for r in results)
+    row = {'fase': label, 'pedidos': len(results), 'ok': len(ok), 'segundos': wall,
+           'pedidos_s': len(ok) / wall if wall else 0.0}
+    if ok:
+        row.update(p50=statistics.median(ok), p95=ok[min(len(ok) - 1, int(0.95 * len(ok)))], max=ok[-1])
+    print(f"{label:<8} {len(results):>6} {row['pedidos_s']:>8.1f} "
+          + (f"{row['p50'] * 1000:>8.0f} {row['p95'] * 1000:>8.0f} {row['max'] * 1000:>8.0f}" if ok else f"{'-':>8} " * 3)
+          + "  " + ' '.join(f"{code}:{n}" for code, n in sorted(codes.items()))
+          + (f"  ({rejected} x 503 repetidos)" if rejected else ''))
+    for status, _, data, _ in results:
+        if status not in (200, 503):
+            print(f"  erro {status}: {data[:200].decode('utf-8', 'replace')}")
+            break
+    return row, results
+
+
+def wait_ready(url, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError("O serviço terminou ao arrancar.")
+        try:
+            with urllib.request.urlopen(url + '/estado', timeout=2):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Serviço não respondeu em {timeout}s.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None, help="Serviço já a correr (por defeito arranca um em localhost)")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--fila', type=int, default=None)
+    parser.add_argument('--skus', type=int, default=5000)
+    parser.add_argument('--pares', type=int, default=8, help="Pares de workbooks distintos na fase a frio")
+    parser.add_argument('--pedidos', type=int, default=64, help="Pedidos nas fases quente e parquet")
+    parser.add_argument('--concorrencia', type=int, default=16)
+    parser.add_argument('--repeticoes', type=int, default=20, help="Repetições de um 503 na fase a frio")
+    parser.add_argument('--formato', default='parquet', help="parquet, arrow ou csv")
+    parser.add_argument('--data-dir', default=os.path.join(ROOT, 'bench_data'))
+    args = parser.parse_args()
+
+    pairs = []
+    for seed in range(args.pares):
+        val_path, uni_path = ensure_pair(os.path.join(args.data_dir, 'service', str(args.skus), str(seed)), args.skus,
+                                         seed=seed)
+        with open(val_path, 'rb') as fv, open(uni_path, 'rb') as fu:
+            pairs.append(multipart({'valor': fv.read(), 'unidades': fu.read()}))
+
+    process, cache_dir = None, None
+    url = args.url
+    if url is None:
+        cache_dir = tempfile.TemporaryDirectory()
+        cmd = [sys.executable, os.path.join(ROOT, 'pricing_service.py'), '--port', str(args.port)]
+        if args.workers:
+            cmd += ['--workers', str(args.workers)]
+        if args.fila is not None:
+            cmd += ['--fila', str(args.fila)]
+        process = subprocess.Popen(cmd, cwd=ROOT, env={**os.environ, 'PHARMA_CACHE_DIR': cache_dir.name})
+        url = f'http://127.0.0.1:{args.port}'
+    try:
+        wait_ready(url, process)
+        endpoint = f'{url}/pvp?formato={args.formato}&n='
+        print(f"{args.pares} pares x {args.skus} SKUs, concorrência {args.concorrencia}")
+        print(f"{'fase':<8} {'pedidos':>6} {'ped/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'máx ms':>8}  códigos")
+
+        # Clientes bem comportados: um 503 (fila cheia) é repetido depois do Retry-After
+        run_phase('frio', [(endpoint + '6', *pair) for pair in pairs], args.concorrencia, retries=args.repeticoes)
+        run_phase('quente', [(endpoint + str(3 + i % 10), *pairs[i % len(pairs)]) for i in range(args.pedidos)],
+                  args.concorrencia)
+
+        # Dataset já processado: o cliente guarda-o uma vez e depois só envia o Parquet
+        from pricing_service import parse_pair
+        import result_cache
+
+        val_path, uni_path = ensure_pair(os.path.join(args.data_dir, 'service', str(args.skus), '0'), args.skus)
+        buffer = io.BytesIO()
+        result_cache.write_dataset(buffer, *parse_pair(val_path, uni_path, key='load-test'))
+        body = (buffer.getvalue(), 'application/vnd.apache.parquet')
+        run_phase('parquet', [(endpoint + str(3 + i % 10), *body) for i in range(args.pedidos)], args.concorrencia)
+
+        with urllib.request.urlopen(url + '/estado') as response:
+            print(response.read().decode())
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+            cache_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""Benchmark por etapas do pipeline do dashboard sobre workbooks sintéticos.
+
+Etapas medidas separadamente (mesmo código que o app.py usa):
+  parse            leitura em streaming dos dois ficheiros
+  merge            remoção de Totais, junção um-para-um por Cód, arrays por período
+  reverse_cube     cubo (produtos x N) do período por defeito
+  reverse_slice    frame para um N (indexação do cubo)
+  kpis             filtro base, lista de produtos ordenada e KPIs dos cards
+  scenarios        grelha de 5000 cenários de aumento (simulador)
+  charts_build     construção das duas figuras Plotly principais
+  charts_json      serialização das figuras (o que segue pelo websocket)
+  export_xlsx      exportação de todas as linhas em XLSX (botão de download / CLI)
+
+Uso:
+    python benchmarks/run_benchmarks.py --sizes 1000 10000 100000 --output bench_results.json
+    python benchmarks/run_benchmarks.py --compare bench_old.json bench_results.json
+"""
+import argparse
+import datetime
+import functools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+import charts
+import excel_reader
+import export
+import pricing_engine
+import scenarios
+import tables
+from synth_workbooks import ensure_pair
+
+
+def timed(results, stage, fn, repeat=1):
+    """Corre `fn` `repeat` vezes, regista o melhor tempo e devolve o último resultado."""
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    results[stage] = round(best, 6)
+    return out
+
+
+def bench_size(n_skus, data_dir, n_pharmacies=6, repeat=1):
+    folder = os.path.join(data_dir, f"{n_skus}")
+    val_path, uni_path = ensure_pair(folder, n_skus)
+    res = {'skus': n_skus, 'bytes': os.path.getsize(val_path) + os.path.getsize(uni_path)}
+    stages = {}
+
+    read_val, read_uni = timed(stages, 'parse', lambda: excel_reader.read_many([
+        (val_path, pricing_engine.period_columns, [0, 1]),
+        (uni_path, functools.partial(pricing_engine.period_columns, with_product=False), [0]),
+    ]), repeat)
+    dataset = timed(stages, 'merge', lambda: pricing_engine.build_dataset(read_val, read_uni, key='bench'), repeat)
+
+    period = dataset['default_period']
+    df_base = pricing_engine.period_frame(dataset, period)
+    cube = timed(stages, 'reverse_cube', lambda: pricing_engine.build_n_cube(df_base), repeat)
+    sold = np.flatnonzero(df_base['Farm_Qtd'].to_numpy() > 0)
+    df_sold = timed(stages, 'reverse_slice',
+                    lambda: pricing_engine.frame_for_n(df_base, cube, n_pharmacies, rows=sold), repeat)
+
+    def kpis():
+        pricing_engine.product_index(df_sold)
+        return pricing_engine.selection_kpis(df_sold, 0.15)
+    timed(stages, 'kpis', kpis, repeat)
+
+    def scenario_grid():
+        prepared = scenarios.prepare(df_sold['My_PVP'].to_numpy(), df_sold['Others_PVP'].to_numpy(),
+                                     df_sold['Farm_Qtd'].to_numpy(), df_sold['Position'].cat.codes.to_numpy())
+        grid = scenarios.scenario_grid(np.linspace(0, 2, 1250), 'abs')  # 4 regras x 1250 = 5000 cenários
+        return scenarios.simulate(prepared, grid)
+    timed(stages, 'scenarios', scenario_grid, repeat)
+
+    figs = timed(stages, 'charts_build',
+                 lambda: (charts.price_scatter(df_sold), charts.power_matrix(df_sold, n_pharmacies)), repeat)
+    payload = timed(stages, 'charts_json', lambda: [f.to_json() for f in figs], repeat)
+    xlsx = timed(stages, 'export_xlsx', lambda: export.to_bytes(tables.export_frame(df_sold), 'xlsx'), repeat)
+
+    res['rows'] = len(dataset['ids'])
+    # Memória por sessão: o frame processado (as categorias de Produto são partilhadas com o dataset)
+    res['frame_bytes'] = int(df_sold.memory_usage(index=True, deep=False).sum())
+    res['chart_json_bytes'] = sum(len(p) for p in payload)
+    res['export_xlsx_bytes'] = len(xlsx)
+    res['stages'] = stages
+    res['total'] = round(sum(stages.values()), 6)
+    return res
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'engine': 'calamine' if excel_reader.CalamineWorkbook is not None else 'openpyxl',
+        'cpus': os.cpu_count(),
+        'machine': platform.machine(),
+    }
+
+
+def compare(old_path, new_path):
+    """Tabela de razões novo/antigo por tamanho e etapa (< 1 = mais rápido)."""
+    with open(old_path) as f:
+        old = {r['skus']: r for r in json.load(f)['results']}
+    with open(new_path) as f:
+        new = {r['skus']: r for r in json.load(f)['results']}
+    for skus in sorted(set(old) & set(new)):
+        print(f"\n{skus} SKUs")
+        for stage, t_new in new[skus]['stages'].items():
+            t_old = old[skus]['stages'].get(stage)
+            ratio = f"{t_new / t_old:6.2f}x" if t_old else "   n/a"
+            print(f"  {stage:<15} {t_old if t_old is not None else float('nan'):10.4f}s -> {t_new:10.4f}s  {ratio}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--data-dir', default=os.path.join(ROOT, 'bench_data'))
+    parser.add_argument('--n', type=int, default=6)
+    parser.add_argument('--repeat', type=int, default=1, help="Repetições por etapa (regista o melhor tempo)")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', nargs=2, metavar=('ANTIGO', 'NOVO'))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = []
+    for n_skus in args.sizes:
+        res = bench_size(n_skus, args.data_dir, args.n, args.repeat)
+        results.append(res)
+        stages = '  '.join(f"{k}={v:.3f}s" for k, v in res['stages'].items())
+        print(f"{n_skus:>8} SKUs  total={res['total']:.3f}s  {stages}")
+
+    with open(args.output, 'w') as f:
+        json.dump({'meta': metadata(), 'results': results}, f, indent=2)
+    print(f"Resultados guardados em: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Gerador de pares sintéticos ValorVendido.xlsx / UnidadesVendidas.xlsx.
+
+Reproduz o layout das exportações reais lido pelo dashboard:
+  Cód | Produto | Farmácia Total | Farmácia <mês>... | Região Total | Região <mês>...
+(meses do mais recente para o mais antigo, pelo que com 4 meses o mais
+recente fica nas colunas 3 e 8), com uma linha 'Totais' no fim. Inclui casos
+limite reais: produtos sem vendas na farmácia, produtos em que a farmácia é
+praticamente a única a vender (others_qty perto de zero) e médias regionais
+arredondadas a 2 casas decimais.
+
+Uso: python benchmarks/synth_workbooks.py --skus 100000 --out bench_data/100k
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+MONTHS_PT = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
+
+
+def period_labels(n_periods, last_year=2025, last_month=11):
+    """Rótulos 'Mmm/AAAA' do mais recente para o mais antigo."""
+    labels = []
+    year, month = last_year, last_month
+    for _ in range(n_periods):
+        labels.append(f"{MONTHS_PT[month - 1]}/{year}")
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return labels
+
+
+def generate_arrays(n_skus, n_periods=4, n_pharmacies=6, seed=0, zero_share=0.15, sole_seller_share=0.02):
+    """Gera os arrays (produtos x períodos) de valores e quantidades.
+
+    Devolve um dict com 'cod', 'produto', 'periods' e 'Farm_Val', 'Reg_Val',
+    'Farm_Qtd', 'Reg_Qtd' (valores regionais são médias por farmácia).
+    """
+    rng = np.random.default_rng(seed)
+    shape = (n_skus, n_periods)
+
+    # Preços log-normais (0.5€ a centenas de €) e procura de cauda longa
+    base_price = np.round(rng.lognormal(mean=2.3, sigma=0.9, size=n_skus), 2)
+    demand = rng.pareto(1.5, size=n_skus) * 4 + 0.5
+
+    farm_qtd = rng.poisson(demand[:, None], size=shape).astype(float)
+    others_qty = rng.poisson(demand[:, None] * (n_pharmacies - 1) * rng.uniform(0.5, 1.5, size=(n_skus, 1)),
+                             size=shape).astype(float)
+
+    # Produtos que a farmácia não vendeu no período
+    farm_qtd[rng.random(shape) < zero_share] = 0
+
+    # Produtos em que só a farmácia vende: others_qty ~ 0 depois do arredondamento
+    sole = rng.random(n_skus) < sole_seller_share
+    others_qty[sole] = 0
+
+    my_price = base_price[:, None] * rng.normal(1.0, 0.05, size=shape)
+    others_price = base_price[:, None] * rng.normal(1.03, 0.06, size=shape)
+
+    farm_val = np.round(farm_qtd * my_price, 2)
+    others_val = others_qty * others_price
+
+    # As exportações trazem a média regional por farmácia, arredondada
+    reg_qtd = np.round((farm_qtd + others_qty) / n_pharmacies, 2)
+    reg_val = np.round((farm_val + others_val) / n_pharmacies, 2)
+
+    return {
+        'cod': np.arange(1000000, 1000000 + n_skus),
+        'produto': np.array([f"PRODUTO SINTETICO {i:07d}" for i in range(n_skus)], dtype=object),
+        'periods': period_labels(n_periods),
+        'Farm_Val': farm_val, 'Reg_Val': reg_val, 'Farm_Qtd': farm_qtd, 'Reg_Qtd': reg_qtd,
+    }
+
+
+def _write_workbook(path, data, farm_key, reg_key):
+    from openpyxl import Workbook
+
+    periods = data['periods']
+    farm, reg = data[farm_key], data[reg_key]
+    header = (['Cód', 'Produto', 'Farmácia Total'] + [f'Farmácia {p}' for p in periods]
+              + ['Região Total'] + [f'Região {p}' for p in periods])
+
+    # write_only: memória constante mesmo com 1M de linhas
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(header)
+    block = np.column_stack([farm.sum(axis=1), farm, reg.sum(axis=1), reg]).round(2)
+    for cod, prod, values in zip(data['cod'].tolist(), data['produto'], block.tolist()):
+        ws.append([cod, prod] + values)
+    ws.append(['Totais', None] + block.sum(axis=0).round(2).tolist())
+    wb.save(path)
+
+
+def write_pair(out_dir, n_skus, n_periods=4, n_pharmacies=6, seed=0):
+    """Escreve ValorVendido.xlsx e UnidadesVendidas.xlsx em `out_dir`; devolve os caminhos."""
+    os.makedirs(out_dir, exist_ok=True)
+    data = generate_arrays(n_skus, n_periods, n_pharmacies, seed)
+    val_path = os.path.join(out_dir, 'ValorVendido.xlsx')
+    uni_path = os.path.join(out_dir, 'UnidadesVendidas.xlsx')
+    _write_workbook(val_path, data, 'Farm_Val', 'Reg_Val')
+    _write_workbook(uni_path, data, 'Farm_Qtd', 'Reg_Qtd')
+    return val_path, uni_path
+
+
+def ensure_pair(out_dir, n_skus, **kwargs):
+    """Como write_pair, mas reutiliza um par já gerado na mesma pasta."""
+    val_path = os.path.join(out_dir, 'ValorVendido.xlsx')
+    uni_path = os.path.join(out_dir, 'UnidadesVendidas.xlsx')
+    if os.path.exists(val_path) and os.path.exists(uni_path):
+        return val_path, uni_path
+    return write_pair(out_dir, n_skus, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--skus', type=int, default=10000)
+    parser.add_argument('--periods', type=int, default=4)
+    parser.add_argument('--n', type=int, default=6, help="Nº de farmácias na região usado para gerar as médias")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='bench_data')
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    paths = write_pair(args.out, args.skus, args.periods, args.n, args.seed)
+    sizes = ', '.join(f"{os.path.basename(p)} {os.path.getsize(p) / 1e6:.1f} MB" for p in paths)
+    print(f"{args.skus} SKUs x {args.periods} meses em {time.perf_counter() - t0:.1f}s: {sizes}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,76 +1,69 @@
-import pandas as pd
-import numpy as np
+import argparse
+import functools
 
-def calculate_market_pvp(n_pharmacies=6):
+import export
+import profiling
+from excel_reader import read_columns
+from pricing_engine import build_dataset, join_summary, metrics_frame, period_columns, period_frame
+
+def calculate_market_pvp(n_pharmacies=6, period=None, output_file='Analise_PVP_Mercado.xlsx', strict=False):
     print(f"--- Iniciar Análise de PVP de Mercado (N={n_pharmacies}) ---")
+
+    # O pandas só é importado na junção; como etapa própria não fica somado ao 'join' no --profile
+    with profiling.stage('import_pandas'):
+        import pandas  # noqa: F401
     
     # 1. Carregar Dados
-    # Usar dtype object para preservar códigos com zeros à esquerda se necessário, mas aqui parece numérico
-    df_val = pd.read_excel('ValorVendido.xlsx')
-    df_uni = pd.read_excel('UnidadesVendidas.xlsx')
+    # Leitura em streaming apenas de Cód/Produto e dos pares Farmácia/Região de cada mês
+    with profiling.stage('read_excel_valor'):
+        read_val = read_columns('ValorVendido.xlsx', period_columns, text_columns=[0, 1])
+    with profiling.stage('read_excel_unidades'):
+        read_uni = read_columns('UnidadesVendidas.xlsx', functools.partial(period_columns, with_product=False),
+                                text_columns=[0])
+    for r in (read_val, read_uni):
+        print(f"Lidos {r['bytes'] / 1e6:.1f} MB, {r['rows']} linhas em {r['seconds']:.2f}s ({r['engine']})")
 
     # 2. Limpeza e Validação Preliminar
-    # Garantir que estamos a comparar os mesmos produtos. Vamos fazer merge pelo 'Cód'.
-    # Sufixos: _val (faturação), _uni (quantidade)
-    df_merged = pd.merge(
-        df_val[['Cód', 'Produto', 'Farmácia Nov/2025', 'Região Nov/2025']],
-        df_uni[['Cód', 'Farmácia Nov/2025', 'Região Nov/2025']],
-        on='Cód',
-        suffixes=('_val', '_uni')
-    )
+    # Totais removidos e junção um-para-um pelo 'Cód': a mesma etapa usada pelo dashboard
+    dataset = build_dataset(read_val, read_uni, key='cli', strict=strict)
+    join_note = join_summary(dataset['join'])
+    if join_note:
+        print(f"Aviso: {join_note} (duplicados: só a 1ª linha conta; só num ficheiro: ignorados)")
+        for title, key in (("Duplicados", 'duplicates'), ("Só num ficheiro", 'orphans')):
+            for name, codes in dataset['join'][key].items():
+                if codes:
+                    print(f"  {title} em {name}: {', '.join(codes)}")
+    print(f"Períodos disponíveis: {', '.join(dataset['periods'])}")
 
-    print(f"Total de produtos analisados: {len(df_merged)}")
+    # Período a analisar (por defeito o do dataset, o mesmo que o dashboard abre)
+    if period is None:
+        period = dataset['default_period']
+    elif period not in dataset['periods']:
+        raise ValueError(f"Período '{period}' não existe nos dois ficheiros.")
+    col_farm = f'Farmácia {period}'
+    print(f"Período analisado: {period}")
+    print(f"Total de produtos analisados: {len(dataset['ids'])}")
 
     # 3. Implementação da Lógica Matemática
-    
-    # A. Extrair Variáveis
-    my_val = df_merged['Farmácia Nov/2025_val']    # A minha Faturação
-    avg_val_region = df_merged['Região Nov/2025_val'] # Média de Faturação da Região
-    
-    my_qty = df_merged['Farmácia Nov/2025_uni']    # As minhas Unidades
-    avg_qty_region = df_merged['Região Nov/2025_uni'] # Média de Unidades da Região
-
-    # B. Calcular Totais da Região (Extrapolação Inversa)
-    # Total Região = Média * N
-    total_val_region = avg_val_region * n_pharmacies
-    total_qty_region = avg_qty_region * n_pharmacies
-
-    # C. Isolar o "Resto do Mercado" (Outras Farmácias)
-    # Outros = Total Região - Eu
-    others_val = total_val_region - my_val
-    others_qty = total_qty_region - my_qty
-
-    # D. Calcular PVPs (Preço Médio Unitário)
-    # PVP = Faturação / Quantidade
-    
-    # O meu PVP (Validar)
-    # Usamos np.where para evitar divisão por zero
-    df_merged['My_PVP'] = np.where(my_qty > 0, my_val / my_qty, 0)
-    
-    # O PVP do Mercado (Excluindo-me)
-    # Nota: others_qty pode ser 0 ou muito próximo de 0 devido a arredondamentos dos ficheiros originais
-    # Vamos arredondar others_qty para evitar float artifacts perto de zero
-    others_qty = others_qty.round(4)
-    df_merged['Others_PVP'] = np.where(others_qty > 0, others_val / others_qty, 0)
+    # Total Região = Média * N; Outros = Total Região - Eu; PVP = Faturação / Quantidade.
+    # Os cálculos vivem no pricing_engine, partilhado com o dashboard.
+    with profiling.stage('reverse'):
+        df_merged = metrics_frame(period_frame(dataset, period), n_pharmacies)
 
     # 4. Enriquecer Análise
-    # Diferença Percentual: (Meu PVP - PVP Mercado) / PVP Mercado
-    df_merged['Price_Diff_%'] = np.where(
-        df_merged['Others_PVP'] > 0,
-        ((df_merged['My_PVP'] - df_merged['Others_PVP']) / df_merged['Others_PVP']) * 100,
-        0
-    )
+    df_merged['Price_Diff_%'] = df_merged['Diff_Percent']
+    df_merged[f'{col_farm}_uni'] = df_merged['Farm_Qtd']
 
     # Colunas de Controlo (Debug da Lógica)
-    df_merged['Others_Qty_Est'] = others_qty
-    df_merged['Others_Val_Est'] = others_val
+    df_merged['Others_Qty_Est'] = df_merged['Others_Qty']
+    df_merged['Others_Val_Est'] = df_merged['Others_Val']
 
     # 5. Formatar e Apresentar Resultados
     # Reordenar colunas para leitura fácil
     cols = [
         'Cód', 'Produto', 
         'My_PVP', 'Others_PVP', 'Price_Diff_%',
-        'Farmácia Nov/2025_uni', 'Others_Qty_Est'
+        f'{col_farm}_uni', 'Others_Qty_Est'
     ]
     
     final_df = df_merged[cols].copy()
@@ -83,12 +76,12 @@ def calculate_market_pvp(n_pharmacies=6):
 
     print("\n--- Resultados (Top 10 Produtos por Faturação da Farmácia) ---")
     # Ordenar pelos que mais vendemos para ver onde temos impacto
-    print(final_df.sort_values(by='Farmácia Nov/2025_uni', ascending=False).head(10).to_string(index=False))
+    print(final_df.sort_values(by=f'{col_farm}_uni', ascending=False).head(10).to_string(index=False))
 
     print("\n--- Análise Crítica de Discrepâncias ---")
     # Verificar casos onde vendemos muito mas o mercado tem preço muito diferente
     discrepancies = final_df[
-        (final_df['Farmácia Nov/2025_uni'] > 5) & 
+        (final_df[f'{col_farm}_uni'] > 5) & 
         (abs(final_df['Price_Diff_%']) > 10)
     ]
     if not discrepancies.empty:
@@ -97,10 +90,45 @@ def calculate_market_pvp(n_pharmacies=6):
     else:
         print("Nenhuma discrepância significativa encontrada em produtos de alto volume.")
 
-    # Guardar Excel para o user validar
-    output_file = 'Analise_PVP_Mercado.xlsx'
-    final_df.to_excel(output_file, index=False)
+    # Guardar para o user validar (.xlsx em streaming, .csv ou .parquet pela extensão)
+    with profiling.stage('write_output'):
+        export.write(final_df, output_file)
     print(f"\nAnálise completa guardada em: {output_file}")
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Análise de PVP de mercado (ValorVendido.xlsx + UnidadesVendidas.xlsx)")
+    parser.add_argument('--n', type=int, default=6, help="Nº de farmácias na região")
+    parser.add_argument('--periodo', default=None,
+                        help="Período a analisar (ex: Nov/2025); por defeito o das colunas fixas, ou o mais recente")
+    parser.add_argument('--output', default='Analise_PVP_Mercado.xlsx',
+                        help="Ficheiro de resultado: .xlsx, .csv ou .parquet (mais rápido)")
+    parser.add_argument('--estrito', action='store_true',
+                        help="Falha se houver códigos duplicados em vez de usar a 1ª linha")
+    parser.add_argument('--profile', action='store_true',
+                        help="Mede tempo e memória por etapa (tabela no fim e linhas JSON em stderr)")
+    args = parser.parse_args(argv)
+
+    try:
+        export.format_from_path(args.output)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if not args.profile:
+        calculate_market_pvp(n_pharmacies=args.n, period=args.periodo, output_file=args.output,
+                             strict=args.estrito)
+        return
+
+    profiling.configure_log('-')
+    run = profiling.start_run('calculate_pvp', trace_memory=True, n=args.n)
+    try:
+        calculate_market_pvp(n_pharmacies=args.n, period=args.periodo, output_file=args.output,
+                             strict=args.estrito)
+    finally:
+        profiling.end_run(run)
+    print(f"\n--- Perfil por etapa ({run['seconds']:.2f}s) ---")
+    for row in profiling.stages_table(run):
+        print('  ' + '  '.join(f"{k}: {v}" for k, v in row.items()))
+
+
 if __name__ == "__main__":
-    calculate_market_pvp(n_pharmacies=6)
+    main()
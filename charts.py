@@ -0,0 +1,199 @@
+"""Construção das figuras Plotly do dashboard (sem chamadas ao Streamlit).
+
+Os dois scatters principais escolhem o modo de desenho pelo nº de produtos:
+  svg     até WEBGL_THRESHOLD pontos (marcadores SVG, como sempre);
+  webgl   até BINS_THRESHOLD pontos (Scattergl, o browser desenha na GPU);
+  bins    acima disso: densidade em grelha 2-D calculada no servidor e apenas
+          os TOP_OUTLIERS produtos com maior Opportunity_Eur como pontos.
+No modo bins o JSON enviado tem tamanho limitado, independente do nº de SKUs.
+
+O Plotly só é importado dentro das funções que constroem figuras (a primeira
+figura paga ~0,5 s de import): `import charts` fica leve e o arranque do
+dashboard não espera por ele.
+"""
+import numpy as np
+
+POSITION_COLORS = {'Dominante 👑': '#00CC96', 'Competitivo ⚔️': '#636EFA', 'Seguidor 🏃': '#EF553B'}
+
+WEBGL_THRESHOLD = 2000
+BINS_THRESHOLD = 20000
+TOP_OUTLIERS = 500
+N_BINS = 80
+
+
+def apply_dark_theme(fig):
+    """Ajuste para tema escuro (fundo transparente, grelha suave)."""
+    fig.update_layout(
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        font=dict(color="#f0f2f6"),
+        xaxis=dict(showgrid=True, gridcolor='rgba(255,255,255,0.1)'),
+        yaxis=dict(showgrid=True, gridcolor='rgba(255,255,255,0.1)'),
+    )
+    return fig
+
+
+def render_mode(n_points):
+    """'svg', 'webgl' ou 'bins' consoante o nº de pontos."""
+    if n_points > BINS_THRESHOLD:
+        return 'bins'
+    if n_points > WEBGL_THRESHOLD:
+        return 'webgl'
+    return 'svg'
+
+
+def top_outliers(df, k=TOP_OUTLIERS):
+    """Os `k` produtos com maior Opportunity_Eur (desenhados sempre como pontos)."""
+    return df.nlargest(k, 'Opportunity_Eur')
+
+
+def _density_trace(x, y, x_title, y_title, n_bins=N_BINS):
+    """Heatmap com a contagem de produtos por célula, agregada com numpy no servidor."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    ok = np.isfinite(x) & np.isfinite(y)
+    x, y = x[ok], y[ok]
+    # Preços têm cauda longa: a grelha cobre o 99% central e os extremos vão para as células da borda
+    if len(x):
+        x = np.clip(x, *np.percentile(x, [0.5, 99.5]))
+        y = np.clip(y, *np.percentile(y, [0.5, 99.5]))
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=n_bins)
+    z = counts.T
+    z[z == 0] = np.nan  # células vazias ficam transparentes
+    import plotly.graph_objects as go
+
+    return go.Heatmap(
+        x=(x_edges[:-1] + x_edges[1:]) / 2, y=(y_edges[:-1] + y_edges[1:]) / 2, z=z,
+        colorscale=[[0, 'rgba(170,170,190,0.15)'], [1, 'rgba(170,170,190,0.9)']],
+        showscale=False, name="Densidade",
+        hovertemplate=f"{x_title}: %{{x:.2f}}<br>{y_title}: %{{y:.2f}}<br>Produtos: %{{z}}<extra></extra>",
+    )
+
+
+def _scatter_input(df, mode):
+    """Pontos a enviar e render_mode do plotly.express para o modo escolhido."""
+    if mode is None:
+        mode = render_mode(len(df))
+    points = top_outliers(df) if mode == 'bins' else df
+    return mode, points, 'svg' if mode == 'svg' else 'webgl'
+
+
+def _add_density(fig, df, x, y, x_title, y_title):
+    # A densidade vai para trás dos pontos
+    fig.add_trace(_density_trace(df[x], df[y], x_title, y_title))
+    fig.data = (fig.data[-1],) + fig.data[:-1]
+
+
+def price_scatter(df, mode=None):
+    """Tab 1: Preço de Mercado vs Meu Preço, colorido pela diferença (%)."""
+    import plotly.express as px
+
+    mode, points, px_mode = _scatter_input(df, mode)
+    fig = px.scatter(
+        points, x="Others_PVP", y="My_PVP", size="Farm_Qtd", color="Diff_Percent",
+        color_continuous_scale="RdBu_r", range_color=[-30, 30],
+        labels={
+            "Others_PVP": "Preço Mercado (€)",
+            "My_PVP": "Meu Preço (€)",
+            "Diff_Percent": "Diferença (%)",
+            "Farm_Qtd": "Vendas (Qtd)",
+            "Opportunity_Eur": "Oportunidade (€)"
+        },
+        hover_name="Produto", hover_data={'Opportunity_Eur':':.2f', 'Diff_Percent':':.1f%'},
+        render_mode=px_mode
+    )
+    if mode == 'bins':
+        _add_density(fig, df, "Others_PVP", "My_PVP", "Preço Mercado (€)", "Meu Preço (€)")
+    # Linha de Igualdade
+    max_val = max(df['My_PVP'].max(), df['Others_PVP'].max())
+    fig.add_shape(type="line", x0=0, y0=0, x1=max_val, y1=max_val, line=dict(color="Gray", dash="dash"))
+    return apply_dark_theme(fig)
+
+
+def power_matrix(df, n_pharmacies, mode=None):
+    """Tab 2: Matriz de Poder (Quota vs Diferença de Preço)."""
+    import plotly.express as px
+
+    mode, points, px_mode = _scatter_input(df, mode)
+    fig = px.scatter(
+        points, x="Market_Share_Qty", y="Diff_Percent", size="Farm_Qtd", color="Position",
+        color_discrete_map=POSITION_COLORS,
+        labels={
+            "Market_Share_Qty": "Minha Quota (%)",
+            "Diff_Percent": "Diferença Preço (%)",
+            "My_PVP": "Meu Preço (€)",
+            "Others_PVP": "Preço Mercado (€)",
+            "Farm_Qtd": "Vendas (Qtd)",
+            "Position": "Posição"
+        },
+        hover_name="Produto", hover_data={'My_PVP':':.2f', 'Others_PVP':':.2f'},
+        render_mode=px_mode
+    )
+    if mode == 'bins':
+        _add_density(fig, df, "Market_Share_Qty", "Diff_Percent", "Minha Quota (%)", "Diferença Preço (%)")
+    fig.add_hline(y=0, line_dash="solid", line_color="gray")
+    fig.add_vline(x=100/n_pharmacies, line_dash="dot", line_color="gray", annotation_text="Quota Média")
+    return apply_dark_theme(fig)
+
+
+def scenario_surface(surface, values, rules, unit):
+    """Tab Cenários: ganho (€) por aumento e regra de Posição."""
+    import plotly.express as px
+
+    fig = px.imshow(
+        surface, x=values, y=rules, aspect='auto', color_continuous_scale='Viridis',
+        labels={'x': f"Aumento ({unit})", 'y': "Produtos a aumentar", 'color': "Ganho (€)"}
+    )
+    fig.update_traces(hovertemplate=f"+%{{x:.2f}}{unit} · %{{y}}<br>Ganho: %{{z:,.2f}}€<extra></extra>")
+    return apply_dark_theme(fig)
+
+
+def trend_figures(trends):
+    """Tab Evolução: PVP médio (meu vs mercado) e Oportunidade por período."""
+    import plotly.express as px
+
+    fig_trend = px.line(
+        trends.melt(id_vars='Período', value_vars=['My_PVP', 'Others_PVP'], var_name='Série', value_name='PVP'),
+        x="Período", y="PVP", color="Série", markers=True,
+        color_discrete_map={'My_PVP': '#00e5ff', 'Others_PVP': '#d900ff'},
+        labels={"PVP": "PVP Médio (€)"}
+    )
+    fig_opp = px.bar(
+        trends, x="Período", y="Opportunity_Eur",
+        labels={"Opportunity_Eur": "Oportunidade (€)"}
+    )
+    return apply_dark_theme(fig_trend), apply_dark_theme(fig_opp)
+
+
+def diff_lines(df_diff):
+    """Tab Evolução: diferença de preço (%) por período de cada produto selecionado."""
+    import plotly.express as px
+
+    fig = px.line(
+        df_diff.melt(id_vars='Produto', var_name='Período', value_name='Diff_Percent'),
+        x="Período", y="Diff_Percent", color="Produto", markers=True,
+        labels={"Diff_Percent": "Diferença Preço (%)"}
+    )
+    fig.add_hline(y=0, line_dash="solid", line_color="gray")
+    return apply_dark_theme(fig)
+
+
+def sensitivity_figures(summary, n_pharmacies):
+    """Tab Sensibilidade: Oportunidade total e nº de produtos por Posição para cada N."""
+    import plotly.express as px
+
+    fig_sens = px.line(
+        summary.reset_index(), x="N", y="Opportunity_Eur", markers=True,
+        labels={"N": "Nº Farmácias na Região", "Opportunity_Eur": "Oportunidade Total (€)"}
+    )
+    fig_sens.add_vline(x=n_pharmacies, line_dash="dot", line_color="gray", annotation_text="N atual")
+
+    pos_long = summary.drop(columns='Opportunity_Eur').reset_index().melt(
+        id_vars='N', var_name='Posição', value_name='Produtos'
+    )
+    fig_pos = px.area(
+        pos_long, x="N", y="Produtos", color="Posição",
+        color_discrete_map=POSITION_COLORS,
+        labels={"N": "Nº Farmácias na Região"}
+    )
+    return apply_dark_theme(fig_sens), apply_dark_theme(fig_pos)
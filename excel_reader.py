@@ -0,0 +1,222 @@
+import io
+import math
+import os
+import time
+import multiprocessing
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+try:
+    # Motor opcional em Rust, bastante mais rápido que o openpyxl
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+
+def _open_bytes(source):
+    """Aceita caminho, bytes ou file-like e devolve (BytesIO, nº de bytes)."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = bytes(source)
+    elif hasattr(source, 'getvalue'):
+        data = source.getvalue()
+    elif hasattr(source, 'read'):
+        data = source.read()
+    else:
+        with open(source, 'rb') as f:
+            data = f.read()
+    return io.BytesIO(data), len(data)
+
+
+def _iter_rows_openpyxl(buffer, max_col):
+    from openpyxl import load_workbook
+
+    # read_only: o XML é lido em streaming, linha a linha, sem construir células
+    wb = load_workbook(buffer, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        # Há exportadores que escrevem um <dimension ref="A1"/> desatualizado e o modo
+        # read_only confia nele; como no leitor openpyxl do pandas, ignora-se a dimensão
+        ws.reset_dimensions()
+        for row in ws.iter_rows(max_col=max_col, values_only=True):
+            yield row
+    finally:
+        wb.close()
+
+
+def _iter_rows_calamine(buffer, max_col):
+    sheet = CalamineWorkbook.from_filelike(buffer).get_sheet_by_index(0)
+    rows = sheet.iter_rows() if hasattr(sheet, 'iter_rows') else sheet.to_python()
+    for row in rows:
+        yield row[:max_col]
+
+
+def _to_float(value):
+    if value is None or value == '':
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        # Equivalente a pd.to_numeric(errors='coerce')
+        return math.nan
+
+
+def read_columns(source, columns, text_columns=(), engine=None):
+    """Lê apenas as colunas pedidas da primeira folha de um Excel.
+
+    `columns` aceita índices (int) ou nomes do cabeçalho (str), ou uma função
+    que recebe o cabeçalho completo e devolve essa lista (útil quando as
+    colunas só se conhecem depois de ler o cabeçalho). As colunas em
+    `text_columns` (mesma notação) ficam como arrays de objetos; as restantes
+    são convertidas para float64 à medida que as linhas são lidas, sem nunca
+    materializar as outras colunas do ficheiro.
+
+    Devolve um dict com 'source_header' (cabeçalho completo do ficheiro),
+    'header' (nomes das colunas pedidas), 'arrays'
+    (um array NumPy por coluna, pela ordem pedida) e as estatísticas da
+    leitura: 'engine', 'bytes', 'rows' e 'seconds'.
+    """
+    if engine is None:
+        engine = 'calamine' if CalamineWorkbook is not None else 'openpyxl'
+    iter_rows = _iter_rows_calamine if engine == 'calamine' else _iter_rows_openpyxl
+
+    t0 = time.perf_counter()
+    buffer, n_bytes = _open_bytes(source)
+
+    # Com nomes, o cabeçalho inteiro é necessário para resolver os índices
+    by_name = callable(columns) or any(isinstance(c, str) for c in list(columns) + list(text_columns))
+    max_col = None if by_name else max(columns) + 1
+
+    rows = iter_rows(buffer, max_col)
+    try:
+        full_header = [str(h) if h is not None else '' for h in next(rows)]
+    except StopIteration:
+        raise ValueError("Ficheiro Excel vazio.")
+    if callable(columns):
+        columns = columns(full_header)
+
+    def resolve(col):
+        if isinstance(col, str):
+            if col not in full_header:
+                raise KeyError(f"Coluna '{col}' não encontrada no ficheiro.")
+            return full_header.index(col)
+        if col >= len(full_header):
+            raise IndexError(f"Coluna {col} fora do ficheiro ({len(full_header)} colunas).")
+        return col
+
+    idx = [resolve(c) for c in columns]
+    text_idx = {resolve(c) for c in text_columns}
+    buffers = [[] if i in text_idx else array('d') for i in idx]
+    is_text = [i in text_idx for i in idx]
+
+    n_rows = 0
+    for row in rows:
+        values = [row[i] if i < len(row) else None for i in idx]
+        # Linhas totalmente vazias (formatação residual no fim da folha)
+        if all(v is None or v == '' for v in values):
+            continue
+        for buf, text, v in zip(buffers, is_text, values):
+            buf.append(v if text else _to_float(v))
+        n_rows += 1
+
+    arrays = []
+    for buf, text in zip(buffers, is_text):
+        if text:
+            arr = np.empty(len(buf), dtype=object)
+            arr[:] = buf
+        else:
+            arr = np.frombuffer(buf, dtype=np.float64) if len(buf) else np.empty(0)
+        arrays.append(arr)
+
+    return {
+        'source_header': full_header,
+        'header': [full_header[i] for i in idx],
+        'arrays': arrays,
+        'engine': engine,
+        'bytes': n_bytes,
+        'rows': n_rows,
+        'seconds': time.perf_counter() - t0,
+    }
+
+
+def read_header(source, engine=None):
+    """Lê apenas a linha de cabeçalho da primeira folha."""
+    if engine is None:
+        engine = 'calamine' if CalamineWorkbook is not None else 'openpyxl'
+    iter_rows = _iter_rows_calamine if engine == 'calamine' else _iter_rows_openpyxl
+    buffer, _ = _open_bytes(source)
+    rows = iter_rows(buffer, None)
+    try:
+        return [str(h) if h is not None else '' for h in next(rows)]
+    except StopIteration:
+        raise ValueError("Ficheiro Excel vazio.")
+    finally:
+        rows.close()
+
+
+# Pool partilhado pelo processo (Streamlit reutiliza-o entre sessões e reruns).
+# É criado uma vez e só substituído quando parte (um worker morto, ex: sem memória):
+# outras sessões podem estar a submeter-lhe trabalho. Com cpu_count workers não há
+# pedido que precise de mais; os processos só arrancam quando há trabalho para eles.
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def _get_pool(max_workers):
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            # 'spawn' é seguro dentro de processos com threads (servidor Streamlit)
+            _POOL = ProcessPoolExecutor(max_workers=max(max_workers, os.cpu_count() or 1),
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _POOL
+
+
+def _reset_pool(broken):
+    # Um pool partido recusa todo o trabalho seguinte; o próximo _get_pool cria outro
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is broken:
+            _POOL = None
+            broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _read_job(job):
+    source, columns, text_columns = job
+    return read_columns(source, columns, text_columns)
+
+
+def read_many(jobs, max_workers=None):
+    """Lê vários ficheiros em paralelo num ProcessPoolExecutor.
+
+    Cada job é um tuplo (source, columns, text_columns) com a mesma semântica
+    de `read_columns`. O parse do openpyxl é CPU puro em Python, por isso só
+    processos (e não threads) o aceleram. Os resultados regressam como arrays
+    NumPy (e não DataFrames), o que mantém o custo de pickling baixo.
+
+    Devolve a lista de resultados pela ordem dos jobs; as exceções dos
+    workers são relançadas tal como em `read_columns`. Com `max_workers`
+    <= 1 lê no próprio processo; senão usa o pool partilhado, dimensionado
+    na primeira chamada. Se um worker morrer, o pool é recriado e a leitura
+    repetida uma vez.
+    """
+    jobs = list(jobs)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, len(jobs))
+    if max_workers <= 1:
+        return [_read_job(job) for job in jobs]
+
+    for attempt in range(2):
+        pool = _get_pool(max_workers)
+        try:
+            return list(pool.map(_read_job, jobs))
+        except BrokenProcessPool:
+            _reset_pool(pool)
+            if attempt:
+                raise
@@ -0,0 +1,177 @@
+"""Exportação dos resultados em Parquet, CSV ou XLSX (sem Streamlit).
+
+Partilhado pelo dashboard (botão de download) e pelas CLIs. O XLSX não passa
+pelo openpyxl: o XML da folha é gerado por blocos de linhas, coluna a coluna
+com NumPy, e escrito em streaming para dentro do zip. Não há objetos por
+célula, pelo que a memória não cresce com o nº de linhas e a escrita é
+bem mais rápida que o `DataFrame.to_excel`.
+"""
+import io
+import os
+import re
+import zipfile
+
+import numpy as np
+
+# Formato -> (extensão, tipo MIME)
+FORMATS = {
+    'xlsx': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('.csv', 'text/csv'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+
+# Linhas geradas de cada vez na escrita do XLSX
+XLSX_CHUNK_ROWS = 10_000
+
+
+def format_from_path(path):
+    """Formato pela extensão do ficheiro ('xlsx', 'csv' ou 'parquet')."""
+    ext = os.path.splitext(path)[1].lower()
+    for fmt, (fmt_ext, _) in FORMATS.items():
+        if ext == fmt_ext:
+            return fmt
+    raise ValueError(f"Formato de exportação não suportado: '{ext}' (use {', '.join(e for e, _ in FORMATS.values())})")
+
+
+def write(df, target, fmt=None):
+    """Escreve `df` em `target` (caminho ou file-like binário); por defeito o formato vem da extensão."""
+    fmt = fmt or format_from_path(target)
+    if fmt == 'parquet':
+        _write_parquet(df, target)
+    elif fmt == 'csv':
+        _write_csv(df, target)
+    elif fmt == 'xlsx':
+        _write_xlsx(df, target)
+    else:
+        raise ValueError(f"Formato de exportação não suportado: '{fmt}'")
+
+
+def to_bytes(df, fmt):
+    """Ficheiro exportado em memória (para o botão de download)."""
+    buffer = io.BytesIO()
+    write(df, buffer, fmt)
+    return buffer.getvalue()
+
+
+def _write_parquet(df, target):
+    # Cód mistura inteiros e texto nos ficheiros originais; inteiro puro fica inteiro
+    if 'Cód' in df.columns and df['Cód'].dtype.kind not in 'iu':
+        df = df.assign(**{'Cód': df['Cód'].astype(str)})
+    df.to_parquet(target, index=False)
+
+
+def _write_csv(df, target):
+    # utf-8-sig: o Excel abre os acentos corretamente
+    if hasattr(target, 'write'):
+        wrapper = io.TextIOWrapper(target, encoding='utf-8-sig', newline='')
+        df.to_csv(wrapper, index=False)
+        wrapper.detach()
+    else:
+        df.to_csv(target, index=False, encoding='utf-8-sig')
+
+
+# Carateres de controlo não são permitidos em XML
+_ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _xml_escape(values):
+    return [_ILLEGAL_XML.sub('', v).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;') for v in values]
+
+
+def _string_cells(values):
+    return np.array(['<c t="inlineStr"><is><t xml:space="preserve">' + v + '</t></is></c>' for v in _xml_escape(values)],
+                    dtype=object)
+
+
+def _column_cells(series, start, stop):
+    """XML das células de um bloco de uma coluna (uma string por linha)."""
+    import pandas as pd
+
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Categorias escapadas uma única vez; as linhas só indexam pelos códigos
+        cats = np.append(_string_cells([str(c) for c in series.cat.categories]), '<c/>')
+        return cats[series.cat.codes.to_numpy()[start:stop]]
+    values = series.to_numpy()[start:stop]
+    if values.dtype.kind in 'iub':
+        return np.char.add(np.char.add('<c><v>', values.astype(np.int64).astype(str)), '</v></c>').astype(object)
+    if values.dtype.kind == 'f':
+        values = values.astype(np.float64)
+        out = np.char.add(np.char.add('<c><v>', values.astype(str)), '</v></c>').astype(object)
+        out[~np.isfinite(values)] = '<c/>'
+        return out
+    missing = pd.isna(values)
+    out = _string_cells(['' if m else str(v) for v, m in zip(values, missing)])
+    out[missing] = '<c/>'
+    return out
+
+
+def _write_xlsx(df, target):
+    """XLSX mínimo escrito em streaming: XML da folha gerado por blocos diretamente no zip."""
+    with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for name, xml in _XLSX_PARTS.items():
+            zf.writestr(name, xml)
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as raw:
+            out = io.TextIOWrapper(raw, encoding='utf-8')
+            out.write(_SHEET_HEAD)
+            out.write('<row>' + ''.join(_string_cells([str(c) for c in df.columns])) + '</row>')
+            columns = [df[c] for c in df.columns]
+            for start in range(0, len(df), XLSX_CHUNK_ROWS):
+                stop = min(start + XLSX_CHUNK_ROWS, len(df))
+                cells = [_column_cells(s, start, stop) for s in columns]
+                out.write(''.join('<row>' + ''.join(row) + '</row>' for row in zip(*cells)))
+            out.write('</sheetData></worksheet>')
+            out.flush()
+            out.detach()
+
+
+_NS = 'http://schemas.openxmlformats.org'
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    f'<worksheet xmlns="{_NS}/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+    '</sheetView></sheetViews><sheetData>'
+)
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<Types xmlns="{_NS}/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<Relationships xmlns="{_NS}/package/2006/relationships">'
+        f'<Relationship Id="rId1" Type="{_NS}/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<workbook xmlns="{_NS}/spreadsheetml/2006/main" xmlns:r="{_NS}/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Dados" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<Relationships xmlns="{_NS}/package/2006/relationships">'
+        f'<Relationship Id="rId1" Type="{_NS}/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        f'<Relationship Id="rId2" Type="{_NS}/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<styleSheet xmlns="{_NS}/spreadsheetml/2006/main">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
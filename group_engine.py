@@ -0,0 +1,200 @@
+"""Modo grupo: várias farmácias próprias na mesma região (sem Streamlit).
+
+A análise por loja assume que só uma das N farmácias da região é nossa:
+    others = Reg * N - Farm
+Com k lojas do grupo na região, as vendas das outras k-1 entram como
+"concorrência". Aqui os datasets de todas as lojas são empilhados numa só
+tabela (linhas loja x Cód), agrupados por (região, Cód) com factorize e
+somados com bincount, para todos os períodos de uma vez:
+    others = Reg * N - Σ Farm das lojas do grupo,   concorrentes = N - k
+Daí sai o PVP real da concorrência e a quota do grupo, que voltam a cada
+loja por indexação (diferencial e oportunidade por loja). O custo é linear
+no nº total de linhas, sem ciclos Python por loja nem por produto.
+
+Reg_Val/Reg_Qtd são a média regional por farmácia, igual nos ficheiros de
+todas as lojas da região; usa-se a média das lojas que listam o produto e
+conta-se no relatório onde diferem (lojas atribuídas à região errada).
+"""
+import numpy as np
+
+import pricing_engine
+
+ARRAYS = ('Farm_Val', 'Reg_Val', 'Farm_Qtd', 'Reg_Qtd')
+
+# Diferença relativa entre lojas no valor regional a partir da qual se assinala
+REGION_TOLERANCE = 0.01
+
+
+def stack_stores(datasets, regions):
+    """Empilha os datasets (um por loja) nos períodos comuns.
+
+    `regions` tem a região de cada loja. Devolve um dict com, por linha
+    (loja x Cód), 'store', 'region', 'cod', 'produto' e os arrays
+    (linhas x períodos) de ARRAYS, mais 'periods', 'default_period' (a regra
+    de `pricing_engine.build_dataset`: o da primeira loja que o tenha nos
+    períodos comuns, senão o mais recente), 'region_labels' e
+    'stores_per_region' (k por região).
+    """
+    import pandas as pd
+
+    periods = [p for p in datasets[0]['periods'] if all(p in ds['periods'] for ds in datasets[1:])]
+    if not periods:
+        raise ValueError("As lojas não têm períodos em comum.")
+
+    default_period = next((ds['default_period'] for ds in datasets if ds['default_period'] in periods), periods[-1])
+
+    region_codes, region_labels = pd.factorize(np.asarray(regions, dtype=object))
+    sizes = np.array([len(ds['ids']) for ds in datasets])
+    store = np.repeat(np.arange(len(datasets)), sizes)
+    stacked = {
+        'periods': periods,
+        'default_period': default_period,
+        'store': store,
+        'region': region_codes[store],
+        'region_labels': list(region_labels),
+        'stores_per_region': np.bincount(region_codes, minlength=len(region_labels)),
+        'cod': np.concatenate([ds['ids']['Cód'].to_numpy() for ds in datasets]),
+        'produto': np.concatenate([ds['ids']['Produto'].to_numpy(dtype=object) for ds in datasets]),
+    }
+    for col in ARRAYS:
+        stacked[col] = np.concatenate([
+            ds[col] if ds['periods'] == periods else ds[col][:, [ds['periods'].index(p) for p in periods]]
+            for ds in datasets
+        ])
+    return stacked
+
+
+def build_group_panel(stacked, n_by_region):
+    """Engenharia reversa por (região, Cód) e período, com todas as lojas do grupo subtraídas.
+
+    `n_by_region` dá o N (farmácias na região, incluindo as nossas) de cada
+    região. Devolve um dict com 'group' (grupo de cada linha), e por grupo
+    'region', 'cod', 'first' (1ª linha), 'listed' (lojas que listam o Cód),
+    o Produto em códigos ('name_codes' por Cód, 'names'),
+    'own' (k), 'N', 'Group_Val', 'Group_Qty', 'Reg_Val', 'Reg_Qtd' e as
+    métricas de `pricing_engine.reverse_engineer` (grupos x períodos), em
+    que My_PVP é o PVP médio do grupo e Market_Share_Qty a quota do grupo.
+    """
+    import pandas as pd
+
+    labels = stacked['region_labels']
+    missing = [r for r in labels if r not in n_by_region]
+    if missing:
+        raise ValueError(f"Sem N para as regiões: {', '.join(map(str, missing))}")
+    n_region = np.array([n_by_region[r] for r in labels], dtype=float)
+    own_region = stacked['stores_per_region']
+    short = np.flatnonzero(n_region < own_region)
+    if len(short):
+        raise ValueError("N menor que o nº de lojas do grupo: " + ', '.join(
+            f"{labels[r]} (N={n_region[r]:.0f}, {own_region[r]} lojas)" for r in short))
+
+    # Grupo = (região, Cód): códigos de Cód num índice de hash e chave inteira combinada
+    cod_codes, cod_uniques = pd.factorize(stacked['cod'])
+    n_cod = max(len(cod_uniques), 1)
+    g, keys = pd.factorize(stacked['region'].astype(np.int64) * n_cod + cod_codes)
+    n_groups = len(keys)
+    region = (keys // n_cod).astype(np.intp)
+
+    first = np.full(n_groups, len(g), dtype=np.int64)
+    np.minimum.at(first, g, np.arange(len(g)))
+    listed = np.bincount(g, minlength=n_groups)
+
+    # Produto pelo primeiro ficheiro onde o Cód aparece, como categórico (igual para todas as lojas)
+    cod_of_group = keys % n_cod
+    first_cod = np.full(n_cod, len(g), dtype=np.int64)
+    np.minimum.at(first_cod, cod_of_group, first)
+    name_codes, names = pd.factorize(stacked['produto'][first_cod[:len(cod_uniques)]])
+
+    # Índice plano (grupo, período): um só bincount por array para todos os períodos
+    n_periods = len(stacked['periods'])
+    flat = (g[:, None] * n_periods + np.arange(n_periods)).ravel()
+
+    def group_sum(values):
+        return np.bincount(flat, weights=values.ravel(), minlength=n_groups * n_periods).reshape(n_groups, n_periods)
+
+    panel = {
+        'group': g, 'region': region, 'cod': np.asarray(cod_uniques)[cod_of_group], 'first': first,
+        'cod_codes': cod_codes, 'cod_of_group': cod_of_group, 'name_codes': name_codes, 'names': names,
+        'listed': listed, 'own': own_region[region], 'N': n_region[region],
+        'Group_Val': group_sum(stacked['Farm_Val']),
+        'Group_Qty': group_sum(stacked['Farm_Qtd']),
+    }
+    mismatch = np.zeros(n_groups, dtype=bool)
+    for col in ('Reg_Val', 'Reg_Qtd'):
+        mean = group_sum(stacked[col]) / listed[:, None]
+        spread = np.sqrt(np.maximum(group_sum(stacked[col] ** 2) / listed[:, None] - mean ** 2, 0))
+        mismatch |= (spread > REGION_TOLERANCE * np.abs(mean) + 0.005).any(axis=1)
+        panel[col] = mean
+
+    panel.update(pricing_engine.reverse_engineer(
+        panel['Group_Val'], panel['Reg_Val'], panel['Group_Qty'], panel['Reg_Qtd'],
+        panel['N'][:, None], n_own=panel['own'][:, None],
+    ))
+    panel['report'] = {
+        'stores': int(own_region.sum()), 'regions': len(labels), 'rows': len(g), 'groups': n_groups,
+        'region_mismatch': int(mismatch.sum()),
+        'mismatch_by_region': {labels[r]: int(c) for r, c in
+                               enumerate(np.bincount(region[mismatch], minlength=len(labels))) if c},
+    }
+    return panel
+
+
+def group_frames(stacked, panel, period, store_names):
+    """Frames de um período: (linhas por loja x Cód, linhas por região x Cód).
+
+    Por loja: o seu PVP contra o PVP real da concorrência, quota da loja e do
+    grupo, Posição pela quota do grupo e oportunidade. Por região: totais do
+    grupo, concorrência e oportunidade somada das lojas.
+    """
+    import pandas as pd
+
+    t = stacked['periods'].index(period)
+    g = panel['group']
+    farm_val = stacked['Farm_Val'][:, t]
+    farm_qtd = stacked['Farm_Qtd'][:, t]
+    others_pvp = panel['Others_PVP'][g, t]
+
+    my_pvp = np.divide(farm_val, farm_qtd, out=np.zeros(len(g)), where=farm_qtd > 0)
+    diff = np.divide((my_pvp - others_pvp) * 100, others_pvp, out=np.zeros(len(g)),
+                     where=(others_pvp > 0) & (my_pvp > 0))
+    total_qty = (panel['Reg_Qtd'][:, t] * panel['N'])[g]
+    share = np.divide(farm_qtd, total_qty, out=np.zeros(len(g)), where=total_qty > 0.001) * 100
+    opportunity = np.where(my_pvp < others_pvp, (others_pvp - my_pvp) * farm_qtd, 0)
+
+    regions = stacked['region_labels']
+    stores = pd.DataFrame({
+        'Farmácia': pd.Categorical.from_codes(stacked['store'], store_names),
+        'Região': pd.Categorical.from_codes(stacked['region'], regions),
+        'N': panel['N'][g].astype(np.int64),
+        'Cód': stacked['cod'],
+        'Produto': pd.Categorical.from_codes(panel['name_codes'][panel['cod_codes']], panel['names']),
+        'Farm_Val': farm_val,
+        'Farm_Qtd': farm_qtd,
+        'My_PVP': my_pvp,
+        'Others_PVP': others_pvp,
+        'Diff_Percent': diff,
+        'Market_Share_Qty': share,
+        'Group_Share_Qty': panel['Market_Share_Qty'][g, t],
+        'Position': pd.Categorical.from_codes(panel['Position'][g, t], pricing_engine.POSITION_LABELS),
+        'Suggested_Price': others_pvp,
+        'Opportunity_Eur': opportunity,
+    })
+
+    groups = pd.DataFrame({
+        'Região': pd.Categorical.from_codes(panel['region'], regions),
+        'Cód': panel['cod'],
+        'Produto': pd.Categorical.from_codes(panel['name_codes'][panel['cod_of_group']], panel['names']),
+        'N': panel['N'].astype(np.int64),
+        'Own_Stores': panel['own'],
+        'Listed_Stores': panel['listed'],
+        'Group_Val': panel['Group_Val'][:, t],
+        'Group_Qty': panel['Group_Qty'][:, t],
+        'Reg_Val': panel['Reg_Val'][:, t],
+        'Reg_Qtd': panel['Reg_Qtd'][:, t],
+    })
+    for col in ('Others_Val', 'Others_Qty', 'Avg_Unit_Others', 'Market_Share_Qty', 'My_PVP', 'Others_PVP',
+                'Diff_Percent'):
+        groups[col] = panel[col][:, t]
+    groups['Position'] = pd.Categorical.from_codes(panel['Position'][:, t], pricing_engine.POSITION_LABELS)
+    groups['Opportunity_Eur'] = np.bincount(g, weights=opportunity, minlength=len(panel['cod']))
+    return stores, groups
@@ -0,0 +1,219 @@
+"""Histórico local (SQLite) dos dados de vendas, indexado por farmácia, Cód e período.
+
+Guarda apenas os valores de entrada (independentes de N): as métricas de
+engenharia reversa são recalculadas pelo pricing_engine na leitura.
+
+Uso:
+    python history_store.py --farmacia "Farmácia Central" ingest ValorVendido.xlsx UnidadesVendidas.xlsx
+    python history_store.py --farmacia "Farmácia Central" gap 1234567 --n 6
+"""
+import argparse
+import functools
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+import excel_reader
+import pricing_engine
+
+DEFAULT_DB = os.environ.get('PHARMA_HISTORY_DB', 'historico.db')
+DEFAULT_PHARMACY = 'Minha Farmácia'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    cod TEXT PRIMARY KEY,
+    produto TEXT
+);
+CREATE TABLE IF NOT EXISTS periods (
+    pharmacy TEXT NOT NULL,
+    period TEXT NOT NULL,
+    ingested_at REAL NOT NULL,
+    source TEXT,
+    PRIMARY KEY (pharmacy, period)
+);
+CREATE TABLE IF NOT EXISTS sales (
+    pharmacy TEXT NOT NULL,
+    cod TEXT NOT NULL,
+    period TEXT NOT NULL,
+    farm_val REAL NOT NULL,
+    reg_val REAL NOT NULL,
+    farm_qtd REAL NOT NULL,
+    reg_qtd REAL NOT NULL,
+    PRIMARY KEY (pharmacy, cod, period)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_sales_period ON sales (pharmacy, period, cod);
+"""
+
+
+def connect(path=DEFAULT_DB):
+    """Abre (e cria se necessário) a base de dados do histórico."""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def stored_periods(conn, pharmacy=DEFAULT_PHARMACY):
+    """Períodos já guardados para uma farmácia, por ordem cronológica."""
+    rows = conn.execute('SELECT period FROM periods WHERE pharmacy = ?', (pharmacy,)).fetchall()
+    return sorted((r[0] for r in rows), key=pricing_engine.period_sort_key)
+
+
+def pharmacies(conn):
+    return [r[0] for r in conn.execute('SELECT DISTINCT pharmacy FROM periods ORDER BY pharmacy')]
+
+
+def append_dataset(conn, dataset, pharmacy=DEFAULT_PHARMACY, periods=None, source=''):
+    """Grava períodos de um dataset (por defeito apenas os que ainda não existem).
+
+    Devolve a lista de períodos escritos.
+    """
+    if periods is None:
+        existing = set(stored_periods(conn, pharmacy))
+        periods = [p for p in dataset['periods'] if p not in existing]
+    if not periods:
+        return []
+
+    codes = dataset['ids']['Cód'].astype(str).to_numpy()
+    names = dataset['ids']['Produto'].astype(str).to_numpy()
+    now = time.time()
+    with conn:
+        conn.executemany(
+            'INSERT INTO products (cod, produto) VALUES (?, ?) '
+            'ON CONFLICT (cod) DO UPDATE SET produto = excluded.produto',
+            zip(codes.tolist(), names.tolist())
+        )
+        for period in periods:
+            t = dataset['periods'].index(period)
+            conn.executemany(
+                'INSERT OR REPLACE INTO sales VALUES (?, ?, ?, ?, ?, ?, ?)',
+                zip([pharmacy] * len(codes), codes.tolist(), [period] * len(codes),
+                    dataset['Farm_Val'][:, t].tolist(), dataset['Reg_Val'][:, t].tolist(),
+                    dataset['Farm_Qtd'][:, t].tolist(), dataset['Reg_Qtd'][:, t].tolist())
+            )
+            conn.execute('INSERT OR REPLACE INTO periods VALUES (?, ?, ?, ?)', (pharmacy, period, now, source))
+    return list(periods)
+
+
+def ingest_workbooks(conn, val_source, uni_source, pharmacy=DEFAULT_PHARMACY):
+    """Ingestão incremental: só os meses que ainda não estão no histórico são lidos.
+
+    Os cabeçalhos são lidos primeiro; as colunas dos meses já guardados
+    nunca chegam a ser convertidas. Devolve a lista de períodos novos.
+    """
+    val_labels = [p[0] for p in pricing_engine.detect_periods(excel_reader.read_header(val_source))]
+    uni_labels = [p[0] for p in pricing_engine.detect_periods(excel_reader.read_header(uni_source))]
+    existing = set(stored_periods(conn, pharmacy))
+    new = tuple(p for p in val_labels if p in uni_labels and p not in existing)
+    if not new:
+        return []
+
+    read_val, read_uni = excel_reader.read_many([
+        (val_source, functools.partial(pricing_engine.period_columns, only=new), [0, 1]),
+        (uni_source, functools.partial(pricing_engine.period_columns, with_product=False, only=new), [0]),
+    ])
+    dataset = pricing_engine.build_dataset(read_val, read_uni, key=None, only=new)
+    source = os.path.basename(val_source) if isinstance(val_source, str) else ''
+    return append_dataset(conn, dataset, pharmacy, source=source)
+
+
+def load_dataset(conn, pharmacy=DEFAULT_PHARMACY, periods=None):
+    """Reconstrói um dataset (mesmo formato de pricing_engine.build_dataset) a partir do histórico."""
+    import pandas as pd
+
+    if periods is None:
+        periods = stored_periods(conn, pharmacy)
+    if not periods:
+        return None
+
+    marks = ','.join('?' * len(periods))
+    df = pd.read_sql_query(
+        f'SELECT s.cod, p.produto, s.period, s.farm_val, s.reg_val, s.farm_qtd, s.reg_qtd '
+        f'FROM sales s JOIN products p ON p.cod = s.cod '
+        f'WHERE s.pharmacy = ? AND s.period IN ({marks})',
+        conn, params=[pharmacy] + list(periods)
+    )
+
+    # Disposição (produtos x períodos) por indexação direta, sem pivot
+    row_idx, codes = pd.factorize(df['cod'], sort=True)
+    col_idx = pd.Index(periods).get_indexer(df['period'])
+    names = pd.Series(df['produto'].to_numpy(), index=row_idx).groupby(level=0).first()
+
+    # O Cód é guardado como texto; se todos forem inteiros (sem zeros à esquerda) volta a int64,
+    # como nos uploads e na result_cache, para as junções, pesquisas e exportações coincidirem
+    cod = codes.to_numpy(dtype=object)
+    if len(cod) and pd.Series(cod).str.fullmatch(r'-?(0|[1-9][0-9]*)').all():
+        cod = cod.astype(np.int64)
+
+    last = conn.execute('SELECT MAX(ingested_at) FROM periods WHERE pharmacy = ?', (pharmacy,)).fetchone()[0]
+    dataset = {
+        'key': f"historico:{pharmacy}:{last}",
+        'ids': pricing_engine.compact_ids(cod, names.to_numpy(dtype=object)),
+        'periods': list(periods),
+        'default_period': periods[-1],
+    }
+    for col, src in (('Farm_Val', 'farm_val'), ('Reg_Val', 'reg_val'), ('Farm_Qtd', 'farm_qtd'), ('Reg_Qtd', 'reg_qtd')):
+        block = np.zeros((len(codes), len(periods)))
+        block[row_idx, col_idx] = df[src].to_numpy()
+        dataset[col] = block
+    return dataset
+
+
+def product_history(conn, cod, n_pharmacies, pharmacy=DEFAULT_PHARMACY):
+    """Evolução do diferencial de preço de um produto (consulta pela chave primária)."""
+    import pandas as pd
+
+    df = pd.read_sql_query(
+        'SELECT period, farm_val, reg_val, farm_qtd, reg_qtd FROM sales WHERE pharmacy = ? AND cod = ?',
+        conn, params=(pharmacy, str(cod))
+    )
+    if df.empty:
+        return df
+    df = df.assign(_key=df['period'].map(pricing_engine.period_sort_key)).sort_values('_key')
+    metrics = pricing_engine.reverse_engineer(
+        df['farm_val'].to_numpy(), df['reg_val'].to_numpy(), df['farm_qtd'].to_numpy(), df['reg_qtd'].to_numpy(),
+        n_pharmacies
+    )
+    out = pd.DataFrame({'Período': df['period'].to_numpy(), 'Farm_Qtd': df['farm_qtd'].to_numpy()})
+    for col in ('My_PVP', 'Others_PVP', 'Diff_Percent', 'Market_Share_Qty', 'Opportunity_Eur'):
+        out[col] = metrics[col]
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Histórico local de vendas (SQLite)")
+    parser.add_argument('--db', default=DEFAULT_DB)
+    parser.add_argument('--farmacia', default=DEFAULT_PHARMACY)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_ingest = sub.add_parser('ingest', help="Acrescenta os meses novos de um par de ficheiros")
+    p_ingest.add_argument('valor')
+    p_ingest.add_argument('unidades')
+
+    p_gap = sub.add_parser('gap', help="Evolução do diferencial de preço de um produto")
+    p_gap.add_argument('cod')
+    p_gap.add_argument('--n', type=int, default=6)
+
+    sub.add_parser('periods', help="Lista os períodos guardados")
+
+    args = parser.parse_args()
+    conn = connect(args.db)
+
+    if args.command == 'ingest':
+        t0 = time.perf_counter()
+        new = ingest_workbooks(conn, args.valor, args.unidades, args.farmacia)
+        if new:
+            print(f"Períodos adicionados: {', '.join(new)} ({time.perf_counter() - t0:.2f}s)")
+        else:
+            print("Nenhum período novo: o histórico já está atualizado.")
+    elif args.command == 'gap':
+        df = product_history(conn, args.cod, args.n, args.farmacia)
+        print(df.round(2).to_string(index=False) if not df.empty else f"Produto {args.cod} sem histórico.")
+    else:
+        print(', '.join(stored_periods(conn, args.farmacia)) or "Histórico vazio.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Otimizador de preços com elasticidade, em lote para todo o catálogo (só NumPy).
+
+Com vários meses, ajusta-se por produto uma reta de procura
+    Farm_Qtd = a + b * Diff_Percent
+por mínimos quadrados sobre os períodos com PVPs válidos, em simultâneo para
+todos os produtos (somas sobre o eixo dos períodos). Com poucos meses a
+inclinação por produto é ruído, por isso é encolhida para a inclinação
+agregada da sua Posição (categoria):
+    b = (Sxy + λ·b_categoria) / (Sxx + λ)
+e produtos sem variação de preço ficam só com a da categoria.
+
+Receita R(p) = p·q(p), com Diff_Percent = 100·(p/m - 1) e m o PVP de
+mercado: para b < 0 o máximo é p* = m·(100·b - a) / (200·b), limitado a
+±MAX_CHANGE do preço atual. Sem inclinação negativa (ou sem PVP de mercado)
+mantém-se a regra anterior: alinhar com o mercado.
+"""
+import numpy as np
+
+# Variação máxima face ao meu PVP atual (fração)
+MAX_CHANGE = 0.20
+
+# Mínimo de períodos válidos para uma inclinação própria do produto
+MIN_PERIODS = 3
+
+# Fit: 0 = sem dados (regra de mercado), 1 = inclinação da categoria, 2 = produto (encolhida)
+FIT_LABELS = np.array(['Mercado', 'Categoria', 'Produto'], dtype=object)
+
+
+def fit_demand(diff_percent, farm_qtd, valid, groups, n_groups=3, shrinkage=None):
+    """Ajusta q = a + b·d por linha de arrays (produtos x períodos).
+
+    `valid` marca os períodos usados; `groups` (P,) é a categoria de cada
+    produto (ex: códigos de Posição). `shrinkage` (λ) por defeito é a
+    mediana de Sxx dos produtos com variação. Devolve (a, b, fit) com `fit`
+    em códigos de FIT_LABELS.
+    """
+    w = valid.astype(float)
+    n = w.sum(axis=1)
+    x = np.where(valid, diff_percent, 0.0)
+    y = np.where(valid, farm_qtd, 0.0)
+    x_mean = np.divide(x.sum(axis=1), n, out=np.zeros(len(n)), where=n > 0)
+    y_mean = np.divide(y.sum(axis=1), n, out=np.zeros(len(n)), where=n > 0)
+    dx = (x - x_mean[:, None]) * w
+    sxx = (dx * dx).sum(axis=1)
+    sxy = (dx * (y - y_mean[:, None])).sum(axis=1)
+
+    own = (n >= MIN_PERIODS) & (sxx > 1e-9)
+    # Inclinação agregada por categoria (apenas produtos com variação de preço)
+    g_sxx = np.bincount(groups[own], weights=sxx[own], minlength=n_groups)
+    g_sxy = np.bincount(groups[own], weights=sxy[own], minlength=n_groups)
+    g_slope = np.divide(g_sxy, g_sxx, out=np.zeros(n_groups), where=g_sxx > 0)
+    has_group = (g_sxx > 0)[groups]
+
+    if shrinkage is None:
+        shrinkage = float(np.median(sxx[own])) if own.any() else 1.0
+    prior = g_slope[groups]
+    b = np.where(own, (sxy + shrinkage * prior) / (sxx + shrinkage), prior)
+    a = y_mean - b * x_mean
+
+    fit = np.where(own, 2, np.where(has_group & (n > 0), 1, 0)).astype(np.int8)
+    b = np.where(fit > 0, b, 0.0)
+    return a, b, fit
+
+
+def optimal_prices(a, b, my_pvp, others_pvp, max_change=MAX_CHANGE):
+    """Preço que maximiza p·q(p) por produto, limitado a ±max_change do preço atual.
+
+    Devolve (preço ótimo, quantidade prevista, ganho de receita previsto face
+    ao preço atual, pelo mesmo modelo). Sem curva utilizável (b >= 0 ou sem
+    PVP de mercado) o preço sugerido é o PVP de mercado e o ganho é 0.
+    """
+    usable = (b < 0) & (others_pvp > 0) & (my_pvp > 0)
+    safe_b = np.where(usable, b, -1.0)
+    safe_m = np.where(usable, others_pvp, 1.0)
+
+    p_star = safe_m * (100 * safe_b - a) / (200 * safe_b)
+    p_star = np.clip(p_star, my_pvp * (1 - max_change), my_pvp * (1 + max_change))
+
+    def revenue(p):
+        q = np.maximum(a + safe_b * 100 * (p / safe_m - 1), 0)
+        return p * q, q
+
+    r_star, q_star = revenue(p_star)
+    r_now, _ = revenue(my_pvp)
+    price = np.where(usable, p_star, others_pvp)
+    gain = np.where(usable, np.maximum(r_star - r_now, 0), 0.0)
+    return price, np.where(usable, q_star, np.nan), gain
+
+
+def optimize(panel, farm_qtd, t, max_change=MAX_CHANGE, shrinkage=None):
+    """Otimização em lote para o período `t` a partir do painel (produtos x períodos).
+
+    `panel` é o resultado de pricing_engine.build_period_panel e `farm_qtd`
+    o array de quantidades do dataset. Devolve um dict de arrays (P,):
+    'Suggested_Price', 'Expected_Qty', 'Optimal_Gain_Eur', 'Slope' e 'Fit'.
+    """
+    valid = (panel['My_PVP'] > 0) & (panel['Others_PVP'] > 0)
+    groups = panel['Position'][:, t].astype(np.intp)
+    a, b, fit = fit_demand(panel['Diff_Percent'], farm_qtd, valid, groups, shrinkage=shrinkage)
+    price, qty, gain = optimal_prices(a, b, panel['My_PVP'][:, t], panel['Others_PVP'][:, t], max_change)
+    fit = np.where((b < 0) & (fit > 0), fit, 0).astype(np.int8)
+    return {'Suggested_Price': price, 'Expected_Qty': qty, 'Optimal_Gain_Eur': gain, 'Slope': b, 'Fit': fit}
@@ -0,0 +1,547 @@
+"""Motor de engenharia reversa de preços, sem dependências de Streamlit/Plotly.
+
+Partilhado pelo dashboard (app.py), pelas CLIs e pelos benchmarks. Só o NumPy
+é importado ao carregar o módulo; o pandas é importado dentro das funções que
+o usam, para que `import pricing_engine` fique bem abaixo de 100 ms.
+"""
+import re
+
+import numpy as np
+
+import profiling
+
+# Versão do formato do dataset/cálculos: entra na chave das caches persistentes
+ENGINE_VERSION = '3'
+
+# Intervalo de N permitido pelo slider do dashboard
+N_MIN = 2
+N_MAX = 20
+
+# Abaixo deste valor, as unidades estimadas da concorrência são artefactos de
+# arredondamento dos ficheiros originais (o PVP de mercado fica a 0)
+MIN_OTHERS_QTY = 0.1
+
+# Códigos inteiros da Matriz de Poder (ordem crescente de quota)
+POSITION_LABELS = np.array(['Seguidor 🏃', 'Competitivo ⚔️', 'Dominante 👑'], dtype=object)
+
+# Faixas da Dif Preço (%) para colorir a tabela detalhada (azul = mais barato, vermelho = mais caro)
+DIFF_BUCKET_EDGES = np.array([-15.0, -5.0, 5.0, 15.0])
+DIFF_BUCKET_LABELS = np.array(['🔵 < -15%', '🔷 -15% a -5%', '⚪ ±5%', '🔶 5% a 15%', '🔴 > 15%'], dtype=object)
+
+# Índices fixos das colunas do período de referência (layout original dos ficheiros)
+COL_FARM = 3
+COL_REG = 8
+
+# Abreviaturas dos meses nos cabeçalhos (ex: 'Farmácia Nov/2025')
+MONTHS_PT = ['jan', 'fev', 'mar', 'abr', 'mai', 'jun', 'jul', 'ago', 'set', 'out', 'nov', 'dez']
+
+# Nº máximo de códigos duplicados/órfãos listados no relatório da junção
+JOIN_SAMPLE = 20
+
+# Métricas que dependem de N e que ficam guardadas no cubo (produtos x N)
+CUBE_METRICS = ['Avg_Unit_Others', 'Market_Share_Qty', 'Others_PVP', 'Diff_Percent', 'Opportunity_Eur']
+
+
+def reverse_engineer(farm_val, reg_val, farm_qtd, reg_qtd, n_pharmacies, n_own=1):
+    """Núcleo da engenharia reversa, vetorizado para quaisquer formas difundíveis.
+
+    Os mesmos cálculos servem o cubo (produtos x N) e o painel
+    (produtos x períodos): só muda a forma dos arrays de entrada.
+    `n_own` é o nº de farmácias próprias entre as N (modo grupo, ver
+    group_engine): `farm_val`/`farm_qtd` são então a soma dessas lojas.
+    Devolve um dict de arrays float64 (Position em códigos int8).
+    """
+    n = np.asarray(n_pharmacies, dtype=float)
+
+    # 1. Totais da Região (Extrapolação)
+    total_val_region = reg_val * n
+    total_qty_region = reg_qtd * n
+
+    # 2. Isolar "Outras Farmácias"
+    others_val = total_val_region - farm_val
+    others_qty = total_qty_region - farm_qtd
+
+    # Média de unidades vendidas POR FARMÁCIA CONCORRENTE
+    n_others = np.maximum(1, n - n_own)
+    avg_unit_others = np.clip(np.round(others_qty / n_others, 0), 0, None)
+
+    # 3. Quota de Mercado (Market Share)
+    market_share = np.divide(
+        np.broadcast_to(farm_qtd, total_qty_region.shape), total_qty_region,
+        out=np.zeros(total_qty_region.shape), where=total_qty_region > 0.001
+    ) * 100
+
+    # 4. PVPs (o meu PVP não depende de N)
+    my_pvp = np.divide(farm_val, farm_qtd, out=np.zeros(np.shape(farm_val)), where=farm_qtd > 0)
+
+    # Quantidades residuais (<= MIN_OTHERS_QTY) são artefactos de arredondamento
+    others_pvp = np.divide(others_val, others_qty, out=np.zeros(others_val.shape), where=others_qty > MIN_OTHERS_QTY)
+
+    # 5. Diferencial
+    diff_percent = np.divide(
+        (my_pvp - others_pvp) * 100, others_pvp,
+        out=np.zeros(others_pvp.shape), where=(others_pvp > 0) & (my_pvp > 0)
+    )
+
+    # 6. Matriz de Poder (códigos 0/1/2, ver POSITION_LABELS)
+    position = (market_share >= 15).astype(np.int8) + (market_share >= 40).astype(np.int8)
+
+    # 7. Oportunidade Financeira (Dinheiro na Mesa)
+    opportunity = np.where(my_pvp < others_pvp, (others_pvp - my_pvp) * farm_qtd, 0)
+
+    return {
+        'Others_Val': others_val,
+        'Others_Qty': others_qty,
+        'Avg_Unit_Others': avg_unit_others,
+        'Market_Share_Qty': market_share,
+        'My_PVP': my_pvp,
+        'Others_PVP': others_pvp,
+        'Diff_Percent': diff_percent,
+        'Position': position,
+        'Opportunity_Eur': opportunity,
+    }
+
+
+def build_n_cube(df_base, n_values=None, dtype=np.float32):
+    """Calcula todas as métricas de engenharia reversa para vários N de uma só vez.
+
+    Os vetores de entrada (P,) são difundidos contra o vetor de N (1, K),
+    produzindo arrays (P x K) numa única operação vetorizada. O slider passa
+    a ser apenas uma indexação por coluna (ver `frame_for_n`).
+    """
+    if n_values is None:
+        n_values = np.arange(N_MIN, N_MAX + 1)
+    n_values = np.asarray(n_values, dtype=np.int64)
+
+    metrics = reverse_engineer(
+        df_base['Farm_Val'].to_numpy(dtype=float)[:, np.newaxis],
+        df_base['Reg_Val'].to_numpy(dtype=float)[:, np.newaxis],
+        df_base['Farm_Qtd'].to_numpy(dtype=float)[:, np.newaxis],
+        df_base['Reg_Qtd'].to_numpy(dtype=float)[:, np.newaxis],
+        n_values[np.newaxis, :],
+    )
+
+    cube = {
+        'n_values': n_values, 'My_PVP': metrics['My_PVP'][:, 0].astype(dtype), 'Position': metrics['Position'],
+        'Diff_Bucket': diff_bucket(metrics['Diff_Percent']),
+    }
+    for name in CUBE_METRICS:
+        cube[name] = metrics[name].astype(dtype)
+    return cube
+
+
+def diff_bucket(diff_percent):
+    """Códigos int8 da faixa de Dif Preço (%), ver DIFF_BUCKET_LABELS."""
+    return np.digitize(diff_percent, DIFF_BUCKET_EDGES).astype(np.int8)
+
+
+def n_column(cube, n_pharmacies):
+    """Índice da coluna do cubo correspondente a N."""
+    idx = np.searchsorted(cube['n_values'], n_pharmacies)
+    if idx >= len(cube['n_values']) or cube['n_values'][idx] != n_pharmacies:
+        raise ValueError(f"N={n_pharmacies} fora do cubo ({cube['n_values'][0]}..{cube['n_values'][-1]})")
+    return idx
+
+
+def frame_for_n(df_base, cube, n_pharmacies, rows=None):
+    """Frame processado para um N, por simples indexação do cubo.
+
+    Compacto: Cód/Produto como vêm do dataset (int64/categórico, categorias
+    partilhadas), métricas em float32 e Position/Diff_Bucket categóricos
+    (1 byte por linha). Os valores de entrada ficam no dataset e o Preço
+    Sugerido é derivado quando preciso (`suggested_price`). `rows`
+    (posições) limita o frame a essas linhas, mantendo-as como índice.
+    """
+    import pandas as pd
+
+    k = n_column(cube, n_pharmacies)
+    if rows is None:
+        rows = np.arange(len(df_base))
+    df = pd.DataFrame({
+        'Cód': df_base['Cód'].array.take(rows),
+        'Produto': df_base['Produto'].array.take(rows),
+        'Farm_Qtd': df_base['Farm_Qtd'].to_numpy(dtype=np.float32)[rows],
+    }, index=df_base.index[rows], copy=False)
+    df['Avg_Unit_Others'] = cube['Avg_Unit_Others'][rows, k]
+    df['Market_Share_Qty'] = cube['Market_Share_Qty'][rows, k]
+    df['My_PVP'] = cube['My_PVP'][rows]
+    df['Others_PVP'] = cube['Others_PVP'][rows, k]
+    df['Diff_Percent'] = cube['Diff_Percent'][rows, k]
+    df['Diff_Bucket'] = pd.Categorical.from_codes(cube['Diff_Bucket'][rows, k], DIFF_BUCKET_LABELS)
+    df['Position'] = pd.Categorical.from_codes(cube['Position'][rows, k], POSITION_LABELS)
+    df['Opportunity_Eur'] = cube['Opportunity_Eur'][rows, k]
+    return df
+
+
+def suggested_price(df):
+    """Preço Sugerido sem histórico (Estratégia: Alinhar com o Mercado), derivado e não guardado.
+
+    Com vários meses o dashboard usa o preço ótimo do `optimizer`.
+    """
+    return df['Others_PVP']
+
+
+def metrics_frame(df_base, n_pharmacies):
+    """Frame processado para um único N, sem construir o cubo (uso em batch/CLI)."""
+    metrics = reverse_engineer(
+        df_base['Farm_Val'].to_numpy(dtype=float),
+        df_base['Reg_Val'].to_numpy(dtype=float),
+        df_base['Farm_Qtd'].to_numpy(dtype=float),
+        df_base['Reg_Qtd'].to_numpy(dtype=float),
+        n_pharmacies,
+    )
+    df = df_base.copy()
+    for col in ('Others_Val', 'Others_Qty', 'Avg_Unit_Others', 'Market_Share_Qty', 'My_PVP', 'Others_PVP', 'Diff_Percent'):
+        df[col] = metrics[col]
+    df['Position'] = POSITION_LABELS[metrics['Position']]
+    # Preço Sugerido (Estratégia: Alinhar com o Mercado)
+    df['Suggested_Price'] = df['Others_PVP']
+    df['Opportunity_Eur'] = metrics['Opportunity_Eur']
+    return df
+
+
+def product_index(df):
+    """Opções do filtro (ordenadas por vendas) e índice Produto -> posições de linha em `df`.
+
+    Depende apenas do período (não de N), por isso é calculado uma vez por
+    dataset/período. As posições servem para `df.iloc` e para `kpi_partials`.
+    """
+    import pandas as pd
+
+    qty = df['Farm_Qtd'].to_numpy()
+    order = np.argsort(-qty, kind='stable')
+    options = pd.unique(df['Produto'].to_numpy()[order])
+    codes, names = pd.factorize(df['Produto'].to_numpy())
+    by_code = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes, minlength=len(names)))[:-1]
+    index = dict(zip(names, np.split(by_code, bounds)))
+    return options, index
+
+
+# Colunas das somas parciais por produto usadas pelos KPIs
+KPI_PARTS = ['My_PVP_Sum', 'My_PVP_Count', 'Others_PVP_Sum', 'Others_PVP_Count', 'Opportunity_Eur', 'Farm_Qtd']
+
+
+def kpi_partials(df):
+    """Contribuição de cada linha para os KPIs (array P x len(KPI_PARTS)).
+
+    Os KPIs de qualquer seleção são a soma das linhas selecionadas, o que
+    permite atualizá-los só com os produtos adicionados/removidos.
+    """
+    my_pvp = df['My_PVP'].to_numpy(dtype=float)
+    others_pvp = df['Others_PVP'].to_numpy(dtype=float)
+    parts = np.empty((len(df), len(KPI_PARTS)))
+    parts[:, 0] = np.where(my_pvp > 0, my_pvp, 0)
+    parts[:, 1] = my_pvp > 0
+    parts[:, 2] = np.where(others_pvp > 0, others_pvp, 0)
+    parts[:, 3] = others_pvp > 0
+    parts[:, 4] = np.nan_to_num(df['Opportunity_Eur'].to_numpy(dtype=float))
+    parts[:, 5] = np.nan_to_num(df['Farm_Qtd'].to_numpy(dtype=float))
+    return parts
+
+
+def update_kpi_totals(totals, partials, added=(), removed=()):
+    """Novos totais somando as linhas adicionadas e subtraindo as removidas."""
+    totals = totals.copy()
+    if len(added):
+        totals += partials[added].sum(axis=0)
+    if len(removed):
+        totals -= partials[removed].sum(axis=0)
+    return totals
+
+
+def kpis_from_totals(totals, sim_increase):
+    """(PVP médio meu, PVP médio mercado, oportunidade, ganho simulado, delta) a partir dos totais."""
+    my_sum, my_count, mkt_sum, mkt_count, total_opp, qty = totals
+    avg_my_pvp = my_sum / my_count if my_count > 0.5 else 0
+    avg_mkt_pvp = mkt_sum / mkt_count if mkt_count > 0.5 else 0
+    # KPI 2: Simulação Manual (soma das vendas dos produtos filtrados * aumento unitário)
+    return avg_my_pvp, avg_mkt_pvp, total_opp, qty * sim_increase, avg_my_pvp - avg_mkt_pvp
+
+
+def selection_kpis(df, sim_increase):
+    """KPIs dos cards sobre a seleção atual.
+
+    Devolve (PVP médio meu, PVP médio mercado, oportunidade total, ganho
+    simulado, delta de PVP); médias só sobre PVPs > 0 e NaN tratados como 0.
+    """
+    if df.empty:
+        return 0, 0, 0, 0, 0
+    return kpis_from_totals(kpi_partials(df).sum(axis=0), sim_increase)
+
+
+def n_sensitivity(cube, rows=None):
+    """Resumo da sensibilidade a N para um subconjunto de linhas do cubo.
+
+    Devolve um DataFrame indexado por N com a Oportunidade total e o número
+    de produtos em cada Posição, e uma máscara (por linha) dos produtos cuja
+    Posição muda dentro do intervalo de N.
+    """
+    import pandas as pd
+
+    opp = cube['Opportunity_Eur']
+    pos = cube['Position']
+    if rows is not None:
+        opp = opp[rows]
+        pos = pos[rows]
+
+    summary = pd.DataFrame({'N': cube['n_values']})
+    summary['Opportunity_Eur'] = opp.sum(axis=0, dtype=np.float64)
+    for code, label in enumerate(POSITION_LABELS):
+        summary[label] = (pos == code).sum(axis=0)
+
+    position_changes = pos.min(axis=1) != pos.max(axis=1)
+    return summary.set_index('N'), position_changes
+
+
+def _period_key(label):
+    """(ano, mês) de um rótulo 'Nov/2025', ou None se não for reconhecido."""
+    m = re.match(r'^\s*([A-Za-zçÇ]{3})[A-Za-zçÇ]*\.?\s*/\s*(\d{4})\s*$', label)
+    if not m or m.group(1).lower() not in MONTHS_PT:
+        return None
+    return int(m.group(2)), MONTHS_PT.index(m.group(1).lower()) + 1
+
+
+def detect_periods(header, only=None):
+    """Deteta os pares de colunas 'Farmácia <período>' / 'Região <período>'.
+
+    Devolve uma lista de (rótulo, índice Farmácia, índice Região) por ordem
+    cronológica (ou pela ordem do ficheiro se os rótulos não forem meses).
+    Colunas de totais são ignoradas. Sem pares reconhecíveis, recorre aos
+    índices fixos COL_FARM/COL_REG como período único. Com `only`, apenas
+    os períodos indicados são devolvidos.
+    """
+    farm, reg = {}, {}
+    for i, name in enumerate(header):
+        m = re.match(r'^\s*(Farmácia|Região)\s+(.+?)\s*$', str(name), re.IGNORECASE)
+        if not m or 'total' in m.group(2).lower():
+            continue
+        target = farm if m.group(1).lower().startswith('farm') else reg
+        target.setdefault(m.group(2), i)
+
+    periods = [(label, farm[label], reg[label]) for label in farm if label in reg]
+    if not periods:
+        if len(header) <= COL_REG:
+            raise IndexError("Estrutura do ficheiro inválida.")
+        return [(str(header[COL_FARM]), COL_FARM, COL_REG)]
+
+    keys = [_period_key(label) for label in [p[0] for p in periods]]
+    if all(k is not None for k in keys):
+        periods = [p for _, p in sorted(zip(keys, periods), key=lambda kp: kp[0])]
+    if only is not None:
+        periods = [p for p in periods if p[0] in only]
+    return periods
+
+
+def period_sort_key(label):
+    """Chave de ordenação cronológica (rótulos não reconhecidos ficam no fim)."""
+    key = _period_key(label)
+    return (0,) + key if key is not None else (1, label)
+
+
+def period_columns(header, with_product=True, only=None):
+    """Colunas a ler de um ficheiro: Cód, (Produto) e todos os pares de períodos.
+
+    Os pares ficam pela ordem de `detect_periods`, pelo que o período t está
+    nas posições (k + 2t, k + 2t + 1) do resultado, com k = 2 ou 1.
+    """
+    cols = [0, 1] if with_product else [0]
+    for _, i_farm, i_reg in detect_periods(header, only):
+        cols += [i_farm, i_reg]
+    return cols
+
+
+def compact_ids(cod, produto):
+    """Frame (Cód, Produto) compacto: Cód int64 se todos os códigos forem inteiros, Produto categórico."""
+    import pandas as pd
+
+    cod = np.asarray(cod, dtype=object)
+    if len(cod) and pd.api.types.infer_dtype(cod, skipna=False) == 'integer':
+        cod = cod.astype(np.int64)
+    # Categorias pela ordem de aparição: evita ordenar todos os nomes (pd.Categorical ordena)
+    codes, names = pd.factorize(np.asarray(produto, dtype=object))
+    return pd.DataFrame({'Cód': cod, 'Produto': pd.Categorical.from_codes(codes, names)})
+
+
+def totals_mask(cod):
+    """Linhas de totais ('Totais' no Cód): só os códigos de texto são verificados."""
+    cod = np.asarray(cod, dtype=object)
+    mask = np.zeros(len(cod), dtype=bool)
+    text = np.flatnonzero(np.fromiter((type(c) is str for c in cod), dtype=bool, count=len(cod)))
+    mask[text] = ['totais' in c.lower() for c in cod[text]]
+    return mask
+
+
+def join_codes(val_cod, uni_cod, strict=False):
+    """Junção um-para-um por Cód entre os ficheiros Valor e Unidades, em tempo linear.
+
+    Os totais e as linhas sem Cód saem antes da junção. Os códigos são
+    indexados uma única vez numa tabela de hash comum (pd.factorize); um Cód
+    repetido num ficheiro fica só com a primeira ocorrência (com
+    `strict=True` é um erro) e os códigos que só existem num ficheiro ficam de
+    fora. Devolve (linhas de Valor, linhas de Unidades, relatório), com as
+    linhas pela ordem do ficheiro Valor.
+    """
+    import pandas as pd
+
+    sides = {'Valor': np.asarray(val_cod, dtype=object), 'Unidades': np.asarray(uni_cod, dtype=object)}
+    report = {'rows': {}, 'totals': {}, 'missing_cod': {}, 'duplicates': {}, 'n_duplicates': {},
+              'orphans': {}, 'n_orphans': {}}
+    keep = {}
+    for name, cod in sides.items():
+        totals = totals_mask(cod)
+        missing = pd.isna(cod)
+        keep[name] = np.flatnonzero(~(totals | missing))
+        report['rows'][name] = len(cod)
+        report['totals'][name] = int(totals.sum())
+        report['missing_cod'][name] = int((missing & ~totals).sum())
+
+    # Índice comum: cada Cód passa a um inteiro 0..K-1
+    n_val = len(keep['Valor'])
+    cod = np.concatenate([sides['Valor'][keep['Valor']], sides['Unidades'][keep['Unidades']]])
+    if pd.api.types.infer_dtype(cod, skipna=False) == 'integer':
+        # Caso comum (só códigos inteiros): tabela de hash de int64, sem objetos Python
+        cod = cod.astype(np.int64)
+    keys, uniques = pd.factorize(cod)
+    n_keys = len(uniques)
+    keys = {'Valor': keys[:n_val], 'Unidades': keys[n_val:]}
+
+    first, counts = {}, {}
+    for name, k in keys.items():
+        counts[name] = np.bincount(k, minlength=n_keys)
+        # Primeira ocorrência de cada código
+        first[name] = np.full(n_keys, len(k), dtype=np.int64)
+        np.minimum.at(first[name], k, np.arange(len(k)))
+
+    for name, other in (('Valor', 'Unidades'), ('Unidades', 'Valor')):
+        dup = np.flatnonzero(counts[name] > 1)
+        orphan = np.flatnonzero((counts[name] > 0) & (counts[other] == 0))
+        report['n_duplicates'][name] = len(dup)
+        report['duplicates'][name] = [str(c) for c in uniques[dup[:JOIN_SAMPLE]]]
+        report['n_orphans'][name] = len(orphan)
+        report['orphans'][name] = [str(c) for c in uniques[orphan[:JOIN_SAMPLE]]]
+
+    if strict and any(report['n_duplicates'].values()):
+        dups = '; '.join(f"{name}: {', '.join(codes)}" for name, codes in report['duplicates'].items() if codes)
+        raise ValueError(f"Códigos duplicados nos ficheiros ({dups}).")
+
+    matched = np.flatnonzero((counts['Valor'] > 0) & (counts['Unidades'] > 0))
+    matched = matched[np.argsort(first['Valor'][matched], kind='stable')]
+    report['products'] = len(matched)
+    return keep['Valor'][first['Valor'][matched]], keep['Unidades'][first['Unidades'][matched]], report
+
+
+def join_summary(report):
+    """Resumo de uma linha do relatório da junção (vazio se não houver nada a assinalar)."""
+    parts = []
+    for label, key in (('duplicados', 'n_duplicates'), ('só num ficheiro', 'n_orphans')):
+        counts = [f"{n:,} em {name}" for name, n in report[key].items() if n]
+        if counts:
+            parts.append(f"Cód {label}: {', '.join(counts)}")
+    return ' · '.join(parts)
+
+
+def build_dataset(read_val, read_uni, key, only=None, strict=False):
+    """Junta as leituras dos ficheiros Valor e Unidades num dataset multi-período.
+
+    `read_val`/`read_uni` são resultados de `excel_reader.read_columns` lidos
+    com `period_columns` (e o mesmo `only`). O dataset guarda 'ids' (Cód,
+    Produto), a lista 'periods', arrays (produtos x períodos) em 'Farm_Val',
+    'Reg_Val', 'Farm_Qtd' e 'Reg_Qtd' e o relatório da junção em 'join'
+    (ver `join_codes`). É tratado como só de leitura.
+    """
+    val_periods = detect_periods(read_val['source_header'], only)
+    uni_labels = [p[0] for p in detect_periods(read_uni['source_header'], only)]
+    periods = [p[0] for p in val_periods if p[0] in uni_labels]
+    if not periods:
+        raise ValueError("Os ficheiros Valor e Unidades não têm períodos em comum.")
+
+    # Período por defeito: o das colunas fixas originais, ou o mais recente
+    default_period = next((p[0] for p in val_periods if p[1] == COL_FARM), periods[-1])
+    if default_period not in periods:
+        default_period = periods[-1]
+
+    # Junção por Cód (totais removidos antes), sem construir frames intermédios
+    with profiling.stage('join'):
+        val_rows, uni_rows, report = join_codes(read_val['arrays'][0], read_uni['arrays'][0], strict)
+
+    with profiling.stage('to_arrays'):
+        dataset = {
+            'key': key,
+            'ids': compact_ids(read_val['arrays'][0][val_rows], read_val['arrays'][1][val_rows]),
+            'periods': periods,
+            'default_period': default_period,
+            'join': report,
+        }
+        # O período t ocupa as posições k + 2t e k + 2t + 1 de cada leitura
+        val_pos = {label: t for t, (label, _, _) in enumerate(val_periods)}
+        uni_pos = {label: t for t, label in enumerate(uni_labels)}
+        sources = {
+            'Farm_Val': (read_val, val_rows, lambda p: 2 + 2 * val_pos[p]),
+            'Reg_Val': (read_val, val_rows, lambda p: 3 + 2 * val_pos[p]),
+            'Farm_Qtd': (read_uni, uni_rows, lambda p: 1 + 2 * uni_pos[p]),
+            'Reg_Qtd': (read_uni, uni_rows, lambda p: 2 + 2 * uni_pos[p]),
+        }
+        for col, (read, rows, pos) in sources.items():
+            # Empilhado por período e transposto numa só cópia contígua (produtos x períodos)
+            block = np.ascontiguousarray(np.stack([_to_numeric(read['arrays'][pos(p)])[rows] for p in periods]).T)
+            # Valores em falta contam como 0
+            block[np.isnan(block)] = 0
+            dataset[col] = block
+    return dataset
+
+
+def _to_numeric(values):
+    # O excel_reader já devolve float64; outras origens passam pelo pd.to_numeric
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'f':
+        return values
+    import pandas as pd
+
+    return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=float)
+
+
+def build_period_panel(dataset, n_pharmacies):
+    """Métricas de engenharia reversa para todos os períodos num só passo.
+
+    `dataset` contém arrays (produtos x períodos) em 'Farm_Val', 'Reg_Val',
+    'Farm_Qtd' e 'Reg_Qtd'; o resultado tem a mesma forma para cada métrica.
+    """
+    return reverse_engineer(
+        dataset['Farm_Val'], dataset['Reg_Val'], dataset['Farm_Qtd'], dataset['Reg_Qtd'], n_pharmacies
+    )
+
+
+def period_frame(dataset, period):
+    """Frame base (Cód, Produto, valores e quantidades) de um único período."""
+    t = dataset['periods'].index(period)
+    df = dataset['ids'].copy(deep=False)
+    for col in ('Farm_Val', 'Reg_Val', 'Farm_Qtd', 'Reg_Qtd'):
+        df[col] = dataset[col][:, t]
+    return df
+
+
+def period_trends(dataset, panel, rows=None):
+    """Agregados por período (para linhas de tendência) sobre um subconjunto de produtos."""
+    import pandas as pd
+
+    def take(a):
+        return a if rows is None else a[rows]
+
+    my_pvp = take(panel['My_PVP'])
+    others_pvp = take(panel['Others_PVP'])
+    farm_qtd = take(dataset['Farm_Qtd'])
+
+    # Médias simples apenas sobre PVPs válidos (> 0), como nos KPIs
+    def positive_mean(a):
+        valid = a > 0
+        return np.divide(np.where(valid, a, 0).sum(axis=0), valid.sum(axis=0),
+                         out=np.zeros(a.shape[1]), where=valid.any(axis=0))
+
+    trends = pd.DataFrame({
+        'Período': dataset['periods'],
+        'My_PVP': positive_mean(my_pvp),
+        'Others_PVP': positive_mean(others_pvp),
+        'Opportunity_Eur': take(panel['Opportunity_Eur']).sum(axis=0),
+        'Farm_Qtd': farm_qtd.sum(axis=0),
+    })
+    return trends.set_index('Período')
@@ -0,0 +1,400 @@
+"""Serviço HTTP local de PVP de mercado, para outros sistemas (atualizador de preços do POS, relatórios).
+
+Mesma engenharia reversa do dashboard, sem Streamlit:
+
+  POST /pvp?n=6[&periodo=Nov/2025][&formato=parquet|arrow|csv][&estrito=1]
+      corpo multipart/form-data com as partes 'valor' e 'unidades' (o par de
+      workbooks), ou um Parquet já processado (Content-Type
+      application/vnd.apache.parquet, escrito por result_cache.write_dataset).
+      Devolve uma linha por produto (as colunas de pricing_engine.metrics_frame,
+      incluindo Others_PVP e Opportunity_Eur) em Parquet ou Arrow (IPC stream).
+  GET /estado
+      JSON com a ocupação da fila, contadores e a cache de datasets.
+
+A leitura dos Excel (a parte cara) corre num pool limitado de processos com
+uma fila de tamanho fixo: com workers + fila ocupados o pedido é recusado
+com 503 e Retry-After, em vez de acumular memória. Pedidos concorrentes com
+o mesmo par partilham a mesma leitura, e os datasets ficam na result_cache
+(memória + Parquet em disco), pelo que repetir o par não volta a ler os
+ficheiros. As métricas por N e a serialização correm na thread do pedido.
+
+Uso:
+    python pricing_service.py --port 8765 --workers 4 --fila 8
+    curl -F valor=@ValorVendido.xlsx -F unidades=@UnidadesVendidas.xlsx \\
+         'http://127.0.0.1:8765/pvp?n=6' -o pvp.parquet
+"""
+import argparse
+import functools
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import excel_reader
+import export
+import pricing_engine
+import profiling
+import result_cache
+
+# Tamanho máximo do corpo de um pedido
+MAX_BODY_BYTES = int(float(os.environ.get('PHARMA_SERVICE_MAX_MB', 200)) * 1e6)
+
+# Tempo máximo de espera por uma leitura antes de responder 504 (segundos)
+JOB_TIMEOUT = 300
+
+PARQUET_TYPE = export.FORMATS['parquet'][1]
+ARROW_TYPE = 'application/vnd.apache.arrow.stream'
+
+_POOL = None
+_WORKERS = 0
+_SLOTS = None  # workers + fila: um lugar por leitura aceite
+_CAPACITY = 0
+_WRITER = None  # threads que guardam as leituras na result_cache (Parquet em disco)
+_POOL_LOCK = threading.Lock()
+_LOCK = threading.Lock()
+_INFLIGHT = {}  # chave do dataset -> (Future da leitura em curso, pool onde corre)
+_STATS = {'pedidos': 0, 'ok': 0, 'rejeitados': 0, 'erros': 0, 'leituras': 0, 'partilhadas': 0, 'em_curso': 0}
+
+
+class ServiceError(Exception):
+    """Erro com código HTTP, devolvido ao cliente como JSON {'erro': ...}."""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def start_pool(workers=None, queue_size=None):
+    """Cria o pool de leitura e a fila limitada (por defeito fila = 2 x workers)."""
+    global _POOL, _WORKERS, _SLOTS, _CAPACITY, _WRITER
+    workers = workers or os.cpu_count() or 1
+    _WORKERS = workers
+    queue_size = 2 * workers if queue_size is None else queue_size
+    _POOL = _new_pool()
+    _WRITER = ThreadPoolExecutor(max_workers=2, thread_name_prefix='pvp-cache')
+    _CAPACITY = workers + queue_size
+    _SLOTS = threading.BoundedSemaphore(_CAPACITY)
+    return _POOL
+
+
+def _new_pool():
+    # 'spawn': o servidor tem threads, e fork com threads ativas não é seguro
+    return ProcessPoolExecutor(max_workers=_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+
+
+def _replace_pool(broken):
+    """Troca o pool se ainda for `broken`: com um worker morto o executor não aceita mais trabalho."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is broken:
+            _POOL = _new_pool()
+            broken.shutdown(wait=False, cancel_futures=True)
+        return _POOL
+
+
+def stop_pool():
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=True, cancel_futures=True)
+    if _WRITER is not None:
+        _WRITER.shutdown(wait=True)
+
+
+def stats():
+    with _LOCK:
+        out = dict(_STATS)
+    out['capacidade'] = _CAPACITY
+    out['workers'] = _WORKERS
+    out['cache'] = result_cache.stats()
+    return out
+
+
+def _count(name, delta=1):
+    with _LOCK:
+        _STATS[name] += delta
+
+
+def parse_pair(val_bytes, uni_bytes, key):
+    """Lê o par de workbooks num worker; devolve (dataset, info) como o dashboard guarda na cache."""
+    # Dentro de um worker a leitura é sequencial (o paralelismo é entre pedidos)
+    read_val = excel_reader.read_columns(val_bytes, pricing_engine.period_columns, [0, 1])
+    read_uni = excel_reader.read_columns(
+        uni_bytes, functools.partial(pricing_engine.period_columns, with_product=False), [0]
+    )
+    dataset = pricing_engine.build_dataset(read_val, read_uni, key=key)
+    info = {
+        "Períodos": dataset['periods'],
+        "Junção": dataset['join'],
+        "Leitura": {k: {s: r[s] for s in ('engine', 'bytes', 'rows', 'seconds')}
+                    for k, r in (("Valor", read_val), ("Unidades", read_uni))},
+    }
+    return dataset, info
+
+
+def dataset_for_pair(val_bytes, uni_bytes, strict=False):
+    """Dataset do par, pela result_cache ou por uma leitura no pool (partilhada entre pedidos iguais).
+
+    A leitura nunca é estrita, para a cache servir os dois modos; com
+    `strict` os Cód duplicados são recusados depois, pelo relatório da junção.
+    """
+    key = result_cache.content_key(hashlib.sha256(val_bytes).hexdigest(), hashlib.sha256(uni_bytes).hexdigest())
+    cached = result_cache.get(key)
+    dataset = cached[0] if cached is not None else _parse_in_pool(key, val_bytes, uni_bytes)
+    join = dataset.get('join')
+    if strict and join is not None and sum(join['n_duplicates'].values()):
+        raise ServiceError(400, pricing_engine.join_summary(join))
+    return dataset
+
+
+def _parse_in_pool(key, val_bytes, uni_bytes):
+    with _LOCK:
+        if key in _INFLIGHT:
+            future, pool = _INFLIGHT[key]
+            _STATS['partilhadas'] += 1
+        else:
+            if not _SLOTS.acquire(blocking=False):
+                _STATS['rejeitados'] += 1
+                raise ServiceError(503, "Fila cheia; tente mais tarde.", {'Retry-After': '5'})
+            pool = _POOL
+            try:
+                try:
+                    future = pool.submit(parse_pair, val_bytes, uni_bytes, key)
+                except BrokenProcessPool:
+                    pool = _replace_pool(pool)
+                    future = pool.submit(parse_pair, val_bytes, uni_bytes, key)
+            except BaseException:
+                _SLOTS.release()
+                raise
+            _INFLIGHT[key] = (future, pool)
+            _STATS['leituras'] += 1
+            _STATS['em_curso'] += 1
+            future.add_done_callback(functools.partial(_parse_done, key))
+
+    try:
+        dataset, _ = future.result(timeout=JOB_TIMEOUT)
+    except TimeoutError:
+        raise ServiceError(504, f"Leitura não terminou em {JOB_TIMEOUT}s.")
+    except BrokenProcessPool as e:
+        # Os pedidos seguintes vão para um pool novo
+        _replace_pool(pool)
+        raise ServiceError(500, f"Worker de leitura terminou: {e}")
+    except Exception as e:
+        raise ServiceError(400, f"Erro ao ler ficheiros: {e}")
+    return dataset
+
+
+def _parse_done(key, future):
+    # Corre na thread interna do pool, que trata a conclusão de todas as leituras: a escrita
+    # na cache (Parquet em disco e despejo) passa para _WRITER, para um disco lento não a atrasar
+    if not future.cancelled() and future.exception() is None:
+        try:
+            _WRITER.submit(_store, key, future)
+            return
+        except RuntimeError:
+            pass  # serviço a parar: fica sem cache
+    _release(key)
+
+
+def _store(key, future):
+    # Guarda antes de libertar o lugar na fila: um pedido igual que chegue entretanto
+    # partilha o Future em vez de voltar a ler; o lugar é libertado mesmo que a escrita falhe
+    try:
+        result_cache.put(key, *future.result())
+    except Exception:
+        logging.getLogger(__name__).exception("Falha ao guardar o dataset na cache")
+    finally:
+        _release(key)
+
+
+def _release(key):
+    with _LOCK:
+        _INFLIGHT.pop(key, None)
+        _STATS['em_curso'] -= 1
+    _SLOTS.release()
+
+
+def dataset_from_parquet(body):
+    try:
+        dataset, _ = result_cache.read_dataset(io.BytesIO(body), key='parquet:' + hashlib.sha256(body).hexdigest())
+    except Exception as e:
+        raise ServiceError(400, f"Parquet inválido: {e}")
+    return dataset
+
+
+def split_multipart(content_type, body):
+    """Partes de um corpo multipart/form-data: {nome: bytes}."""
+    params = dict(p.strip().split('=', 1) for p in content_type.split(';')[1:] if '=' in p)
+    boundary = params.get('boundary', '').strip('"')
+    if not boundary:
+        raise ServiceError(400, "multipart sem boundary.")
+    parts = {}
+    for chunk in body.split(b'--' + boundary.encode())[1:]:
+        if chunk.startswith(b'--'):
+            break
+        head, _, data = chunk.partition(b'\r\n\r\n')
+        disposition = next((line for line in head.decode('utf-8', 'replace').split('\r\n')
+                             if line.lower().startswith('content-disposition')), '')
+        for item in disposition.split(';'):
+            name, _, value = item.strip().partition('=')
+            if name == 'name':
+                parts[value.strip('"')] = data[:-2] if data.endswith(b'\r\n') else data
+    return parts
+
+
+def results_frame(dataset, n_pharmacies, period=None):
+    """Métricas de um período e N (o frame de pricing_engine.metrics_frame)."""
+    if not pricing_engine.N_MIN <= n_pharmacies <= pricing_engine.N_MAX:
+        raise ServiceError(400, f"N fora do intervalo {pricing_engine.N_MIN}-{pricing_engine.N_MAX}.")
+    period = period or dataset['default_period']
+    if period not in dataset['periods']:
+        raise ServiceError(400, f"Período '{period}' inexistente ({', '.join(dataset['periods'])})")
+    with profiling.stage('metrics'):
+        df = pricing_engine.metrics_frame(pricing_engine.period_frame(dataset, period), n_pharmacies)
+    return df, period
+
+
+def encode(df, fmt):
+    """Resultado serializado e respetivo Content-Type."""
+    with profiling.stage('encode'):
+        if fmt == 'arrow':
+            import pyarrow as pa
+
+            if df['Cód'].dtype.kind not in 'iu':
+                df = df.assign(**{'Cód': df['Cód'].astype(str)})
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return sink.getvalue().to_pybytes(), ARROW_TYPE
+        if fmt not in export.FORMATS:
+            raise ServiceError(400, f"Formato '{fmt}' não suportado (parquet, arrow, {', '.join(f for f in export.FORMATS if f != 'parquet')}).")
+        return export.to_bytes(df, fmt), export.FORMATS[fmt][1]
+
+
+def handle_pvp(query, content_type, body):
+    """POST /pvp: devolve (bytes, Content-Type, cabeçalhos extra)."""
+    try:
+        n_pharmacies = int(query.get('n', ['6'])[0])
+    except ValueError:
+        raise ServiceError(400, "N tem de ser inteiro.")
+    fmt = query.get('formato', ['parquet'])[0].lower()
+    strict = query.get('estrito', ['0'])[0].lower() in ('1', 'true', 'sim')
+
+    with profiling.stage('dataset'):
+        if content_type.startswith('multipart/form-data'):
+            parts = split_multipart(content_type, body)
+            if 'valor' not in parts or 'unidades' not in parts:
+                raise ServiceError(400, "Envie as partes 'valor' e 'unidades'.")
+            dataset = dataset_for_pair(parts['valor'], parts['unidades'], strict)
+        elif content_type.startswith((PARQUET_TYPE, 'application/octet-stream')):
+            dataset = dataset_from_parquet(body)
+        else:
+            raise ServiceError(415, "Use multipart/form-data (valor + unidades) ou Parquet.")
+
+    df, period = results_frame(dataset, n_pharmacies, query.get('periodo', [None])[0])
+    data, mime = encode(df, fmt)
+    return data, mime, {'X-Periodo': period, 'X-Linhas': str(len(df)), 'X-N': str(n_pharmacies)}
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = 'PharmaPVP/1'
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if urlsplit(self.path).path == '/estado':
+            self._send(200, json.dumps(stats(), ensure_ascii=False).encode(), 'application/json')
+        else:
+            self._send_error(ServiceError(404, "Caminho desconhecido."))
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        _count('pedidos')
+        run = profiling.start_run('pricing_service', path=url.path)
+        try:
+            if url.path != '/pvp':
+                raise ServiceError(404, "Caminho desconhecido.")
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > MAX_BODY_BYTES:
+                raise ServiceError(413, f"Pedido acima de {MAX_BODY_BYTES / 1e6:.0f} MB.")
+            body = self.rfile.read(length)
+            data, mime, headers = handle_pvp(parse_qs(url.query), self.headers.get('Content-Type', ''), body)
+        except ServiceError as e:
+            if e.status != 503:
+                _count('erros')
+            self._send_error(e)
+            return
+        except Exception as e:
+            _count('erros')
+            self._send_error(ServiceError(500, f"{type(e).__name__}: {e}"))
+            return
+        finally:
+            profiling.end_run(run)
+        _count('ok')
+        headers['X-Tempo'] = f"{run['seconds']:.3f}"
+        self._send(200, data, mime, headers)
+
+    def _send_error(self, error):
+        body = json.dumps({'erro': str(error)}, ensure_ascii=False).encode()
+        # O corpo do pedido pode não ter sido lido: fechar a ligação
+        self.close_connection = True
+        self._send(error.status, body, 'application/json', error.headers)
+
+    def _send(self, status, body, mime, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', mime)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Sem uma linha por pedido no stderr: os tempos por etapa vão para o log de profiling
+        pass
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Backlog de ligações por aceitar (o socketserver usa 5): rajadas de clientes não levam reset
+    request_queue_size = 128
+
+
+def serve(host='127.0.0.1', port=8765, workers=None, queue_size=None):
+    """Arranca o serviço (bloqueia até Ctrl+C)."""
+    profiling.configure_log()
+    # SIGTERM como Ctrl+C: os processos do pool terminam com o serviço
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    start_pool(workers, queue_size)
+    server = Server((host, port), Handler)
+    print(f"Serviço PVP em http://{host}:{server.server_port} "
+          f"({_WORKERS} workers, capacidade {_CAPACITY})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        stop_pool()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serviço HTTP local de PVP de mercado")
+    parser.add_argument('--host', default='127.0.0.1', help="Por defeito só aceita ligações locais")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=None, help="Processos de leitura (por defeito nº de CPUs)")
+    parser.add_argument('--fila', type=int, default=None, help="Leituras em espera além dos workers (por defeito 2 x workers)")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.workers, args.fila)
+
+
+if __name__ == '__main__':
+    main()
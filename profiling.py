@@ -0,0 +1,160 @@
+"""Instrumentação por etapas: tempo de relógio e memória de cada etapa de um run.
+
+Um run (um rerun do dashboard ou uma execução de CLI) é aberto com
+`start_run`; cada etapa é medida com `with stage('nome'):` em qualquer módulo,
+sem passar o run como argumento (fica numa ContextVar, uma por sessão). Fora
+de um run, `stage` não faz nada.
+
+Por etapa regista-se sempre o tempo e o RSS do processo no fim (e a
+variação). Com `trace_memory=True` usa-se também o tracemalloc para o pico de
+memória alocada dentro da etapa; tem custo, por isso só é ligado no painel
+de debug e no `--profile`. O tracemalloc é global ao processo: é ligado pelo
+primeiro run que o pede e desligado pelo último, e o pico só é registado
+quando o run é o único a usá-lo (com sessões em paralelo fica só o RSS); se
+já estava ligado de fora (python -X tracemalloc), não é usado. Etapas que
+correm em processos worker (leitura do Excel em paralelo) só contam a
+memória do processo principal.
+
+No fim do run, cada etapa e o resumo são emitidos como linhas JSON no logger
+'pharma.profile'; `PHARMA_PROFILE_LOG` (ficheiro ou '-' para stderr) liga um
+handler sem ser preciso configurar o logging.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger('pharma.profile')
+
+_CURRENT = contextvars.ContextVar('pharma_profile_run', default=None)
+
+# Runs com tracemalloc ligado por este módulo; `_TRACE_STARTS` conta os que já o pediram,
+# para uma etapa saber se outro run começou a partilhar o pico entretanto
+_TRACE_LOCK = threading.Lock()
+_TRACE_USERS = 0
+_TRACE_STARTS = 0
+
+
+def configure_log(target=None):
+    """Envia as linhas JSON para `target` (caminho ou '-' para stderr), por defeito PHARMA_PROFILE_LOG."""
+    target = target or os.environ.get('PHARMA_PROFILE_LOG')
+    if not target or logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr) if target == '-' else logging.FileHandler(target, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def _rss_bytes():
+    # Linux; noutros sistemas a coluna de RSS fica vazia
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def start_run(label, trace_memory=False, **context):
+    """Abre um run no contexto atual e devolve-o (dict com a lista de etapas)."""
+    global _TRACE_USERS, _TRACE_STARTS
+    if trace_memory:
+        with _TRACE_LOCK:
+            if _TRACE_USERS == 0 and tracemalloc.is_tracing():
+                trace_memory = False  # ligado de fora: não se mexe no pico nem se desliga
+            else:
+                if _TRACE_USERS == 0:
+                    tracemalloc.start()
+                _TRACE_USERS += 1
+                _TRACE_STARTS += 1
+    run = {
+        'label': label, 'context': context, 'stages': [], 'trace_memory': trace_memory,
+        '_t0': time.perf_counter(), '_token': None,
+    }
+    run['_token'] = _CURRENT.set(run)
+    return run
+
+
+def end_run(run):
+    """Fecha o run, emite as linhas JSON e devolve o resumo."""
+    run['seconds'] = time.perf_counter() - run['_t0']
+    run['rss_bytes'] = _rss_bytes()
+    _CURRENT.reset(run['_token'])
+    if run['trace_memory']:
+        _release_tracing()
+
+    for s in run['stages']:
+        logger.info(json.dumps({'event': 'stage', 'run': run['label'], **run['context'], **s}, ensure_ascii=False))
+    logger.info(json.dumps({
+        'event': 'run', 'run': run['label'], **run['context'],
+        'seconds': round(run['seconds'], 6), 'rss_bytes': run['rss_bytes'],
+        'stages': {s['stage']: s['seconds'] for s in run['stages']},
+    }, ensure_ascii=False))
+    return run
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Mede o bloco como uma etapa do run atual (sem run ativo, não faz nada)."""
+    run = _CURRENT.get()
+    if run is None:
+        yield
+        return
+    tracing = run['trace_memory'] and _claim_peak()
+    if tracing:
+        starts, base = tracing
+    rss0 = _rss_bytes()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        rec = {'stage': name, 'seconds': round(time.perf_counter() - t0, 6)}
+        rss = _rss_bytes()
+        rec['rss_bytes'] = rss
+        rec['rss_delta_bytes'] = rss - rss0 if rss is not None and rss0 is not None else None
+        if tracing:
+            with _TRACE_LOCK:
+                # Outro run a partilhar o pico durante a etapa: o valor não é só desta etapa
+                if _TRACE_STARTS == starts and _TRACE_USERS == 1:
+                    rec['peak_bytes'] = max(0, tracemalloc.get_traced_memory()[1] - base)
+        run['stages'].append(rec)
+
+
+def _claim_peak():
+    # (runs iniciados, memória atual) se este run é o único a usar o tracemalloc; só então reinicia o pico
+    with _TRACE_LOCK:
+        if _TRACE_USERS != 1:
+            return None
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        return _TRACE_STARTS, base
+
+
+def _release_tracing():
+    global _TRACE_USERS
+    with _TRACE_LOCK:
+        _TRACE_USERS -= 1
+        if _TRACE_USERS == 0:
+            tracemalloc.stop()
+
+
+def stages_table(run):
+    """Etapas do run como linhas prontas a mostrar (tempos em ms, memória em MB)."""
+    rows = []
+    for s in run['stages']:
+        row = {'Etapa': s['stage'], 'Tempo (ms)': round(s['seconds'] * 1000, 1)}
+        if s.get('rss_bytes') is not None:
+            row['RSS (MB)'] = round(s['rss_bytes'] / 1e6, 1)
+        # Sem a leitura do início da etapa não há variação, mesmo com o RSS do fim
+        if s.get('rss_delta_bytes') is not None:
+            row['Δ RSS (MB)'] = round(s['rss_delta_bytes'] / 1e6, 1)
+        if 'peak_bytes' in s:
+            row['Pico (MB)'] = round(s['peak_bytes'] / 1e6, 2)
+        rows.append(row)
+    return rows
@@ -0,0 +1,201 @@
+"""Cache de datasets lidos, endereçada pelo conteúdo e partilhada entre sessões.
+
+A chave é a SHA-256 dos bytes dos dois ficheiros mais ENGINE_VERSION do
+pricing_engine, pelo que o mesmo par carregado por dois utilizadores só é
+lido uma vez. Dois níveis:
+  * memória: LRU limitada em bytes (PHARMA_CACHE_MB, 512 por defeito);
+  * disco: um Parquet por dataset em PHARMA_CACHE_DIR (.cache_pvp por
+    defeito), limitado a PHARMA_CACHE_DISK_MB e sobrevive a reinícios.
+Os contadores (acertos por nível, falhas, despejos) são expostos por `stats`.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import pricing_engine
+
+CACHE_DIR = os.environ.get('PHARMA_CACHE_DIR', '.cache_pvp')
+MAX_MEMORY_BYTES = int(float(os.environ.get('PHARMA_CACHE_MB', 512)) * 1e6)
+MAX_DISK_BYTES = int(float(os.environ.get('PHARMA_CACHE_DISK_MB', 2048)) * 1e6)
+
+ARRAYS = ('Farm_Val', 'Reg_Val', 'Farm_Qtd', 'Reg_Qtd')
+
+_LOCK = threading.Lock()
+_MEMORY = OrderedDict()  # chave -> (valor, bytes), do menos para o mais recente
+_STATS = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'disk_evictions': 0,
+          'memory_bytes': 0, 'entries': 0}
+
+
+def content_key(*digests):
+    """Chave da cache a partir das hashes dos ficheiros e da versão do motor."""
+    raw = ':'.join([f"engine-{pricing_engine.ENGINE_VERSION}", *digests])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def dataset_nbytes(dataset):
+    ids = dataset['ids'].memory_usage(index=True, deep=True).sum()
+    return int(ids + sum(dataset[col].nbytes for col in ARRAYS))
+
+
+def get(key):
+    """(dataset, info) em cache ou None; um acerto em disco é promovido à memória."""
+    with _LOCK:
+        if key in _MEMORY:
+            _MEMORY.move_to_end(key)
+            _STATS['memory_hits'] += 1
+            return _MEMORY[key][0]
+
+    value = _read_parquet(key)
+    with _LOCK:
+        if value is None:
+            _STATS['misses'] += 1
+            return None
+        _STATS['disk_hits'] += 1
+        _remember(key, value)
+    return value
+
+
+def put(key, dataset, info=None):
+    """Guarda (dataset, info) nos dois níveis."""
+    value = (dataset, info)
+    with _LOCK:
+        _remember(key, value)
+    _write_parquet(key, dataset, info)
+
+
+def stats():
+    with _LOCK:
+        return dict(_STATS)
+
+
+def clear():
+    """Esvazia o nível de memória (o disco fica intacto)."""
+    with _LOCK:
+        _MEMORY.clear()
+        _STATS.update(memory_bytes=0, entries=0)
+
+
+def _remember(key, value):
+    # Chamar com _LOCK: insere e despeja os menos usados até caber no orçamento
+    size = dataset_nbytes(value[0])
+    if size > MAX_MEMORY_BYTES:
+        return
+    if key in _MEMORY:
+        _STATS['memory_bytes'] -= _MEMORY.pop(key)[1]
+    _MEMORY[key] = (value, size)
+    _STATS['memory_bytes'] += size
+    while _STATS['memory_bytes'] > MAX_MEMORY_BYTES:
+        _, (_, old_size) = _MEMORY.popitem(last=False)
+        _STATS['memory_bytes'] -= old_size
+        _STATS['evictions'] += 1
+    _STATS['entries'] = len(_MEMORY)
+
+
+def _path(key):
+    return os.path.join(CACHE_DIR, f"{key}.parquet")
+
+
+def write_dataset(target, dataset, info=None):
+    """Escreve o dataset em Parquet (caminho ou file-like): uma linha por produto e
+    uma coluna por (métrica, período), com os metadados no esquema.
+
+    É o formato da cache em disco e o "Parquet pré-processado" aceite pelo
+    serviço HTTP (pricing_service.py).
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    ids = dataset['ids']
+    cols = {
+        # Cód inteiro fica inteiro; se misturar inteiros e texto volta como texto (como no histórico)
+        'Cód': ids['Cód'].to_numpy() if ids['Cód'].dtype.kind == 'i' else ids['Cód'].astype(str).to_numpy(),
+        'Produto': ids['Produto'].astype(str).to_numpy(),
+    }
+    for col in ARRAYS:
+        for t, period in enumerate(dataset['periods']):
+            cols[f'{col}|{period}'] = dataset[col][:, t]
+    meta = {'periods': dataset['periods'], 'default_period': dataset['default_period'], 'info': info,
+            'join': dataset.get('join'), 'engine': pricing_engine.ENGINE_VERSION}
+    table = pa.Table.from_pandas(pd.DataFrame(cols), preserve_index=False)
+    table = table.replace_schema_metadata({b'pharma': json.dumps(meta).encode()})
+    pq.write_table(table, target)
+
+
+def read_dataset(source, key=None):
+    """Lê um Parquet escrito por `write_dataset` (caminho ou file-like); devolve (dataset, info)."""
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(source)
+    if not table.schema.metadata or b'pharma' not in table.schema.metadata:
+        raise ValueError("Parquet sem os metadados do dataset (escrito por result_cache.write_dataset).")
+    meta = json.loads(table.schema.metadata[b'pharma'])
+    df = table.to_pandas()
+
+    periods = meta['periods']
+    dataset = {
+        'key': key,
+        'ids': pricing_engine.compact_ids(df['Cód'].to_numpy(dtype=object), df['Produto'].to_numpy(dtype=object)),
+        'periods': periods,
+        'default_period': meta['default_period'],
+    }
+    # Relatório da junção (ficheiros antigos só o têm no info do dashboard)
+    join = meta.get('join') or (meta['info'] or {}).get('Junção')
+    if join is not None:
+        dataset['join'] = join
+    for col in ARRAYS:
+        dataset[col] = np.ascontiguousarray(df[[f'{col}|{p}' for p in periods]].to_numpy(dtype=float))
+    return dataset, meta['info']
+
+
+def _write_parquet(key, dataset, info):
+    import pyarrow as pa
+
+    tmp = _path(key) + f'.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        write_dataset(tmp, dataset, info)
+        os.replace(tmp, _path(key))
+    except (OSError, pa.ArrowException):
+        # Sem espaço/permissões ou dados que o Arrow não converte: a cache em disco é opcional
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return
+    _prune_disk()
+
+
+def _read_parquet(key):
+    # Sem verificar antes se existe: o ficheiro pode ser despejado por outro processo a
+    # qualquer momento, por isso um FileNotFoundError (na leitura ou no utime) é uma falha
+    path = _path(key)
+    try:
+        value = read_dataset(path, key)
+        os.utime(path)  # a data de modificação serve de "último acesso" para o despejo
+    except FileNotFoundError:
+        return None
+    except Exception:
+        return None  # ficheiro corrompido ou de outra versão
+    return value
+
+
+def _prune_disk():
+    try:
+        files = [os.path.join(CACHE_DIR, f) for f in os.listdir(CACHE_DIR) if f.endswith('.parquet')]
+        entries = sorted((os.path.getmtime(f), os.path.getsize(f), f) for f in files)
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    for _, size, f in entries:
+        if total <= MAX_DISK_BYTES:
+            break
+        try:
+            os.remove(f)
+        except OSError:
+            continue
+        total -= size
+        with _LOCK:
+            _STATS['disk_evictions'] += 1
@@ -0,0 +1,124 @@
+"""Simulador de cenários de preço, vetorizado (sem Streamlit, só NumPy).
+
+Um cenário sobe o preço de cada produto em `valor` € (tipo 'abs') ou em
+`valor` % do meu PVP (tipo 'pct'), multiplicado por um peso por Posição
+(ex: subir Dominante, manter Seguidor) e, opcionalmente, limitado ao PVP de
+mercado. O ganho é Σ Farm_Qtd x aumento efetivo.
+
+Com teto, o ganho de um grupo de produtos é Σ q·min(δ, teto), o que se
+resolve para todos os cenários de uma vez ordenando os tetos uma única vez
+e usando somas acumuladas + searchsorted: O((P + S) log P) em vez de P x S.
+Milhares de cenários sobre 100k produtos levam milissegundos.
+"""
+import numpy as np
+
+# Pesos por Posição, pela ordem dos códigos (Seguidor, Competitivo, Dominante)
+POSITION_RULES = {
+    'Todos os produtos': (1.0, 1.0, 1.0),
+    'Dominante + Competitivo': (0.0, 1.0, 1.0),
+    'Só Dominante': (0.0, 0.0, 1.0),
+    'Dominante + metade Competitivo': (0.0, 0.5, 1.0),
+}
+
+
+def scenario_grid(values, kind='abs', rules=None, cap=True):
+    """Grelha (valores x regras) como arrays planos de cenários.
+
+    Devolve um dict com 'value', 'pct' (bool), 'weights' (S x 3), 'cap'
+    (bool), 'rule' (nome da regra) e 'shape' (nº de regras, nº de valores)
+    para remontar a superfície de ganho.
+    """
+    rules = rules or list(POSITION_RULES)
+    values = np.asarray(values, dtype=float)
+    n_rules, n_values = len(rules), len(values)
+    weights = np.array([POSITION_RULES[r] for r in rules], dtype=float)
+    return {
+        'value': np.tile(values, n_rules),
+        'pct': np.full(n_rules * n_values, kind == 'pct'),
+        'weights': np.repeat(weights, n_values, axis=0),
+        'cap': np.full(n_rules * n_values, bool(cap)),
+        'rule': np.repeat(np.array(rules, dtype=object), n_values),
+        'shape': (n_rules, n_values),
+    }
+
+
+def _caps(my_pvp, others_pvp):
+    # Margem até ao mercado (0 se já estou acima); sem PVP de mercado conhecido não há teto
+    return np.where(others_pvp > 0, np.maximum(others_pvp - my_pvp, 0), np.inf)
+
+
+def prepare(my_pvp, others_pvp, farm_qtd, position):
+    """Pré-calcula, por Posição, os tetos ordenados e as somas acumuladas.
+
+    Para 'abs' o teto é a margem em € com peso q; para 'pct' é a margem
+    relativa (margem / meu PVP) com peso q x meu PVP.
+    """
+    my_pvp = np.asarray(my_pvp, dtype=float)
+    farm_qtd = np.asarray(farm_qtd, dtype=float)
+    caps = _caps(my_pvp, np.asarray(others_pvp, dtype=float))
+    ratio = np.divide(caps, my_pvp, out=np.full_like(caps, np.inf), where=my_pvp > 0)
+    position = np.asarray(position)
+
+    groups = []
+    for code in range(3):
+        m = position == code
+        groups.append({
+            'abs': _sorted_sums(caps[m], farm_qtd[m]),
+            'pct': _sorted_sums(ratio[m], farm_qtd[m] * my_pvp[m]),
+        })
+    return groups
+
+
+def _sorted_sums(caps, weight):
+    """Tetos ordenados, Σ peso·teto dos k menores e Σ peso dos restantes."""
+    order = np.argsort(caps, kind='stable')
+    caps, weight = caps[order], weight[order]
+    finite = np.where(np.isfinite(caps), caps, 0)
+    below = np.concatenate([[0.0], np.cumsum(weight * finite)])
+    above = np.concatenate([np.cumsum(weight[::-1])[::-1], [0.0]])
+    return caps, below, above
+
+
+def _group_gain(sums, delta, cap):
+    caps, below, above = sums
+    # k = nº de produtos cujo teto fica abaixo do aumento pedido
+    k = np.searchsorted(caps, delta, side='left')
+    capped = below[k] + delta * above[k]
+    return np.where(cap, capped, delta * above[0]), np.where(cap, k, 0)
+
+
+def simulate(prepared, grid):
+    """Avalia todos os cenários da grelha.
+
+    Devolve 'gain' (S,), 'gain_by_position' (S x 3) e 'capped' (S,), o nº de
+    produtos travados pelo PVP de mercado; 'surface' é o ganho remontado
+    em (regras x valores).
+    """
+    value, pct, cap, weights = grid['value'], grid['pct'], grid['cap'], grid['weights']
+    by_position = np.zeros((len(value), 3))
+    capped = np.zeros(len(value), dtype=np.int64)
+    for code, group in enumerate(prepared):
+        # δ em € (abs) ou em fração do meu PVP (pct), já com o peso da Posição
+        delta = weights[:, code] * np.where(pct, value / 100, value)
+        gain_abs, k_abs = _group_gain(group['abs'], delta, cap)
+        gain_pct, k_pct = _group_gain(group['pct'], delta, cap)
+        by_position[:, code] = np.where(pct, gain_pct, gain_abs)
+        capped += np.where(weights[:, code] > 0, np.where(pct, k_pct, k_abs), 0)
+    gain = by_position.sum(axis=1)
+    return {
+        'gain': gain,
+        'gain_by_position': by_position,
+        'capped': capped,
+        'surface': gain.reshape(grid['shape']) if 'shape' in grid else gain,
+    }
+
+
+def breakdown(my_pvp, others_pvp, farm_qtd, position, value, pct=False, weights=(1.0, 1.0, 1.0), cap=True):
+    """Detalhe por produto de um cenário: (novo PVP, aumento unitário, ganho)."""
+    my_pvp = np.asarray(my_pvp, dtype=float)
+    farm_qtd = np.asarray(farm_qtd, dtype=float)
+    w = np.asarray(weights, dtype=float)[np.asarray(position)]
+    increase = w * (my_pvp * value / 100 if pct else value)
+    if cap:
+        increase = np.minimum(increase, _caps(my_pvp, np.asarray(others_pvp, dtype=float)))
+    return my_pvp + increase, increase, increase * farm_qtd
@@ -0,0 +1,104 @@
+"""Tabela detalhada do dashboard: pesquisa, ordenação e paginação no servidor (sem Streamlit).
+
+Só a página visível é formatada e enviada ao browser, pelo que o custo de
+desenho não cresce com o nº de produtos. A cor da Dif Preço vem da faixa já
+calculada no cubo (coluna Diff_Bucket), sem Styler sobre o frame inteiro.
+"""
+import numpy as np
+
+import pricing_engine
+
+# Colunas mostradas (ordem) e respetivos títulos
+DETAIL_COLUMNS = {
+    'Produto': 'Produto',
+    'Farm_Qtd': 'Vendas (Qtd)',
+    'Avg_Unit_Others': 'Venda Média/Rival',
+    'Market_Share_Qty': 'Quota (%)',
+    'My_PVP': 'Meu PVP',
+    'Others_PVP': 'PVP Mercado',
+    'Diff_Percent': 'Dif Preço (%)',
+    'Diff_Bucket': 'Faixa',
+    'Position': 'Posição',
+    'Suggested_Price': 'Preço Sugerido',
+    'Optimal_Gain_Eur': 'Ganho Ótimo (€)',
+    'Opportunity_Eur': 'Oportunidade (€)'
+}
+
+DETAIL_FORMATS = {
+    'Vendas (Qtd)': '{:.0f}',
+    'Venda Média/Rival': '{:.0f}',
+    'Quota (%)': '{:.1f}%',
+    'Meu PVP': '{:.2f}€',
+    'PVP Mercado': '{:.2f}€',
+    'Dif Preço (%)': '{:.1f}%',
+    'Preço Sugerido': '{:.2f}€',
+    'Ganho Ótimo (€)': '{:.2f}€',
+    'Oportunidade (€)': '{:.2f}€'
+}
+
+# Fundo da célula Dif Preço por faixa (mesma escala azul/vermelho dos gráficos)
+BUCKET_CSS = dict(zip(pricing_engine.DIFF_BUCKET_LABELS, [
+    'background-color: #2166ac; color: white',
+    'background-color: #67a9cf; color: black',
+    '',
+    'background-color: #ef8a62; color: black',
+    'background-color: #b2182b; color: white',
+]))
+
+PAGE_SIZES = [25, 50, 100, 250]
+
+
+def search_rows(df, query):
+    """Filtra por texto no Produto (sem maiúsculas/minúsculas) ou prefixo do Cód."""
+    query = query.strip()
+    if not query:
+        return df
+    mask = df['Produto'].astype(str).str.contains(query, case=False, regex=False)
+    mask |= df['Cód'].astype(str).str.startswith(query)
+    return df[mask.to_numpy()]
+
+
+def page_count(n_rows, page_size):
+    return max(1, -(-n_rows // page_size))
+
+
+def detail_page(rows, sort_by='Farm_Qtd', ascending=False, page=1, page_size=50):
+    """Página `page` (1..) de `rows` ordenado por `sort_by`, com títulos de DETAIL_COLUMNS.
+
+    Ordena apenas um vetor de índices; o frame completo nunca é copiado nem
+    formatado.
+    """
+    page = min(max(1, page), page_count(len(rows), page_size))
+    order = np.argsort(rows[sort_by].to_numpy(), kind='stable')
+    if not ascending:
+        order = order[::-1]
+    start = (page - 1) * page_size
+
+    page_df = rows.iloc[order[start:start + page_size]]
+    if 'Suggested_Price' not in page_df.columns:
+        # Coluna derivada: calculada só para a página visível
+        page_df = page_df.assign(Suggested_Price=pricing_engine.suggested_price(page_df))
+    cols = [c for c in DETAIL_COLUMNS if c in page_df.columns]
+    return page_df[cols].rename(columns=DETAIL_COLUMNS)
+
+
+def export_frame(rows):
+    """Frame completo para exportar: Cód + colunas da tabela, por vendas e arredondado como no ecrã."""
+    order = np.argsort(rows['Farm_Qtd'].to_numpy(), kind='stable')[::-1]
+    out = rows.iloc[order]
+    if 'Suggested_Price' not in out.columns:
+        out = out.assign(Suggested_Price=pricing_engine.suggested_price(out))
+    cols = ['Cód'] + [c for c in DETAIL_COLUMNS if c in out.columns]
+    out = out[cols].rename(columns=DETAIL_COLUMNS)
+    # float32 arredondado em float64: sem casas decimais espúrias no CSV/XLSX
+    decimals = {title: int(fmt[3]) for title, fmt in DETAIL_FORMATS.items() if title in out.columns}
+    return out.astype({title: np.float64 for title in decimals}).round(decimals).reset_index(drop=True)
+
+
+def style_page(page_df):
+    """Styler só da página visível: formatos e cor da Dif Preço pela faixa."""
+    styler = page_df.style.format({k: v for k, v in DETAIL_FORMATS.items() if k in page_df.columns})
+    if 'Faixa' in page_df.columns:
+        css = page_df['Faixa'].astype(object).map(BUCKET_CSS).fillna('').to_numpy()
+        styler = styler.apply(lambda _: css, subset=['Dif Preço (%)'])
+    return styler
@@ -0,0 +1,45 @@
+"""Leitura em streaming (excel_reader) com workbooks exportados por outras ferramentas."""
+import io
+import os
+import re
+import sys
+import zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import excel_reader
+
+
+def _stale_dimension_workbook(n_rows):
+    """Workbook com <dimension ref="A1"/> desatualizado, como o de alguns exportadores."""
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['Cód', 'Produto', 'Farmácia Nov/2025', 'Região Nov/2025'])
+    for i in range(n_rows):
+        ws.append([1000 + i, f'PRODUTO {i}', float(i), 2.0 * i])
+    raw = io.BytesIO()
+    wb.save(raw)
+
+    out = io.BytesIO()
+    with zipfile.ZipFile(raw) as src, zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as dst:
+        for item in src.infolist():
+            data = src.read(item.filename)
+            if item.filename == 'xl/worksheets/sheet1.xml':
+                data = re.sub(rb'<dimension ref="[^"]*" ?/>', b'<dimension ref="A1"/>', data)
+            dst.writestr(item, data)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize('columns', [['Cód', 'Farmácia Nov/2025'], [0, 2, 3]])
+def test_stale_dimension_reads_all_rows(columns):
+    data = _stale_dimension_workbook(1000)
+    result = excel_reader.read_columns(data, columns, text_columns=[0], engine='openpyxl')
+
+    assert result['rows'] == 1000
+    assert result['source_header'][:2] == ['Cód', 'Produto']
+    assert result['arrays'][0][-1] == 1999
+    assert result['arrays'][1][-1] == 999.0
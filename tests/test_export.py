@@ -0,0 +1,62 @@
+"""Exportação: o XLSX escrito em streaming lido de volta pelo pd.read_excel."""
+import io
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import export
+
+
+def _frame(n_rows=2500):
+    rng = np.random.default_rng(0)
+    names = ['PRODUTO A', 'Ácido & <Sal>', 'Gel "forte"\x01', 'Çà']
+    notes = np.array(['ok', None, 'x > y'] * n_rows, dtype=object)[:n_rows]
+    pvp = rng.lognormal(2, 0.5, n_rows)
+    pvp[::97] = np.nan
+    return pd.DataFrame({
+        'Cód': np.arange(1_000_000, 1_000_000 + n_rows),
+        'Produto': pd.Categorical.from_codes(rng.integers(0, len(names), n_rows), names),
+        'My_PVP': pvp,
+        'Share': rng.random(n_rows).astype(np.float32),
+        'Vendido': rng.random(n_rows) > 0.5,
+        'Nota': notes,
+    })
+
+
+def test_xlsx_round_trip(monkeypatch):
+    # Blocos pequenos para passar pela fronteira entre blocos
+    monkeypatch.setattr(export, 'XLSX_CHUNK_ROWS', 1000)
+    df = _frame()
+    back = pd.read_excel(io.BytesIO(export.to_bytes(df, 'xlsx')), engine='openpyxl')
+
+    assert list(back.columns) == list(df.columns)
+    assert len(back) == len(df)
+    assert (back['Cód'].to_numpy() == df['Cód'].to_numpy()).all()
+    expected_names = df['Produto'].astype(str).str.replace('\x01', '', regex=False)
+    assert (back['Produto'].to_numpy() == expected_names.to_numpy()).all()
+    np.testing.assert_allclose(back['My_PVP'].to_numpy(), df['My_PVP'].to_numpy(), rtol=1e-15)
+    np.testing.assert_allclose(back['Share'].to_numpy(), df['Share'].to_numpy(dtype=float), rtol=1e-7)
+    assert (back['Vendido'].to_numpy(dtype=int) == df['Vendido'].to_numpy(dtype=int)).all()
+    assert back['Nota'].isna().sum() == df['Nota'].isna().sum()
+    assert (back['Nota'].dropna().to_numpy() == df['Nota'].dropna().to_numpy()).all()
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet'])
+def test_other_formats_round_trip(fmt):
+    df = _frame(50).drop(columns=['Nota'])
+    data = export.to_bytes(df, fmt)
+    back = pd.read_csv(io.BytesIO(data), encoding='utf-8-sig') if fmt == 'csv' else pd.read_parquet(io.BytesIO(data))
+    assert (back['Cód'].to_numpy() == df['Cód'].to_numpy()).all()
+    assert (back['Produto'].astype(str).to_numpy() == df['Produto'].astype(str).to_numpy()).all()
+    np.testing.assert_allclose(back['My_PVP'].to_numpy(), df['My_PVP'].to_numpy())
+
+
+def test_format_from_path():
+    assert export.format_from_path('out/Resultados.XLSX') == 'xlsx'
+    with pytest.raises(ValueError):
+        export.format_from_path('resultados.json')
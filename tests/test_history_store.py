@@ -0,0 +1,38 @@
+"""Histórico SQLite: um dataset guardado e relido mantém os tipos de um upload."""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import history_store
+import pricing_engine
+
+
+def _dataset(cod):
+    n = len(cod)
+    ds = {
+        'ids': pricing_engine.compact_ids(np.array(cod, dtype=object), [f'PRODUTO {c}' for c in cod]),
+        'periods': ['Out/2025', 'Nov/2025'],
+        'default_period': 'Nov/2025',
+    }
+    for i, col in enumerate(('Farm_Val', 'Reg_Val', 'Farm_Qtd', 'Reg_Qtd')):
+        ds[col] = np.arange(2 * n, dtype=float).reshape(n, 2) + i
+    return ds
+
+
+@pytest.mark.parametrize('cod, integer', [
+    ([1002, 1001, 1003], True),
+    ([1002, 'A-7', 1003], False),
+    ([1002, '0071', 1003], False),  # zero à esquerda: o texto não pode virar 71
+])
+def test_load_dataset_restores_cod_dtype(tmp_path, cod, integer):
+    conn = history_store.connect(str(tmp_path / 'historico.db'))
+    history_store.append_dataset(conn, _dataset(cod))
+    loaded = history_store.load_dataset(conn)
+
+    assert (loaded['ids']['Cód'].dtype == np.int64) is integer
+    assert sorted(map(str, loaded['ids']['Cód'])) == sorted(map(str, cod))
+    assert loaded['periods'] == ['Out/2025', 'Nov/2025']
@@ -0,0 +1,56 @@
+"""Otimizador: p* em forma fechada contra uma pesquisa em grelha de preços."""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import optimizer
+
+
+def _curves(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    others_pvp = rng.lognormal(2, 0.5, n)
+    my_pvp = others_pvp * rng.uniform(0.85, 1.15, n)
+    a = rng.uniform(5, 60, n)
+    b = -rng.uniform(0.05, 3.0, n)
+    b[:10] = 0.4            # procura sem inclinação negativa: regra de mercado
+    others_pvp[10:15] = 0   # sem PVP de mercado
+    return a, b, my_pvp, others_pvp
+
+
+def test_optimal_prices_match_grid_search():
+    a, b, my_pvp, others_pvp = _curves()
+    price, qty, gain = optimizer.optimal_prices(a, b, my_pvp, others_pvp)
+
+    usable = (b < 0) & (others_pvp > 0)
+    steps = np.linspace(1 - optimizer.MAX_CHANGE, 1 + optimizer.MAX_CHANGE, 40001)
+    for i in np.flatnonzero(usable):
+        grid = my_pvp[i] * steps
+        revenue = grid * np.maximum(a[i] + b[i] * 100 * (grid / others_pvp[i] - 1), 0)
+        best = revenue.argmax()
+        now = my_pvp[i] * max(a[i] + b[i] * 100 * (my_pvp[i] / others_pvp[i] - 1), 0)
+
+        step = my_pvp[i] * (steps[1] - steps[0])
+        assert abs(price[i] - grid[best]) <= step, i
+        assert price[i] * qty[i] >= revenue[best] - 1e-9
+        np.testing.assert_allclose(gain[i], max(revenue[best] - now, 0), rtol=1e-6, atol=1e-6)
+
+    # Sem curva utilizável: alinhar com o mercado, sem ganho
+    assert (price[~usable] == others_pvp[~usable]).all()
+    assert (gain[~usable] == 0).all()
+
+
+def test_fit_demand_recovers_exact_slopes():
+    rng = np.random.default_rng(1)
+    diff = rng.normal(0, 8, (50, 6))
+    slope = -rng.uniform(0.1, 2.0, 50)
+    qty = 40 + slope[:, None] * diff
+    valid = np.ones(diff.shape, dtype=bool)
+    valid[:5, 2:] = False   # só 2 meses: inclinação da categoria
+
+    a, b, fit = optimizer.fit_demand(diff, qty, valid, np.zeros(50, dtype=np.intp), shrinkage=0.0)
+    np.testing.assert_allclose(b[5:], slope[5:], rtol=1e-9)
+    np.testing.assert_allclose(a[5:], 40, rtol=1e-9)
+    assert (fit[5:] == 2).all() and (fit[:5] == 1).all()
@@ -0,0 +1,106 @@
+"""Motor de engenharia reversa: paridade com a fórmula original e junção por Cód."""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pricing_engine
+
+
+def _base_frame(n_rows=500, seed=0):
+    rng = np.random.default_rng(seed)
+    farm_qtd = rng.gamma(1.5, 8, n_rows).round()
+    farm_qtd[:20] = 0
+    reg_qtd = farm_qtd / rng.uniform(1, 8, n_rows) + rng.uniform(0, 5, n_rows)
+    reg_qtd[20:30] = farm_qtd[20:30] / 6  # só nós vendemos: resto do mercado ~0
+    price = rng.lognormal(2.3, 0.9, n_rows)
+    return pd.DataFrame({
+        'Cód': np.arange(1_000_000, 1_000_000 + n_rows),
+        'Produto': [f'PRODUTO {i}' for i in range(n_rows)],
+        'Farm_Val': farm_qtd * price * rng.normal(1, 0.1, n_rows),
+        'Reg_Val': reg_qtd * price * rng.normal(1, 0.1, n_rows),
+        'Farm_Qtd': farm_qtd,
+        'Reg_Qtd': reg_qtd,
+    })
+
+
+def _baseline(df, n_pharmacies):
+    """Cálculos do app.py original (pandas, uma coluna de cada vez)."""
+    out = pd.DataFrame(index=df.index)
+    total_val_region = df['Reg_Val'] * n_pharmacies
+    total_qty_region = df['Reg_Qtd'] * n_pharmacies
+    others_val = total_val_region - df['Farm_Val']
+    others_qty = total_qty_region - df['Farm_Qtd']
+    out['Avg_Unit_Others'] = (others_qty / max(1, n_pharmacies - 1)).round(0).clip(lower=0)
+    out['Market_Share_Qty'] = np.where(total_qty_region > 0.001, (df['Farm_Qtd'] / total_qty_region) * 100, 0)
+    out['My_PVP'] = np.where(df['Farm_Qtd'] > 0, df['Farm_Val'] / df['Farm_Qtd'], 0)
+    others_qty_safe = others_qty.apply(lambda x: x if x > 0.1 else 0)
+    out['Others_PVP'] = np.where(others_qty_safe > 0, others_val / others_qty_safe, 0)
+    out['Diff_Percent'] = np.where((out['Others_PVP'] > 0) & (out['My_PVP'] > 0),
+                                   ((out['My_PVP'] - out['Others_PVP']) / out['Others_PVP']) * 100, 0)
+    out['Position'] = np.select(
+        [out['Market_Share_Qty'] >= 40, (out['Market_Share_Qty'] >= 15) & (out['Market_Share_Qty'] < 40)],
+        ['Dominante 👑', 'Competitivo ⚔️'], default='Seguidor 🏃')
+    out['Opportunity_Eur'] = np.where(out['My_PVP'] < out['Others_PVP'],
+                                      (out['Others_PVP'] - out['My_PVP']) * df['Farm_Qtd'], 0)
+    return out
+
+
+NUMERIC = ['Avg_Unit_Others', 'Market_Share_Qty', 'My_PVP', 'Others_PVP', 'Diff_Percent', 'Opportunity_Eur']
+
+
+@pytest.mark.parametrize('n_pharmacies', [2, 6, 20])
+def test_metrics_frame_matches_baseline(n_pharmacies):
+    df = _base_frame()
+    expected = _baseline(df, n_pharmacies)
+    result = pricing_engine.metrics_frame(df, n_pharmacies)
+
+    for col in NUMERIC:
+        np.testing.assert_allclose(result[col].to_numpy(), expected[col].to_numpy(), rtol=1e-12, err_msg=col)
+    assert (result['Position'].to_numpy() == expected['Position'].to_numpy()).all()
+
+
+def test_n_cube_matches_baseline_for_every_n():
+    df = _base_frame(seed=1)
+    cube = pricing_engine.build_n_cube(df)
+    for n_pharmacies in cube['n_values']:
+        expected = _baseline(df, int(n_pharmacies))
+        frame = pricing_engine.frame_for_n(df, cube, int(n_pharmacies))
+        for col in NUMERIC:
+            # O cubo guarda float32
+            np.testing.assert_allclose(frame[col].to_numpy(dtype=float), expected[col].to_numpy(),
+                                       rtol=1e-5, atol=1e-3, err_msg=f'{col} N={n_pharmacies}')
+        assert (frame['Position'].astype(object).to_numpy() == expected['Position'].to_numpy()).all()
+
+
+def test_join_reports_duplicates_and_orphans():
+    val_cod = [101, 102, 102, 103, 'Totais', None, 104]
+    uni_cod = [104, 102, 101, 105, 'Totais:']
+    val_rows, uni_rows, report = pricing_engine.join_codes(val_cod, uni_cod)
+
+    # Ordem do ficheiro Valor, 1ª ocorrência dos duplicados, órfãos de fora
+    assert val_rows.tolist() == [0, 1, 6]
+    assert uni_rows.tolist() == [2, 1, 0]
+    assert report['products'] == 3
+    assert report['n_duplicates'] == {'Valor': 1, 'Unidades': 0}
+    assert report['duplicates']['Valor'] == ['102']
+    assert report['n_orphans'] == {'Valor': 1, 'Unidades': 1}
+    assert report['orphans'] == {'Valor': ['103'], 'Unidades': ['105']}
+    assert report['totals'] == {'Valor': 1, 'Unidades': 1}
+    assert report['missing_cod'] == {'Valor': 1, 'Unidades': 0}
+    assert 'duplicados: 1 em Valor' in pricing_engine.join_summary(report)
+
+
+def test_join_strict_rejects_duplicates():
+    with pytest.raises(ValueError, match='102'):
+        pricing_engine.join_codes([101, 102, 102], [101, 102], strict=True)
+    # Sem duplicados, estrito não muda nada (órfãos continuam só a ser reportados)
+    val_rows, uni_rows, report = pricing_engine.join_codes([101, 'A-7', 103], ['A-7', 101], strict=True)
+    assert val_rows.tolist() == [0, 1]
+    assert uni_rows.tolist() == [1, 0]
+    assert report['n_orphans']['Valor'] == 1
+    assert pricing_engine.join_summary(pricing_engine.join_codes([1, 2], [2, 1])[2]) == ''
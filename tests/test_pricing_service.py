@@ -0,0 +1,70 @@
+"""Serviço HTTP: pedidos estritos servidos pelo nível de disco da result_cache."""
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pricing_service
+import result_cache
+
+HEADER = ['Cód', 'Produto', 'Farmácia Nov/2025', 'Farmácia Out/2025', 'Região Nov/2025', 'Região Out/2025']
+
+
+def _workbook(rows):
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append(HEADER)
+    for row in rows:
+        ws.append(row)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def pair_with_duplicate(tmp_path, monkeypatch):
+    """Par de workbooks com um Cód repetido em Valor, já guardado só no disco da cache."""
+    monkeypatch.setattr(result_cache, 'CACHE_DIR', str(tmp_path))
+    val = _workbook([
+        [1001, 'PRODUTO A', 120.0, 100.0, 150.0, 130.0],
+        [1002, 'PRODUTO B', 40.0, 35.0, 60.0, 50.0],
+        [1002, 'PRODUTO B', 40.0, 35.0, 60.0, 50.0],
+    ])
+    uni = _workbook([
+        [1001, 'PRODUTO A', 12, 10, 14, 12],
+        [1002, 'PRODUTO B', 8, 7, 10, 9],
+    ])
+    key = result_cache.content_key(*(pricing_service.hashlib.sha256(b).hexdigest() for b in (val, uni)))
+    result_cache.put(key, *pricing_service.parse_pair(val, uni, key))
+    result_cache.clear()
+    yield val, uni
+    result_cache.clear()
+
+
+def _multipart(val, uni):
+    boundary = 'limite'
+    body = b''.join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{name}.xlsx"\r\n\r\n'.encode()
+        + data + b'\r\n'
+        for name, data in (('valor', val), ('unidades', uni))
+    ) + f'--{boundary}--\r\n'.encode()
+    return f'multipart/form-data; boundary={boundary}', body
+
+
+def test_strict_request_after_disk_hit(pair_with_duplicate):
+    content_type, body = _multipart(*pair_with_duplicate)
+    disk_hits = result_cache.stats()['disk_hits']
+
+    with pytest.raises(pricing_service.ServiceError) as error:
+        pricing_service.handle_pvp({'estrito': ['1'], 'formato': ['csv']}, content_type, body)
+    assert error.value.status == 400
+    assert result_cache.stats()['disk_hits'] == disk_hits + 1
+
+    data, _, headers = pricing_service.handle_pvp({'formato': ['csv']}, content_type, body)
+    assert headers['X-Linhas'] == '2'
+    assert 'Cód'.encode() in data.splitlines()[0]
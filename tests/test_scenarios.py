@@ -0,0 +1,62 @@
+"""Simulador de cenários: a versão vetorizada contra um ciclo por cenário e produto."""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scenarios
+
+
+def _products(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    my_pvp = rng.lognormal(2, 0.6, n)
+    others_pvp = my_pvp * rng.normal(1.02, 0.08, n)
+    my_pvp[:10] = 0          # sem vendas próprias
+    others_pvp[10:25] = 0    # sem PVP de mercado: sem teto
+    farm_qtd = rng.gamma(1.5, 8, n).round()
+    position = rng.integers(0, 3, n)
+    return my_pvp, others_pvp, farm_qtd, position
+
+
+def _brute_force(my_pvp, others_pvp, farm_qtd, position, value, pct, weights, cap):
+    gain = np.zeros(3)
+    capped = 0
+    for p, o, q, pos in zip(my_pvp, others_pvp, farm_qtd, position):
+        increase = weights[pos] * (p * value / 100 if pct else value)
+        if cap:
+            limit = max(o - p, 0) if o > 0 else np.inf
+            if weights[pos] > 0 and limit < increase:
+                capped += 1
+            increase = min(increase, limit)
+        gain[pos] += q * increase
+    return gain, capped
+
+
+@pytest.mark.parametrize('kind', ['abs', 'pct'])
+@pytest.mark.parametrize('cap', [True, False])
+def test_simulate_matches_brute_force(kind, cap):
+    products = _products()
+    values = [0.0, 0.05, 0.3, 1.0, 2.5] if kind == 'abs' else [0.0, 1.0, 3.0, 7.5, 15.0]
+    grid = scenarios.scenario_grid(values, kind=kind, cap=cap)
+    result = scenarios.simulate(scenarios.prepare(*products), grid)
+
+    for s in range(len(grid['value'])):
+        gain, capped = _brute_force(*products, grid['value'][s], kind == 'pct', grid['weights'][s], cap)
+        np.testing.assert_allclose(result['gain_by_position'][s], gain, rtol=1e-9, atol=1e-9)
+        assert result['capped'][s] == capped
+    assert result['surface'].shape == (len(scenarios.POSITION_RULES), len(values))
+    np.testing.assert_allclose(result['surface'].ravel(), result['gain'])
+
+
+def test_breakdown_matches_simulate():
+    products = _products(seed=1)
+    weights = scenarios.POSITION_RULES['Dominante + metade Competitivo']
+    _, increase, gain = scenarios.breakdown(*products, 4.0, pct=True, weights=weights)
+    grid = scenarios.scenario_grid([4.0], kind='pct', rules=['Dominante + metade Competitivo'])
+    result = scenarios.simulate(scenarios.prepare(*products), grid)
+
+    assert (increase >= 0).all()
+    np.testing.assert_allclose(gain.sum(), result['gain'][0], rtol=1e-9)